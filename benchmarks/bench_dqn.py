@@ -0,0 +1,219 @@
+# bench_dqn.py
+
+import argparse
+import json
+import logging
+import os
+import platform
+import sys
+import tempfile
+import time
+import numpy as np
+import torch
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dqn.dueling_dqn import (DQNAgent, PrioritizedReplayBuffer, DevicePrioritizedReplayBuffer,  # noqa: E402
+                             CompressedPrioritizedReplayBuffer, BIG_BATCH_SIZE, device)
+
+SECTIONS = ('replay', 'act', 'train', 'checkpoint')
+# torch.profiler ranges that `DQNAgent.train_step` labels its phases with
+TRAIN_PHASE_PREFIX = 'train_step.'
+# A result regresses when it is worse than the baseline by more than this fraction
+DEFAULT_THRESHOLD = 0.15
+
+
+class Results:
+    """Named measurements with their unit and direction, serialized as JSON."""
+
+    def __init__(self):
+        self.metrics = {}
+
+    def add(self, name, value, unit, higher_is_better=False):
+        self.metrics[name] = {'value': float(value), 'unit': unit, 'higher_is_better': higher_is_better}
+        print(f"{name:<44} {value:>12.3f} {unit}")
+
+    def to_json(self):
+        return {
+            'torch': torch.__version__,
+            'device': str(device),
+            'threads': torch.get_num_threads(),
+            'machine': platform.machine(),
+            'metrics': self.metrics,
+        }
+
+
+def median_ms(fn, repeats, warmup=1):
+    """Median wall time of `fn()` in milliseconds."""
+    for _ in range(warmup):
+        fn()
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        if device.type == 'cuda':
+            torch.cuda.synchronize()
+        times.append(time.perf_counter() - start)
+    return float(np.median(times)) * 1000
+
+
+def bench_replay(results, capacities, state_size, batch_size, repeats):
+    """add/sample/update throughput of the SumTree, device and compressed replay buffers."""
+    states = [torch.randn(3, state_size, state_size) for _ in range(64)]
+    for capacity in capacities:
+        for name, make in (('sumtree', lambda: PrioritizedReplayBuffer(capacity)),
+                           ('device', lambda: DevicePrioritizedReplayBuffer(capacity)),
+                           ('compressed', lambda: CompressedPrioritizedReplayBuffer(capacity))):
+            buffer = make()
+            prefix = f"replay.{name}.{capacity}"
+            start = time.perf_counter()
+            for i in range(capacity):
+                buffer.add(buffer.max_priority, (states[i % 64], i % 3, 0.0, states[(i + 1) % 64], 0))
+            results.add(f"{prefix}.add_per_sec", capacity / (time.perf_counter() - start), 'adds/s', True)
+
+            results.add(f"{prefix}.sample_ms", median_ms(lambda: buffer.sample_tensors(batch_size, 0.4), repeats),
+                        'ms')
+            idxs = buffer.sample_tensors(batch_size, 0.4)[6]
+            if buffer.priorities_on_device:
+                errors = torch.rand(batch_size, device=buffer.device)
+            else:
+                errors = np.random.rand(batch_size)
+            results.add(f"{prefix}.update_ms", median_ms(lambda: buffer.update(idxs, errors), repeats), 'ms')
+            del buffer
+
+
+def make_agent(folder, replay_size):
+    agent = DQNAgent(3, 3, os.path.join(folder, 'model.pth'), folder, replay_size=replay_size, restore_replay=False,
+                     start_training=False)
+    agent.replay_restored.set()
+    # Checkpoints and replay snapshots are timed on their own
+    agent.checkpoint_interval = 10 ** 9
+    agent.replay_save_interval = 0
+    # Benchmarks choose their batch sizes
+    agent.batch_sizer = None
+    return agent
+
+
+def bench_act(results, agent, repeats):
+    """Greedy `choose_action` latency at batch 1."""
+    state = torch.randn(3, 128, 128)
+    mask = [1, 1, 1]
+
+    def act():
+        agent.epsilon = 0.0
+        agent.choose_action(state, mask)
+
+    results.add('act.choose_action_ms', median_ms(act, repeats, warmup=3), 'ms')
+
+
+def profile_train_phases(agent, batches):
+    """
+    Run `train_step` on each batch under torch.profiler and return the mean time of each labelled phase in
+    milliseconds (device time on CUDA, CPU time otherwise).
+    """
+    activities = [torch.profiler.ProfilerActivity.CPU]
+    if device.type == 'cuda':
+        activities.append(torch.profiler.ProfilerActivity.CUDA)
+    with torch.profiler.profile(activities=activities) as session:
+        for batch in batches:
+            agent.train_step(batch)
+    phases = {}
+    for event in session.key_averages():
+        if event.key.startswith(TRAIN_PHASE_PREFIX):
+            total_us = event.device_time_total if device.type == 'cuda' else event.cpu_time_total
+            phases[event.key[len(TRAIN_PHASE_PREFIX):]] = total_us / len(batches) / 1000
+    return phases
+
+
+def bench_train(results, agent, batch_size, repeats):
+    """`sample_batch` and `train_step` wall time, and the train step split into its profiled phases."""
+    for i in range(max(batch_size * 2, 256)):
+        agent.store_transition(torch.randn(3, 128, 128), i % 3, 0.0, torch.randn(3, 128, 128), 0)
+    results.add('train.sample_batch_ms', median_ms(lambda: agent.sample_batch(batch_size), repeats), 'ms')
+    results.add('train.train_step_ms', median_ms(lambda: agent.train_step(agent.sample_batch(batch_size)), repeats),
+                'ms')
+    phases = profile_train_phases(agent, [agent.sample_batch(batch_size) for _ in range(repeats)])
+    for phase, ms in phases.items():
+        results.add(f"train.{phase}_ms", ms, 'ms')
+
+
+def bench_checkpoint(results, agent, repeats):
+    """Checkpoint save, full restore and weights-only load."""
+    results.add('checkpoint.save_ms', median_ms(agent.save_checkpoint, repeats), 'ms')
+    entry = agent.checkpoints.latest()
+    results.add('checkpoint.restore_ms', median_ms(lambda: agent.restore_checkpoint(entry), repeats), 'ms')
+    results.add('checkpoint.load_weights_ms',
+                median_ms(lambda: agent.eval_net.load_state_dict(agent.checkpoints.load_weights(entry)), repeats),
+                'ms')
+
+
+def compare(metrics, baseline, threshold):
+    """Print the change of every metric against a baseline and return the names of regressed ones."""
+    regressions = []
+    print(f"\n{'metric':<44} {'baseline':>12} {'current':>12} {'change':>9}")
+    for name, current in metrics.items():
+        previous = baseline['metrics'].get(name)
+        if previous is None or previous['value'] == 0:
+            continue
+        change = current['value'] / previous['value'] - 1
+        worse = -change if current['higher_is_better'] else change
+        flag = '  REGRESSION' if worse > threshold else ''
+        print(f"{name:<44} {previous['value']:>12.3f} {current['value']:>12.3f} {change:>+8.1%}{flag}")
+        if flag:
+            regressions.append(name)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Microbenchmarks for dqn/dueling_dqn.py.")
+    parser.add_argument('--sections', default=','.join(SECTIONS), help=f"Comma-separated subset of {SECTIONS}.")
+    parser.add_argument('--capacities', default='1000,10000', help="Replay buffer capacities to benchmark.")
+    parser.add_argument('--state-size', type=int, default=32,
+                        help="Frame size of the replay benchmarks (128 matches the game; needs far more memory).")
+    parser.add_argument('--batch-size', type=int, default=BIG_BATCH_SIZE)
+    parser.add_argument('--repeats', type=int, default=20, help="Repeats of the fast benchmarks.")
+    parser.add_argument('--train-repeats', type=int, default=5, help="Repeats of the train and checkpoint benchmarks.")
+    parser.add_argument('--output', help="Write the results as JSON to this file (e.g. to use it as a baseline).")
+    parser.add_argument('--baseline', help="JSON results to compare against.")
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help="Fraction by which a metric may get worse than the baseline before failing.")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+    sections = args.sections.split(',')
+    torch.manual_seed(0)
+    np.random.seed(0)
+
+    results = Results()
+    print(f"dqn benchmarks on {device}, {torch.get_num_threads()} threads")
+    if 'replay' in sections:
+        bench_replay(results, [int(c) for c in args.capacities.split(',')], args.state_size, args.batch_size,
+                     args.repeats)
+    if any(section in sections for section in ('act', 'train', 'checkpoint')):
+        with tempfile.TemporaryDirectory() as folder:
+            agent = make_agent(folder, max(args.batch_size * 2, 256))
+            try:
+                if 'act' in sections:
+                    bench_act(results, agent, args.repeats)
+                if 'train' in sections:
+                    bench_train(results, agent, args.batch_size, args.train_repeats)
+                if 'checkpoint' in sections:
+                    bench_checkpoint(results, agent, args.train_repeats)
+            finally:
+                agent.close_metrics()
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results.to_json(), f, indent=1)
+        print(f"Results written to {args.output}")
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results.metrics, baseline, args.threshold)
+        if regressions:
+            print(f"{len(regressions)} metric(s) regressed by more than {args.threshold:.0%}")
+            sys.exit(1)
+        print(f"No regressions beyond {args.threshold:.0%}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+# bench_frame_store.py
+
+import argparse
+import os
+import sys
+import time
+import numpy as np
+import torch
+import torch.nn.functional as F
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dqn.dueling_dqn import DevicePrioritizedReplayBuffer, CompressedPrioritizedReplayBuffer  # noqa: E402
+from dqn.frame_store import lz4_frame, decode_states  # noqa: E402
+
+
+def synthetic_frames(count, size=128, seed=0):
+    """
+    Game-like uint8 frames [N, 3, size, size]: a smooth background that pans slowly and a few
+    moving sprites, so consecutive frames are similar as in a real capture.
+    """
+    rng = np.random.default_rng(seed)
+    background = torch.from_numpy(rng.uniform(0, 255, (1, 3, 12, 12)).astype(np.float32))
+    background = F.interpolate(background, size=(2 * size, 2 * size), mode='bilinear', align_corners=False)[0]
+    sprites = [(rng.integers(0, size - 16, 2), rng.integers(-3, 4, 2), rng.uniform(0, 255, 3)) for _ in range(4)]
+    frames = np.empty((count, 3, size, size), dtype=np.uint8)
+    for i in range(count):
+        offset = (i // 4) % size
+        frame = background[:, offset:offset + size, offset // 2:offset // 2 + size].clone()
+        for position, velocity, color in sprites:
+            y, x = (position + velocity * i) % (size - 16)
+            frame[:, y:y + 16, x:x + 16] = torch.from_numpy(color.astype(np.float32)).view(3, 1, 1)
+        frames[i] = frame.round().clamp(0, 255).to(torch.uint8).numpy()
+    return frames
+
+
+def session_frames(folder, count):
+    """Uint8 frames [N, 3, 128, 128] resized from a recording made by TrajectoryRecorder."""
+    from dqn.offline import preprocess_frames
+    from recording.trajectory_reader import TrajectoryReader
+    from dqn.frame_store import encode_state
+    reader = TrajectoryReader(folder)
+    frames = []
+    for episode in reader.episodes():
+        for chunk in reader.iter_episode_chunks(episode, ['game_window']):
+            frames.extend(encode_state(state) for state in preprocess_frames(chunk['game_window']))
+            if len(frames) >= count:
+                return np.stack(frames[:count])
+    return np.stack(frames)
+
+
+def fill(buffer, frames):
+    """Store consecutive frames as transitions; each next state is reused as the following state."""
+    states = decode_states(frames, 'cpu').unbind(0)
+    for i in range(len(frames) - 1):
+        buffer.add(1.0, (states[i], i % 3, 0.0, states[i + 1], 0))
+
+
+def buffer_bytes(buffer):
+    per_slot = sum(t.nbytes for t in (buffer.priorities, buffer.actions, buffer.rewards, buffer.dones))
+    if isinstance(buffer, CompressedPrioritizedReplayBuffer):
+        return buffer.memory_bytes() + per_slot + buffer.state_ids.nbytes + buffer.next_state_ids.nbytes
+    return per_slot + buffer.states.nbytes + buffer.next_states.nbytes
+
+
+def measure(name, buffer, frames, batch_size, repeats):
+    start = time.perf_counter()
+    fill(buffer, frames)
+    store_us = (time.perf_counter() - start) / len(buffer) * 1e6
+    latencies = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        buffer.sample_tensors(batch_size, 0.4)
+        latencies.append(time.perf_counter() - start)
+    latencies = np.array(latencies) * 1000
+    per_transition = buffer_bytes(buffer) / len(buffer)
+    print(f"{name:<22} {per_transition / 1024:>10.1f} KB {store_us:>10.0f} us "
+          f"{np.percentile(latencies, 50):>10.2f} ms {np.percentile(latencies, 95):>10.2f} ms")
+    return per_transition
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay memory per transition and sample latency by frame store.")
+    parser.add_argument('--session', help="Recording folder to take frames from instead of synthetic frames.")
+    parser.add_argument('--transitions', type=int, default=2000)
+    parser.add_argument('--batch-size', type=int, default=128)
+    parser.add_argument('--repeats', type=int, default=50)
+    args = parser.parse_args()
+
+    frames = session_frames(args.session, args.transitions + 1) if args.session else \
+        synthetic_frames(args.transitions + 1)
+    capacity = len(frames) - 1
+    configs = [
+        ('float32 (device)', lambda: DevicePrioritizedReplayBuffer(capacity, storage_device='cpu')),
+        ('uint8', lambda: CompressedPrioritizedReplayBuffer(capacity, codec='none', keyframe_interval=0)),
+        ('zlib', lambda: CompressedPrioritizedReplayBuffer(capacity, codec='zlib', keyframe_interval=0)),
+        ('zlib + delta/8', lambda: CompressedPrioritizedReplayBuffer(capacity, codec='zlib', keyframe_interval=8)),
+    ]
+    if lz4_frame is not None:
+        configs += [
+            ('lz4', lambda: CompressedPrioritizedReplayBuffer(capacity, codec='lz4', keyframe_interval=0)),
+            ('lz4 + delta/8', lambda: CompressedPrioritizedReplayBuffer(capacity, codec='lz4', keyframe_interval=8)),
+        ]
+
+    print(f"{capacity} transitions of {tuple(frames.shape[1:])} frames, batch size {args.batch_size}")
+    print(f"{'store':<22} {'per transition':>13} {'store':>13} {'sample p50':>13} {'sample p95':>13}")
+    baseline = None
+    for name, make in configs:
+        torch.manual_seed(0)
+        per_transition = measure(name, make(), frames, args.batch_size, args.repeats)
+        baseline = baseline or per_transition
+        if per_transition != baseline:
+            print(f"{'':<22} {baseline / per_transition:>10.1f}x smaller than float32")
+
+
+if __name__ == '__main__':
+    main()
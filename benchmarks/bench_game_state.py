@@ -0,0 +1,92 @@
+# bench_game_state.py
+
+import copy
+import os
+import sys
+import time
+import tracemalloc
+import torch
+from torch.utils._pytree import tree_flatten
+from torch.utils._python_dispatch import TorchDispatchMode
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from game_state import GameState  # noqa: E402
+
+
+class LegacyGameState:
+    """The deepcopy/clone implementation GameState replaced, kept for comparison."""
+
+    def __init__(self, features, state):
+        self.current_features = features
+        self.next_features = copy.deepcopy(features)
+        self.current_state = state
+        self.next_state = state.clone()
+
+    def update(self, features, state):
+        self.current_features = copy.deepcopy(self.next_features)
+        self.next_features = copy.deepcopy(features)
+        self.current_state = self.next_state.clone()
+        self.next_state = state.clone()
+
+
+def make_inputs(steps, device):
+    features = [{'self_hp': 50.0 - i % 50, 'boss_hp': 100.0 - i % 100, 'self_posture': 1.0 * i % 7,
+                 'boss_posture': 2.0 * i % 11} for i in range(steps)]
+    states = [torch.randn(3, 128, 128, device=device) for _ in range(8)]
+    return features, states
+
+
+class TensorAllocationCounter(TorchDispatchMode):
+    """Count tensors (and their bytes) produced by torch ops while active."""
+
+    def __init__(self):
+        super().__init__()
+        self.tensors = 0
+        self.bytes = 0
+
+    def __torch_dispatch__(self, func, types, args=(), kwargs=None):
+        out = func(*args, **(kwargs or {}))
+        for t in tree_flatten(out)[0]:
+            if isinstance(t, torch.Tensor):
+                self.tensors += 1
+                self.bytes += t.nbytes
+        return out
+
+
+def run(cls, features, states):
+    """Return (seconds per update, tensors allocated per update, tensor bytes per update, python peak bytes)."""
+    steps = len(features)
+    state_obj = cls(features[0], states[0])
+    with TensorAllocationCounter() as counter:
+        for i in range(1, steps):
+            state_obj.update(features[i], states[i % len(states)])
+
+    state_obj = cls(features[0], states[0])
+    tracemalloc.start()
+    for i in range(1, steps):
+        state_obj.update(features[i], states[i % len(states)])
+    python_peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    start = time.perf_counter()
+    for i in range(1, steps):
+        state_obj.update(features[i], states[i % len(states)])
+    if states[0].is_cuda:
+        torch.cuda.synchronize()
+    elapsed = (time.perf_counter() - start) / (steps - 1)
+    return elapsed, counter.tensors / (steps - 1), counter.bytes / (steps - 1), python_peak
+
+
+def main(steps=5000):
+    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    features, states = make_inputs(steps, device)
+    print(f"GameState.update over {steps} steps on {device} (3x128x128 float32 states)")
+    print(f"{'implementation':<16}{'us/step':>10}{'tensors/step':>14}{'tensor KB/step':>16}{'py peak KB':>12}")
+    for name, cls in (('legacy', LegacyGameState), ('ring', GameState)):
+        elapsed, tensors, tensor_bytes, python_peak = run(cls, features, states)
+        print(f"{name:<16}{elapsed * 1e6:>10.2f}{tensors:>14.2f}{tensor_bytes / 1024:>16.1f}{python_peak / 1024:>12.1f}")
+
+
+if __name__ == '__main__':
+    main()
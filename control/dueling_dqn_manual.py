@@ -1,108 +1,120 @@
-import time
-from pynput.mouse import Listener as MouseListener
-from pynput.keyboard import Listener as KeyboardListener, Key
+import logging
 import threading
-
-# Global variables to store the result of mouse and keyboard inputs
-mouse_result = 0
-keyboard_result = 0
-
-# Track the last mouse click and key press times
-last_click_time = 0
-last_keypress_time = 0
-debounce_time = 0.08  # Set debounce time to 0.08 seconds
-
-
-def on_click(x, y, button, pressed):
-    global mouse_result, last_click_time
-    if pressed:  # Only execute logic when the mouse is pressed
-        current_time = time.time()
-        # Execute if the time since the last click exceeds the debounce time
-        if current_time - last_click_time > debounce_time:
-            last_click_time = current_time  # Update last click time
-            if button == button.left:
-                mouse_result = 1  # Attack action
-                print("Mouse Left Click - Attack, mouse_result:", mouse_result)
-            elif button == button.right:
-                mouse_result = 0  # Defense action
-                print("Mouse Right Click - Defense, mouse_result:", mouse_result)
-    return None
-
-
-def on_press(key):
-    global keyboard_result, last_keypress_time
-    current_time = time.time()
-    if current_time - last_keypress_time > debounce_time:
-        last_keypress_time = current_time
-        try:
-            if hasattr(key, 'char') and key.char:
-                print(f"Key pressed: {key.char}")
-                keyboard_result = handle_key_action(key.char)  # Return the corresponding key action
-                print(f"Action mapped for '{key.char}': keyboard_result:", keyboard_result)
-        except AttributeError:
-            print(f'Special Key {key} pressed')
-
-
-# Keyboard release event handler
-def on_release(key):
-    if key == Key.esc:
-        return False  # Stop the listener
-    return True
-
-
-# Tool management and action handling
-tool_index = 1
-tool_result = 3
-
-
-def handle_key_action(key_char):
-    global tool_index
-    global tool_result
-
-    action_mapping = {
-        'e': (2, "tiptoe"),
-    }
-
-    if key_char == 'z':  # Tool switch
-        tool_index += 1
-        if tool_index > 3:
-            tool_index = 1
-        tool_result = 3 + tool_index
-        print(f"Change to the game tool {tool_index}")
-
-    elif key_char == '3':  # Use the tool
-        tool_result = 3 + tool_index
-        print(f"Use the game tool {tool_index}, return {tool_result}")
-        return tool_result
-
-    elif key_char in action_mapping:
-        result, action = action_mapping[key_char]
-        return result
-
-
-# Start mouse and keyboard listeners
-def start_listeners():
-    # Start mouse and keyboard listeners in threads to prevent blocking the main process
-    mouse_listener = MouseListener(on_click=on_click)
-    keyboard_listener = KeyboardListener(on_press=on_press, on_release=on_release)
-
-    # Set as daemon threads, so they automatically exit when the main process ends
-    mouse_listener_thread = threading.Thread(target=mouse_listener.start, daemon=True)
-    keyboard_listener_thread = threading.Thread(target=keyboard_listener.start, daemon=True)
-
-    # Start the listener threads
-    mouse_listener_thread.start()
-    keyboard_listener_thread.start()
-
-    # Return the thread objects so the main program can continue running other tasks
-    return mouse_listener_thread, keyboard_listener_thread
+import time
+from control.tool_manager import BASE_ACTIONS
+
+try:
+    from pynput.mouse import Listener as MouseListener, Button
+    from pynput.keyboard import Listener as KeyboardListener
+except ImportError:
+    MouseListener = KeyboardListener = Button = None
+
+logger = logging.getLogger(__name__)
+
+# Presses of the same device closer together than this are ignored
+DEBOUNCE_TIME = 0.08
+# Keys mapped directly to actions
+KEY_ACTIONS = {'e': 2}  # tiptoe
+NUM_TOOLS = 3
+
+
+class ManualInput:
+    """
+    Human mouse and keyboard input turned into timestamped agent actions.
+
+    The pynput listeners push each mapped input as an (action, time) event; the control loop
+    calls `take_action` once per step to get the latest action since the previous step, with the
+    time it was pressed, so demonstrations can be aligned to the captured frames. Left click is
+    attack, right click is defense, 'e' is tiptoe, 'z' cycles the prosthetic tool and '3' uses it
+    (action BASE_ACTIONS + tool index), if tool actions are part of the `action_space_size` actions.
+    """
+
+    def __init__(self, action_space_size=BASE_ACTIONS, debounce_time=DEBOUNCE_TIME):
+        self.action_space_size = action_space_size
+        self.debounce_time = debounce_time
+        self.lock = threading.Lock()
+        self.input_event = threading.Event()
+        self.pending = None
+        self.last_click_time = 0.0
+        self.last_keypress_time = 0.0
+        self.tool_index = 0
+        self.dropped_inputs = 0
+        self.listeners = []
+
+    def push(self, action, timestamp=None):
+        """Queue an action performed by the player at `timestamp` (default: now)."""
+        with self.lock:
+            if self.pending is not None:
+                # More than one input within a control step; only the latest becomes the step's action
+                self.dropped_inputs += 1
+            self.pending = (action, time.time() if timestamp is None else timestamp)
+        self.input_event.set()
+
+    def take_action(self):
+        """Return (action, time pressed) of the latest input since the last call, or (None, None)."""
+        with self.lock:
+            pending, self.pending = self.pending, None
+            self.input_event.clear()
+        return pending if pending is not None else (None, None)
+
+    def wait(self, timeout=None):
+        """Block until an input is pending; returns False on timeout."""
+        return self.input_event.wait(timeout)
+
+    def on_click(self, x, y, button, pressed):
+        if not pressed:
+            return
+        now = time.time()
+        if now - self.last_click_time <= self.debounce_time:
+            return
+        self.last_click_time = now
+        if button == Button.left:
+            self.push(1, now)  # Attack action
+        elif button == Button.right:
+            self.push(0, now)  # Defense action
+
+    def on_press(self, key):
+        now = time.time()
+        if now - self.last_keypress_time <= self.debounce_time:
+            return
+        self.last_keypress_time = now
+        char = getattr(key, 'char', None)
+        if not char:
+            return
+        if char == 'z':  # Tool switch
+            self.tool_index = (self.tool_index + 1) % NUM_TOOLS
+            logger.info("Changed to game tool %d", self.tool_index + 1)
+        elif char == '3' and BASE_ACTIONS + self.tool_index < self.action_space_size:  # Use the tool
+            self.push(BASE_ACTIONS + self.tool_index, now)
+        elif char in KEY_ACTIONS:
+            self.push(KEY_ACTIONS[char], now)
+
+    def start(self):
+        """Start the mouse and keyboard listeners on their own daemon threads."""
+        if MouseListener is None:
+            raise RuntimeError("Manual mode needs the pynput package")
+        self.listeners = [MouseListener(on_click=self.on_click), KeyboardListener(on_press=self.on_press)]
+        for listener in self.listeners:
+            listener.daemon = True
+            listener.start()
+
+    def stop(self):
+        for listener in self.listeners:
+            listener.stop()
+        self.listeners = []
+        if self.dropped_inputs:
+            logger.info("Manual input: %d inputs superseded within a control step", self.dropped_inputs)
 
 
 if __name__ == "__main__":
-    mouse_thread, keyboard_thread = start_listeners()
+    logging.basicConfig(level=logging.INFO)
+    manual_input = ManualInput()
+    manual_input.start()
     try:
         while True:
-            time.sleep(1)
+            if manual_input.wait(1.0):
+                action, pressed_at = manual_input.take_action()
+                print(f"Action {action} pressed at {pressed_at:.3f}")
     except KeyboardInterrupt:
+        manual_input.stop()
         print("Exiting program.")
-
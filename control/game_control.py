@@ -1,8 +1,11 @@
 import time
 import pygetwindow as gw
 from keys import input_keys
+from control.tool_manager import BASE_ACTIONS
+from monitoring.tracing import traced
 
 
+@traced('control.take_action')
 def take_action(action_index, debugged, tool_manager):
     if not debugged:
         if action_index == 0:
@@ -11,13 +14,8 @@ def take_action(action_index, debugged, tool_manager):
             input_keys.attack()
         elif action_index == 2:
             input_keys.tiptoe()
-
-
-def wait_before_start(seconds, paused):
-    action = "stopping" if paused else "starting"
-    print(f"Waiting for {seconds} seconds before {action}...")
-    time.sleep(seconds)
-    print("Game paused." if paused else "Game started.")
+        elif action_index >= BASE_ACTIONS and tool_manager is not None:
+            tool_manager.use_specific_tool(action_index - BASE_ACTIONS)
 
 
 def focus_game_window():
@@ -31,7 +29,8 @@ def focus_game_window():
 
 def restart(env, defeated):
     def reset_actions_and_pause():
-        pause_game(True)
+        env.pause_switch.pause()
+        pause_game(env.pause_switch)
 
     def restart_sequence():
         print("-------------------------Waiting for 8 seconds to restart the game-------------------------")
@@ -52,16 +51,6 @@ def restart(env, defeated):
         reset_actions_and_pause()
 
 
-def pause_game(paused):
-    while True:
-        keys = input_keys.key_check()
-        if 'P' in keys:
-            paused = not paused
-            print('Game paused' if paused else 'Game started')
-            wait_before_start(3, paused)
-        if paused:
-            time.sleep(1)
-        else:
-            break
-
-    return paused
+def pause_game(pause_switch):
+    """Block while the game is paused; the pause hotkey flips `pause_switch` from its listener thread."""
+    pause_switch.wait()
@@ -0,0 +1,127 @@
+import logging
+import sys
+import threading
+
+try:
+    from pynput.keyboard import Listener as KeyboardListener
+except ImportError:
+    KeyboardListener = None
+
+logger = logging.getLogger(__name__)
+
+# Seconds between pressing the pause key and the game loop resuming, to switch to the game window
+RESUME_DELAY = 3.0
+
+
+class PauseSwitch:
+    """
+    Pause state shared between the hotkey listener and the control loop.
+
+    The loop only checks an Event: `wait` returns at once while running and wakes as soon as the
+    game is resumed, instead of polling the keyboard and sleeping in one-second steps.
+    """
+
+    def __init__(self, paused=True, resume_delay=RESUME_DELAY):
+        self.running = threading.Event()
+        self.resume_delay = resume_delay
+        self.resume_timer = None
+        self.lock = threading.Lock()
+        if not paused:
+            self.running.set()
+
+    @property
+    def paused(self):
+        return not self.running.is_set()
+
+    def pause(self):
+        with self.lock:
+            if self.resume_timer is not None:
+                self.resume_timer.cancel()
+                self.resume_timer = None
+            self.running.clear()
+
+    def resume(self, delay=None):
+        """Resume after `delay` seconds (default `resume_delay`)."""
+        delay = self.resume_delay if delay is None else delay
+        with self.lock:
+            if self.resume_timer is not None:
+                self.resume_timer.cancel()
+            if delay <= 0:
+                self.resume_timer = None
+                self.running.set()
+                return
+            self.resume_timer = threading.Timer(delay, self.running.set)
+            self.resume_timer.daemon = True
+            self.resume_timer.start()
+
+    def toggle(self):
+        """Pause a running (or resuming) game, or resume a paused one."""
+        if self.running.is_set() or self.resume_timer is not None:
+            self.pause()
+            logger.info("Game paused")
+        else:
+            logger.info("Game starting in %.0f seconds...", self.resume_delay)
+            self.resume()
+
+    def wait(self, timeout=None):
+        """Block while paused; returns True once running (False on timeout)."""
+        return self.running.is_set() or self.running.wait(timeout)
+
+
+class HotkeyService:
+    """
+    Global hotkeys handled on a listener thread.
+
+    With pynput (Windows), key presses call the bound callbacks from the pynput listener. The
+    'stdin' backend is a stub for systems without a global keyboard hook (e.g. Linux servers):
+    every character of a line typed on stdin counts as a key press.
+    """
+
+    def __init__(self, backend=None):
+        if backend is None:
+            backend = 'pynput' if KeyboardListener is not None and sys.platform == 'win32' else 'stdin'
+        if backend == 'pynput' and KeyboardListener is None:
+            raise ValueError("The pynput hotkey backend needs the pynput package")
+        if backend not in ('pynput', 'stdin'):
+            raise ValueError(f"Unknown hotkey backend: {backend}")
+        self.backend = backend
+        self.bindings = {}
+        self.listener = None
+
+    def bind(self, key, callback):
+        """Call `callback()` whenever the character `key` is pressed (case-insensitive)."""
+        self.bindings[key.lower()] = callback
+
+    def press(self, key):
+        """Dispatch a key press to its binding, if any."""
+        callback = self.bindings.get(key.lower())
+        if callback is not None:
+            try:
+                callback()
+            except Exception:
+                logger.exception("Hotkey '%s' callback failed", key)
+
+    def _on_press(self, key):
+        char = getattr(key, 'char', None)
+        if char:
+            self.press(char)
+
+    def _read_stdin(self):
+        for line in sys.stdin:
+            for char in line.strip():
+                self.press(char)
+
+    def start(self):
+        if self.backend == 'pynput':
+            self.listener = KeyboardListener(on_press=self._on_press)
+            self.listener.daemon = True
+            self.listener.start()
+        else:
+            self.listener = threading.Thread(target=self._read_stdin, name='hotkeys-stdin', daemon=True)
+            self.listener.start()
+            logger.info("No global keyboard hook; type hotkeys (%s) followed by Enter", ', '.join(self.bindings))
+
+    def stop(self):
+        if self.backend == 'pynput' and self.listener is not None:
+            self.listener.stop()
+        self.listener = None
@@ -1,60 +1,121 @@
+import logging
 import time
+import numpy as np
 from keys.input_keys import perform_action
+from dqn.action_mask import ActionMask
+
+logger = logging.getLogger(__name__)
+
+# Actions 0..BASE_ACTIONS-1 are defense, attack and tiptoe; with tool actions enabled, action
+# BASE_ACTIONS + i uses tool i
+BASE_ACTIONS = 3
+# Add one action per tool to the action space (changes the network's output size)
+TOOL_ACTIONS = False
 
 
 class ToolManager:
-    def __init__(self):
+    """
+    Prosthetic tool selection, cooldowns and remaining uses.
+
+    Cooldowns are kept as monotonic expiry times in a NumPy array, so readiness is one comparison.
+    The action mask is cached and only rebuilt when a tool is used, the remaining uses change or
+    the next pending cooldown expires.
+    """
+
+    def __init__(self, tool_actions=TOOL_ACTIONS):
         self.tools = [
-            {'name': 'Tool 1', 'usage_cost': 1, 'cooldown': 8, 'last_used': 0},
-            {'name': 'Tool 2', 'usage_cost': 2, 'cooldown': 10, 'last_used': 0},
-            {'name': 'Tool 3', 'usage_cost': 3, 'cooldown': 12, 'last_used': 0}
+            {'name': 'Tool 1', 'usage_cost': 1, 'cooldown': 8},
+            {'name': 'Tool 2', 'usage_cost': 2, 'cooldown': 10},
+            {'name': 'Tool 3', 'usage_cost': 3, 'cooldown': 12}
         ]
+        self.cooldowns = np.array([tool['cooldown'] for tool in self.tools], dtype=np.float64)
+        self.usage_costs = np.array([tool['usage_cost'] for tool in self.tools], dtype=np.int64)
+        self.ready_at = np.zeros(len(self.tools), dtype=np.float64)
         self.current_tool_index = 0
-        self.remaining_uses = 19
+        self._remaining_uses = 19
         self.tools_exhausted = False
+        self.tool_actions = tool_actions
+        self.action_space_size = BASE_ACTIONS + (len(self.tools) if tool_actions else 0)
+        self._masks = {}
+        self._mask = None
+        self._mask_expires_at = np.inf
+
+    @property
+    def remaining_uses(self):
+        return self._remaining_uses
+
+    @remaining_uses.setter
+    def remaining_uses(self, value):
+        if value != self._remaining_uses:
+            self._remaining_uses = value
+            self._mask = None
 
     def change_tool(self):
         perform_action("Z", 0.1)
         self.current_tool_index = (self.current_tool_index + 1) % len(self.tools)
 
     def use_specific_tool(self, target_tool_index):
+        # Check readiness before switching, so a tool on cooldown costs no key presses
+        remaining_cooldown = self.ready_at[target_tool_index] - time.monotonic()
+        if remaining_cooldown > 0:
+            return remaining_cooldown
         while self.current_tool_index != target_tool_index:
             self.change_tool()
-        self.use_tool()
+        return self.use_tool()
 
     def use_tool(self):
-        current_tool = self.tools[self.current_tool_index]
-        current_time = time.time()
+        index = self.current_tool_index
+        current_tool = self.tools[index]
+        now = time.monotonic()
 
         # Check if the tool is on cooldown
-        time_since_last_use = current_time - current_tool['last_used']
-        if time_since_last_use < current_tool['cooldown']:
-            remaining_cooldown = current_tool['cooldown'] - time_since_last_use
-            print(f"{current_tool['name']} is on cooldown. Please wait {remaining_cooldown:.2f} seconds.")
+        remaining_cooldown = self.ready_at[index] - now
+        if remaining_cooldown > 0:
+            logger.debug("%s is on cooldown for %.2f more seconds.", current_tool['name'], remaining_cooldown)
             return remaining_cooldown  # Return remaining cooldown time
 
         if self.remaining_uses > 0:
             # Check if there are enough remaining uses for the tool's usage cost
-            if self.remaining_uses >= current_tool['usage_cost']:
+            if self.remaining_uses >= self.usage_costs[index]:
                 perform_action("3", 0.2)
-                self.remaining_uses -= current_tool['usage_cost']
-                current_tool['last_used'] = current_time
-                print(f"Used {current_tool['name']}. Remaining uses: {self.remaining_uses}")
+                self.remaining_uses -= int(self.usage_costs[index])
+                self.ready_at[index] = now + self.cooldowns[index]
+                self._mask = None
+                logger.info("Used %s. Remaining uses: %d", current_tool['name'], self.remaining_uses)
             else:
-                print(f"Not enough uses left for {current_tool['name']}.")
+                logger.warning("Not enough uses left for %s.", current_tool['name'])
                 self.tools_exhausted = True
         else:
-            print(f"No more uses available for tools.")
+            logger.warning("No more uses available for tools.")
             self.tools_exhausted = True
 
     def get_remaining_cooldown(self):
         """Return the remaining cooldown times for all tools."""
-        current_time = time.time()
-        remaining_cooldowns = []
-        for tool in self.tools:
-            time_since_last_use = current_time - tool['last_used']
-            remaining_time = max(0, tool['cooldown'] - time_since_last_use)
-            remaining_cooldowns.append(remaining_time)
-            if remaining_time > 0:
-                print(f"{tool['name']} has {remaining_time:.2f} seconds remaining on cooldown.")
-        return remaining_cooldowns
+        return np.maximum(self.ready_at - time.monotonic(), 0.0).tolist()
+
+    def action_mask(self, now=None):
+        """
+        Return the ActionMask of the action space: base actions are always valid, tool actions only
+        while the tool is off cooldown and affordable.
+
+        The mask is cached until a tool is used, the remaining uses change or a cooldown expires.
+        """
+        if self._mask is not None and (not self.tool_actions or
+                                       (now if now is not None else time.monotonic()) < self._mask_expires_at):
+            return self._mask
+        if not self.tool_actions:
+            bits = (1 << BASE_ACTIONS) - 1
+            self._mask_expires_at = np.inf
+        else:
+            now = time.monotonic() if now is None else now
+            cooling = self.ready_at > now
+            ready = ~cooling & (self.usage_costs <= self.remaining_uses)
+            bits = (1 << BASE_ACTIONS) - 1
+            for i in np.flatnonzero(ready):
+                bits |= 1 << (BASE_ACTIONS + int(i))
+            self._mask_expires_at = self.ready_at[cooling].min() if cooling.any() else np.inf
+        mask = self._masks.get(bits)
+        if mask is None:
+            mask = self._masks[bits] = ActionMask.from_bits(bits, self.action_space_size)
+        self._mask = mask
+        return mask
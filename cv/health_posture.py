@@ -218,17 +218,17 @@ def update_health(new_player_health, new_boss_health):
     # Update Player Health
     if current_health['player'] is None:
         current_health['player'] = new_player_health
-        logging.info(f"Initialized player health: {new_player_health:.2f}")
+        logging.info("Initialized player health: %.2f", new_player_health)
     else:
         if new_player_health > 50.0:
-            logging.warning(f"Detected player health {new_player_health:.2f}% exceeds 50%. Update ignored.")
+            logging.warning("Detected player health %.2f%% exceeds 50%%. Update ignored.", new_player_health)
         else:
             if current_health['player'] <= 1.0 and new_player_health > 0.0:
-                logging.info(f"Player health immediately updated from 0.0% to {new_player_health:.2f}%")
+                logging.info("Player health immediately updated from 0.0%% to %.2f%%", new_player_health)
                 current_health['player'] = new_player_health
                 health_update_buffer['player'].clear()
             elif new_player_health <= 1.0 and current_health['player'] != 0.0:
-                logging.info(f"Player health immediately updated to 0.0%")
+                logging.info("Player health immediately updated to 0.0%")
                 current_health['player'] = 0.0
                 health_update_buffer['player'].clear()
             else:
@@ -238,25 +238,25 @@ def update_health(new_player_health, new_boss_health):
                     health_update_buffer['player'].append(0)
 
                 if sum(health_update_buffer['player']) >= REQUIRED_CONSECUTIVE_FRAMES:
-                    logging.info(f"Player health updated: {current_health['player']:.2f}% -> {new_player_health:.2f}%")
+                    logging.info("Player health updated: %.2f%% -> %.2f%%", current_health['player'], new_player_health)
                     current_health['player'] = new_player_health
                     health_update_buffer['player'].clear()
 
     # Update Boss Health
     if current_health['boss'] is None:
         current_health['boss'] = new_boss_health
-        logging.info(f"Initialized boss health: {new_boss_health:.2f}")
+        logging.info("Initialized boss health: %.2f", new_boss_health)
     else:
         if not is_valid_update(current_health['boss'], new_boss_health, 20):
             current_health['boss'] = current_health['boss']
         if current_health['boss'] <= 1.0 and new_boss_health > 0.0:
             # Immediate update from 0 to non-zero
-            logging.info(f"Boss health immediately updated from 0.0 to {new_boss_health:.2f}")
+            logging.info("Boss health immediately updated from 0.0 to %.2f", new_boss_health)
             current_health['boss'] = new_boss_health
             health_update_buffer['boss'].clear()
         elif new_boss_health <= 1.0 and current_health['boss'] != 0.0:
             # Immediate update to 0
-            logging.info(f"Boss health immediately updated to 0.0")
+            logging.info("Boss health immediately updated to 0.0")
             current_health['boss'] = 0.0
             health_update_buffer['boss'].clear()
         else:
@@ -268,7 +268,7 @@ def update_health(new_player_health, new_boss_health):
 
             # If change detected over required consecutive frames, update health
             if sum(health_update_buffer['boss']) >= REQUIRED_CONSECUTIVE_FRAMES:
-                logging.info(f"Boss health updated: {current_health['boss']:.2f} -> {new_boss_health:.2f}")
+                logging.info("Boss health updated: %.2f -> %.2f", current_health['boss'], new_boss_health)
                 current_health['boss'] = new_boss_health
                 health_update_buffer['boss'].clear()
 
@@ -296,13 +296,13 @@ def update_posture(new_player_posture, new_boss_posture):
     # Update Player Posture
     if current_posture['player'] is None:
         current_posture['player'] = new_player_posture
-        logging.info(f"Initialized player posture: {new_player_posture:.2f}")
+        logging.info("Initialized player posture: %.2f", new_player_posture)
     else:
         if not is_valid_update(current_posture['player'], new_player_posture, 25):
             current_posture['player'] = current_posture['player']
         if current_posture['player'] == 0.0 and new_player_posture > 0.0:
             # Immediate update from 0 to non-zero
-            logging.info(f"Player posture immediately updated from 0.0 to {new_player_posture:.2f}")
+            logging.info("Player posture immediately updated from 0.0 to %.2f", new_player_posture)
             current_posture['player'] = new_player_posture
             posture_update_buffer['player'].clear()
         else:
@@ -314,7 +314,7 @@ def update_posture(new_player_posture, new_boss_posture):
 
             # If change detected over required consecutive frames, update posture
             if sum(posture_update_buffer['player']) >= REQUIRED_CONSECUTIVE_FRAMES:
-                logging.info(f"Player posture updated: {current_posture['player']:.2f} -> {new_player_posture:.2f}")
+                logging.info("Player posture updated: %.2f -> %.2f", current_posture['player'], new_player_posture)
                 current_posture['player'] = new_player_posture
                 posture_update_buffer['player'].clear()
 
@@ -0,0 +1,30 @@
+import torch
+
+
+class ActionMask(tuple):
+    """
+    Immutable 0/1 validity flags per action, with the bitmask, the valid action indices and a
+    boolean tensor per device computed once.
+
+    It is still a plain tuple, so code that iterates over a list mask keeps working; producers such
+    as `ToolManager.action_mask` cache instances so a mask that did not change costs nothing per step.
+    """
+
+    def __new__(cls, flags):
+        mask = super().__new__(cls, (1 if flag else 0 for flag in flags))
+        mask.bits = sum(1 << i for i, flag in enumerate(mask) if flag)
+        mask.valid_actions = tuple(i for i, flag in enumerate(mask) if flag)
+        mask._tensors = {}
+        return mask
+
+    @classmethod
+    def from_bits(cls, bits, size):
+        return cls((bits >> i) & 1 for i in range(size))
+
+    def to_tensor(self, device):
+        """Boolean tensor of the flags on `device`, created on first use."""
+        device = torch.device(device)
+        tensor = self._tensors.get(device)
+        if tensor is None:
+            tensor = self._tensors[device] = torch.tensor(self, dtype=torch.bool, device=device)
+        return tensor
@@ -0,0 +1,379 @@
+import logging
+import math
+import threading
+import time
+import numpy as np
+import torch
+import torch.multiprocessing as mp
+from torch.utils.tensorboard import SummaryWriter
+from dqn.dueling_dqn import (DQNAgent, DuelingDQN, DevicePrioritizedReplayBuffer, PrioritizedReplayBuffer, device,
+                             REPLAY_SIZE, TRAINING_START_SIZE, INITIAL_EPSILON, METRICS_FLUSH_INTERVAL,
+                             QUANTIZED_ACTOR, QUANTIZED_CALIBRATION_SIZE, QUANTIZED_MIN_AGREEMENT,
+                             ACTOR_REFRESH_INTERVAL)
+from dqn.actor_refresh import ActorRefresher, build_quantized_actor
+from dqn.checkpoints import CheckpointStore
+from monitoring.metrics_writer import MetricsWriter
+from monitoring.async_logging import setup_logging
+from monitoring.profiling import ProfileTriggers, learner_profiler
+
+logger = logging.getLogger(__name__)
+
+# Learner steps between weight snapshots published to the actors
+PUBLISH_INTERVAL = 20
+# The learner trains back to back, so checkpoints and replay snapshots are spaced out in steps
+LEARNER_CHECKPOINT_INTERVAL = 500
+LEARNER_REPLAY_SAVE_INTERVAL = 5000
+# Seconds between checks for a new weight snapshot on the actor
+WEIGHT_POLL_INTERVAL = 0.5
+
+
+class SharedReplayStorage:
+    """
+    Transition ring in shared memory, written by actor processes and sampled by the learner process.
+
+    Writers claim slots from a shared counter, so several actors can write at once. `sequence[slot]`
+    holds the claim number of the transition stored in a slot, or 0 while the slot is being written;
+    the learner compares it with what it saw last to find new transitions. States are stored as
+    float16 by default, halving the shared footprint of the normalized frames.
+    """
+
+    def __init__(self, capacity, state_shape, state_dtype=torch.float16, ctx=None):
+        ctx = ctx or mp.get_context('spawn')
+        self.capacity = capacity
+        shape = (capacity,) + tuple(state_shape)
+        self.states = torch.zeros(shape, dtype=state_dtype).share_memory_()
+        self.next_states = torch.zeros(shape, dtype=state_dtype).share_memory_()
+        self.actions = torch.zeros(capacity, dtype=torch.long).share_memory_()
+        self.rewards = torch.zeros(capacity, dtype=torch.float32).share_memory_()
+        self.dones = torch.zeros(capacity, dtype=torch.float32).share_memory_()
+        self.sequence = torch.zeros(capacity, dtype=torch.int64).share_memory_()
+        self.counter = ctx.Value('q', 0)
+
+    def write(self, state, action, reward, next_state, done):
+        """
+        Store one transition in the next slot, overwriting the oldest one once the ring is full.
+
+        Returns:
+            tuple: (slot, sequence number) of the stored transition.
+        """
+        with self.counter.get_lock():
+            seq = self.counter.value + 1
+            self.counter.value = seq
+        slot = (seq - 1) % self.capacity
+        self.sequence[slot] = 0
+        self.states[slot].copy_(state)
+        self.next_states[slot].copy_(next_state)
+        self.actions[slot] = action
+        self.rewards[slot] = reward
+        self.dones[slot] = done
+        self.sequence[slot] = seq
+        return slot, seq
+
+    def __len__(self):
+        return min(self.counter.value, self.capacity)
+
+
+class SharedPrioritizedReplayBuffer(DevicePrioritizedReplayBuffer):
+    """
+    Learner view of a `SharedReplayStorage`: priorities are kept by the learner, transitions are read
+    from shared memory.
+
+    Transitions written by the actors get the current max priority the next time the learner samples.
+    An actor can rewrite a sampled slot while the learner gathers it, leaving a torn transition (new
+    state with old action and reward, or a half-copied frame). The slots' write sequences are read
+    before and after the gather, seqlock style; rows whose sequence changed or was 0 (write in
+    progress) get sequence 0, which zeroes their IS weight and keeps them out of priority updates and
+    the target cache. Pickling (replay snapshots) produces a plain `DevicePrioritizedReplayBuffer`.
+    """
+
+    def __init__(self, storage):
+        super().__init__(storage.capacity, storage_device='cpu')
+        self.storage = storage
+        self.states = storage.states
+        self.next_states = storage.next_states
+        self.actions = storage.actions
+        self.rewards = storage.rewards
+        self.dones = storage.dones
+        self.slot_sequence = storage.sequence
+        self.seen = np.zeros(storage.capacity, dtype=np.int64)
+
+    def __reduce__(self):
+        state = {key: value for key, value in self.__dict__.items() if key not in ('storage', 'seen', 'lock')}
+        return DevicePrioritizedReplayBuffer.__new__, (DevicePrioritizedReplayBuffer,), state
+
+    def sync(self):
+        """Give new transitions the max priority and exclude slots that are being rewritten."""
+        with self.lock:
+            sequence = self.storage.sequence.numpy().copy()
+            changed = sequence != self.seen
+            if changed.any():
+                changed = torch.from_numpy(changed)
+                in_flight = torch.from_numpy(sequence == 0)
+                self.priorities[changed] = self.max_priority
+                self.priorities[in_flight] = 0.0
+                self.seen = sequence
+            self.size = len(self.storage)
+            self.write = self.storage.counter.value % self.capacity
+
+    def _store(self, p, sample):
+        slot, seq = self.storage.write(*sample)
+        with self.lock:
+            self.priorities[slot] = p
+            self.max_priority = torch.maximum(self.max_priority, self.priorities[slot])
+            self.min_priority = torch.minimum(self.min_priority, self.priorities[slot])
+            self.seen[slot] = seq
+            self.size = len(self.storage)
+
+    def merge_restored(self, restored):
+        """Actors keep writing the shared storage, so restored transitions are appended to it."""
+        self.extend(restored)
+        return self
+
+    def sample_tensors(self, batch_size, beta):
+        self.sync()
+        with self.lock:
+            idxs, is_weights = self._sample_indices(batch_size, beta)
+            before = self.slot_sequence[idxs]
+            batch = (self.states[idxs].float(), self.actions[idxs].unsqueeze(1), self.rewards[idxs],
+                     self.next_states[idxs].float(), self.dones[idxs])
+            after = self.slot_sequence[idxs]
+        torn = (before != after) | (after == 0)
+        if torn.any():
+            is_weights = is_weights.masked_fill(torn, 0.0)
+            after = after.masked_fill(torn, 0)
+        return batch + (is_weights, idxs, after)
+
+    def __len__(self):
+        return len(self.storage)
+
+
+class SharedWeights:
+    """
+    Versioned weight snapshots in shared memory, published by the learner and pulled by actors.
+
+    Two snapshot slots are kept: the learner writes the inactive one and then flips `active`, so an
+    actor copying the current snapshot only waits if the learner laps it twice during the copy.
+    """
+
+    def __init__(self, state_dict, ctx=None):
+        ctx = ctx or mp.get_context('spawn')
+        self.slots = [{key: value.detach().to('cpu', copy=True).share_memory_() for key, value in state_dict.items()}
+                      for _ in range(2)]
+        self.slot_locks = [ctx.Lock(), ctx.Lock()]
+        self.version = ctx.Value('q', 0)
+        self.active = ctx.Value('i', 0, lock=False)
+        self.global_step = ctx.Value('q', 0, lock=False)
+
+    def publish(self, state_dict, global_step):
+        """Copy `state_dict` into the inactive slot and make it the current snapshot."""
+        slot = 1 - self.active.value
+        with self.slot_locks[slot]:
+            for key, value in state_dict.items():
+                self.slots[slot][key].copy_(value.detach())
+        with self.version.get_lock():
+            self.active.value = slot
+            self.global_step.value = global_step
+            self.version.value += 1
+
+    def pull(self, net, known_version=0):
+        """
+        Load the current snapshot into `net` if it is newer than `known_version`.
+
+        Returns:
+            tuple: (version, learner global step) of the snapshot in `net`, or None if nothing newer exists.
+        """
+        with self.version.get_lock():
+            version, slot, global_step = self.version.value, self.active.value, self.global_step.value
+        if version <= known_version:
+            return None
+        with self.slot_locks[slot]:
+            net.load_state_dict(self.slots[slot])
+        return version, global_step
+
+
+def learner_main(input_channels, action_space, model_file, model_folder, storage, weights, global_episode,
+                 episode_reward, stop_event, publish_interval=PUBLISH_INTERVAL, min_replay=TRAINING_START_SIZE):
+    """
+    Learner process: restore the agent, train on the shared replay at full speed and publish weights.
+
+    Args:
+        input_channels (int): Number of input channels of the network.
+        action_space (int): Number of actions.
+        model_file (str): Model file used when no checkpoint exists.
+        model_folder (str): Folder with checkpoints and replay snapshots.
+        storage (SharedReplayStorage): Replay storage written by the actors.
+        weights (SharedWeights): Snapshot slots the learner publishes to.
+        global_episode: Shared episode counter maintained by the actor, stored in checkpoints.
+        episode_reward: Shared rolling mean episode reward reported by the actor (NaN until the first
+            report), compared with the best model's.
+        stop_event: Set by the actor process to stop training.
+        publish_interval (int): Learner steps between weight snapshots.
+        min_replay (int): Transitions needed before training starts.
+    """
+    log_pipeline = setup_logging('./logs/learner.log')
+    agent = DQNAgent(input_channels, action_space, model_file, model_folder, replay_size=storage.capacity,
+                     restore_replay=False, start_training=False)
+    agent.replay_buffer = SharedPrioritizedReplayBuffer(storage)
+    agent.start_replay_restore()
+    agent.checkpoint_interval = LEARNER_CHECKPOINT_INTERVAL
+    agent.replay_save_interval = LEARNER_REPLAY_SAVE_INTERVAL
+    global_episode.value = max(global_episode.value, agent.global_episode)
+    weights.publish(agent.eval_net.state_dict(), agent.global_step)
+    profile_triggers = ProfileTriggers((learner_profiler,))
+    profile_triggers.start()
+    logger.info(f"Learner ready at step {agent.global_step}; waiting for the replay restore and {min_replay} "
+                f"transitions.")
+
+    interval_start, interval_steps = time.perf_counter(), 0
+    last_episode_reward = math.nan
+    try:
+        while not stop_event.is_set():
+            if not agent.replay_restored.is_set() or len(agent.replay_buffer) < min_replay:
+                time.sleep(0.5)
+                continue
+            agent.global_episode = global_episode.value
+            if episode_reward.value != last_episode_reward and not math.isnan(episode_reward.value):
+                last_episode_reward = episode_reward.value
+                agent.report_episode_reward(last_episode_reward)
+            agent.maybe_report_replay_memory()
+            agent.train_step()
+            interval_steps += 1
+            if agent.global_step % publish_interval == 0:
+                weights.publish(agent.eval_net.state_dict(), agent.global_step)
+            now = time.perf_counter()
+            if now - interval_start >= 30:
+                agent.metrics.add_scalars({'Learner/StepsPerSec': interval_steps / (now - interval_start),
+                                           'Learner/WeightVersion': weights.version.value}, agent.global_step)
+                interval_start, interval_steps = now, 0
+    finally:
+        profile_triggers.stop()
+        agent.global_episode = global_episode.value
+        agent.save_checkpoint()
+        agent.close_metrics()
+        log_pipeline.stop()
+
+
+class ActorAgent:
+    """
+    Actor-side stand-in for `DQNAgent` when the learner runs in its own process.
+
+    Acting starts from the latest checkpoint's weights, so it does not wait for the learner's replay
+    restore. The local network is refreshed from the learner's weight snapshots by a background
+    thread, which loads into a standby copy and swaps it in, so the control loop never waits for a
+    weight copy. `actor_lock` is held by each forward and by every change of the acting network, so
+    a swap waits for a forward still running on the old network before it becomes the standby copy
+    and is loaded into. Transitions go straight to shared memory.
+    """
+
+    def __init__(self, input_channels, action_space, model_file, model_folder, replay_size=REPLAY_SIZE,
+                 state_shape=(3, 128, 128), publish_interval=PUBLISH_INTERVAL, min_replay=TRAINING_START_SIZE):
+        ctx = mp.get_context('spawn')
+        self.global_step = 0
+        self.epsilon = INITIAL_EPSILON
+        self.eval_net = DuelingDQN(input_channels, action_space).to(device).eval()
+        self.standby_net = DuelingDQN(input_channels, action_space).to(device).eval()
+        self.weights_version = 0
+
+        self.storage = SharedReplayStorage(replay_size, state_shape, ctx=ctx)
+        self.weights = SharedWeights(self.eval_net.state_dict(), ctx=ctx)
+        self.shared_episode = ctx.Value('q', 0)
+        self.shared_episode_reward = ctx.Value('d', math.nan)
+        self.stop_event = ctx.Event()
+        self.learner = ctx.Process(
+            target=learner_main, name='learner', daemon=True,
+            args=(input_channels, action_space, model_file, model_folder, self.storage, self.weights,
+                  self.shared_episode, self.shared_episode_reward, self.stop_event, publish_interval, min_replay))
+        self.learner.start()
+
+        self.writer = SummaryWriter(log_dir='./logs')
+        self.metrics = MetricsWriter(self.writer, flush_interval=METRICS_FLUSH_INTERVAL)
+
+        # Act right away with the latest checkpoint's weights; without one, wait for the learner's first snapshot
+        checkpoints = CheckpointStore(model_folder)
+        entry = checkpoints.latest()
+        if entry is not None:
+            self.eval_net.load_state_dict(checkpoints.load_weights(entry, map_location=device))
+            self.global_step = entry['global_step']
+            self.global_episode = max(self.global_episode, entry['global_episode'])
+            logger.info(f"Acting with weights of checkpoint {entry['name']} while the learner starts.")
+        else:
+            logger.info("Waiting for the learner process to publish its first weights...")
+        while entry is None and not self.sync_weights(self.eval_net):
+            if not self.learner.is_alive():
+                raise RuntimeError("Learner process exited before publishing weights")
+            time.sleep(WEIGHT_POLL_INTERVAL)
+        self.sync_stop_event = threading.Event()
+        self.actor_lock = threading.Lock()
+        self.quantized_actor = QUANTIZED_ACTOR and device.type == 'cpu'
+        self.actor_net = self.eval_net
+        self.actor_refresher = ActorRefresher('quantized', build_quantized_actor, self.set_actor,
+                                              ACTOR_REFRESH_INTERVAL, QUANTIZED_MIN_AGREEMENT) \
+            if self.quantized_actor else None
+        self.sync_thread = threading.Thread(target=self._sync_loop, daemon=True)
+        self.sync_thread.start()
+
+    @property
+    def global_episode(self):
+        return self.shared_episode.value
+
+    @global_episode.setter
+    def global_episode(self, value):
+        self.shared_episode.value = value
+
+    def sync_weights(self, net):
+        """Load a newer weight snapshot into `net`; returns whether one was loaded."""
+        pulled = self.weights.pull(net, self.weights_version)
+        if pulled is None:
+            return False
+        self.weights_version, self.global_step = pulled
+        return True
+
+    def _sync_loop(self):
+        learner_lost = False
+        while not self.sync_stop_event.wait(WEIGHT_POLL_INTERVAL):
+            if self.sync_weights(self.standby_net):
+                with self.actor_lock:
+                    self.eval_net, self.standby_net = self.standby_net, self.eval_net
+                    # A float actor follows the new weights; a quantized one is kept until its rebuild is ready
+                    if self.actor_net is self.standby_net:
+                        self.actor_net = self.eval_net
+                if self.actor_refresher is not None:
+                    self.refresh_quantized_actor()
+            if not learner_lost and not self.learner.is_alive():
+                learner_lost = True
+                logger.error("Learner process exited; acting with the last published weights.")
+
+    def refresh_quantized_actor(self):
+        """Queue a re-quantization of eval_net calibrated on the oldest shared transitions, once enough exist."""
+        if len(self.storage) >= QUANTIZED_CALIBRATION_SIZE:
+            self.actor_refresher.submit(self.eval_net, self.global_step,
+                                        lambda: self.storage.states[:QUANTIZED_CALIBRATION_SIZE])
+
+    def set_actor(self, actor, global_step):
+        """Act with a rebuilt actor network, or with the current float weights if `actor` is None."""
+        with self.actor_lock:
+            self.actor_net = self.eval_net if actor is None else actor
+
+    def choose_action(self, state, action_mask):
+        # Same policy as the in-process agent; the lock keeps the network from being swapped out mid-forward
+        with self.actor_lock:
+            return DQNAgent.choose_action(self, state, action_mask)
+
+    def store_transition(self, state, action, reward, next_state, done):
+        self.storage.write(state, action, reward, next_state, done)
+
+    def update_target_network(self):
+        """The learner process owns the target network."""
+
+    def report_episode_reward(self, reward_mean):
+        """Pass the rolling mean episode reward to the learner process, which saves the best model."""
+        self.shared_episode_reward.value = reward_mean
+
+    def close_metrics(self):
+        """Stop the learner (it saves a final checkpoint) and close the SummaryWriter."""
+        self.sync_stop_event.set()
+        self.sync_thread.join()
+        self.stop_event.set()
+        self.learner.join()
+        self.metrics.close()
+        self.writer.close()
@@ -0,0 +1,130 @@
+import copy
+import logging
+import os
+import threading
+import torch
+
+logger = logging.getLogger(__name__)
+
+
+def greedy_agreement(net, actor, states):
+    """Fraction of `states` on which `actor` picks the same greedy action as the float network `net`."""
+    with torch.no_grad():
+        return (net(states).argmax(1) == actor(states).argmax(1)).float().mean().item()
+
+
+def build_quantized_actor(net, states, global_step):
+    """Int8 copy of `net` calibrated on `states` (see `dqn.quantize.quantize_actor`)."""
+    from dqn.quantize import quantize_actor
+    return quantize_actor(net, states)
+
+
+def onnx_candidate_path(path):
+    """File an ONNX actor is exported to until its parity check passes."""
+    return f"{path}.candidate"
+
+
+def onnx_actor_builder(path):
+    """
+    Build function exporting the network to the candidate file of `path` and loading it with onnxruntime.
+    The caller moves an accepted candidate into place with `commit_onnx_actor`. While it exports, the
+    attention fast path is off for the whole process (see `dqn.onnx_export._export_mode`), so actor
+    forwards on other threads run the slower regular attention.
+    """
+
+    def build(net, states, global_step):
+        from dqn.onnx_actor import OnnxActor
+        from dqn.onnx_export import export_onnx
+        candidate = onnx_candidate_path(path)
+        export_onnx(net, candidate, global_step, state_shape=tuple(states.shape[1:]))
+        return OnnxActor(candidate)
+
+    return build
+
+
+def commit_onnx_actor(path, accepted):
+    """Move the checked candidate export of `path` into place, or delete it if it was rejected."""
+    candidate = onnx_candidate_path(path)
+    if not os.path.exists(candidate):
+        return
+    if accepted:
+        os.replace(candidate, path)
+    else:
+        os.remove(candidate)
+
+
+class ActorRefresher:
+    """
+    Rebuild the acting copy of eval_net (its int8 version or ONNX export) on a background thread.
+
+    `submit` is called once per new weight version. Only every `interval`-th version is built, and
+    none while a build is running; the caller keeps acting with the previous copy meanwhile. A build
+    snapshots the float network and the check states on the caller's thread, then builds the copy
+    on a worker thread and compares greedy actions with the snapshot on the check states. The copy
+    is passed to `on_ready(actor, global_step)`; a copy that fails to build or agrees on less than
+    `min_agreement` of the states is passed as None, and the caller acts with the float network.
+    """
+
+    def __init__(self, name, build, on_ready, interval, min_agreement):
+        self.name = name
+        self.build = build
+        self.on_ready = on_ready
+        self.interval = max(1, interval)
+        self.min_agreement = min_agreement
+        self.versions = 0
+        self.thread = None
+
+    @property
+    def busy(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    def submit(self, net, global_step, states):
+        """
+        Start building an actor from `net` if this version is due and no build is running.
+
+        Args:
+            net (nn.Module): Float network; it is copied, so the caller may keep training it.
+            global_step (int): Learner step of the weights.
+            states: Calibration and check states [N, C, H, W], or a function returning them (called
+                only when a build starts).
+
+        Returns:
+            bool: Whether a build was started.
+        """
+        due = self.versions % self.interval == 0
+        self.versions += 1
+        if not due or self.busy:
+            return False
+        try:
+            snapshot = copy.deepcopy(net).cpu().eval()
+            states = (states() if callable(states) else states).detach().float().cpu().clone()
+        except Exception as e:
+            logger.error(f"Failed to snapshot the network for the {self.name} actor: {e}")
+            return False
+        self.thread = threading.Thread(target=self._run, args=(snapshot, global_step, states),
+                                       name=f"{self.name}-actor-refresh", daemon=True)
+        self.thread.start()
+        return True
+
+    def _run(self, net, global_step, states):
+        try:
+            actor = self.build(net, states, global_step)
+            agreement = greedy_agreement(net, actor, states)
+        except Exception as e:
+            logger.error(f"Failed to build the {self.name} actor; acting with the float network: {e}")
+            self.on_ready(None, global_step)
+            return
+        if agreement < self.min_agreement:
+            logger.warning(f"The {self.name} actor for step {global_step} agrees on {agreement:.1%} of "
+                           f"{len(states)} greedy actions (below {self.min_agreement:.0%}); acting with the "
+                           f"float network.")
+            self.on_ready(None, global_step)
+            return
+        logger.info(f"Acting with the {self.name} actor for step {global_step} ({agreement:.1%} greedy action "
+                    f"agreement).")
+        self.on_ready(actor, global_step)
+
+    def join(self, timeout=None):
+        """Wait for a running build to finish."""
+        if self.thread is not None:
+            self.thread.join(timeout)
@@ -0,0 +1,76 @@
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class AdaptiveBatchSize:
+    """
+    Learner minibatch size adapted to the measured time per update on the current machine.
+
+    The time budget of an update is `target_step_time`, or `1 / target_updates_per_sec` if that is
+    tighter. Step times are smoothed with an exponential moving average. While updates take less than
+    `low_water` of the budget, the batch grows by `increment` per step (a ramp, so one fast step does
+    not overshoot); when they exceed the budget it shrinks in proportion, assuming step time roughly
+    linear in the batch size. Sizes stay multiples of `increment` within [min_size, max_size], and
+    the first `settle_steps` steps after a change are not measured, as they include allocator and
+    autotuning warm-up.
+    """
+
+    def __init__(self, initial, min_size, max_size, target_step_time, target_updates_per_sec=None, increment=16,
+                 smoothing=0.3, low_water=0.7, settle_steps=2):
+        self.min_size = min_size
+        self.max_size = max_size
+        self.increment = increment
+        self.smoothing = smoothing
+        self.low_water = low_water
+        self.settle_steps = settle_steps
+        self.budget = target_step_time
+        if target_updates_per_sec:
+            self.budget = min(self.budget, 1.0 / target_updates_per_sec)
+        self.batch_size = max(min_size, min(max_size, initial))
+        self.step_time = None
+        self.settling = settle_steps
+
+    def _clamp(self, size):
+        size = int(size) // self.increment * self.increment
+        return max(self.min_size, min(self.max_size, size))
+
+    def observe(self, seconds):
+        """
+        Record the wall time of an update at the current batch size.
+
+        Returns:
+            int: The batch size to use for the next update.
+        """
+        if self.settling > 0:
+            self.settling -= 1
+            return self.batch_size
+        if self.step_time is None:
+            self.step_time = seconds
+        else:
+            self.step_time += self.smoothing * (seconds - self.step_time)
+
+        if self.step_time > self.budget:
+            new_size = self._clamp(self.batch_size * self.budget / self.step_time)
+        elif self.step_time < self.low_water * self.budget:
+            new_size = self._clamp(self.batch_size + self.increment)
+        else:
+            new_size = self.batch_size
+        if new_size != self.batch_size:
+            logger.info(f"Learner batch size {self.batch_size} -> {new_size} "
+                        f"({self.step_time * 1000:.0f} ms per update, budget {self.budget * 1000:.0f} ms)")
+            # The smoothed time belonged to the old size; rescale it as the starting estimate for the new one
+            self.step_time *= new_size / self.batch_size
+            self.batch_size = new_size
+            self.settling = self.settle_steps
+        return self.batch_size
+
+    def stats(self):
+        """Current batch size and measured throughput, for logging."""
+        step_time = self.step_time or 0.0
+        return {
+            'batch_size': self.batch_size,
+            'step_time_ms': step_time * 1000,
+            'updates_per_sec': 1.0 / step_time if step_time else 0.0,
+            'samples_per_sec': self.batch_size / step_time if step_time else 0.0,
+        }
@@ -0,0 +1,197 @@
+import json
+import logging
+import os
+import threading
+import torch
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_FILE = 'manifest.json'
+MANIFEST_VERSION = 1
+WEIGHTS_SUFFIX = '.weights.pt'
+TRAINING_STATE_SUFFIX = '.train.pt'
+BEST_NAME = 'best'
+# Files written before the manifest format: checkpoint_step_<step>.pth and replay_buffer_size_<size>.pkl.gz
+LEGACY_CHECKPOINT_PREFIX, LEGACY_CHECKPOINT_SUFFIX = 'checkpoint_step_', '.pth'
+REPLAY_BUFFER_PREFIX, REPLAY_BUFFER_SUFFIX = 'replay_buffer_size_', '.pkl.gz'
+
+
+def _atomic_save(obj, path):
+    temp_path = f"{path}.tmp"
+    torch.save(obj, temp_path)
+    os.replace(temp_path, path)
+
+
+class CheckpointStore:
+    """
+    Checkpoints of a model folder, tracked by a small JSON manifest.
+
+    Each checkpoint is two files: `<name>.weights.pt` with the network state dict and
+    `<name>.train.pt` with optimizer, scheduler and scaler state. Both are plain tensor files that
+    load with `torch.load(mmap=True, weights_only=True)`, so reading weights for inference never
+    touches the optimizer state. The manifest records the latest and best checkpoints with their
+    counters, the retained checkpoints and the replay buffer snapshots, so finding or pruning files
+    never lists the folder.
+    """
+
+    def __init__(self, folder, max_checkpoints=8, max_replay_buffers=2):
+        self.folder = folder
+        self.max_checkpoints = max_checkpoints
+        self.max_replay_buffers = max_replay_buffers
+        self.lock = threading.Lock()
+        self.manifest = self._read_manifest()
+
+    @property
+    def manifest_path(self):
+        return os.path.join(self.folder, MANIFEST_FILE)
+
+    def _read_manifest(self):
+        try:
+            with open(self.manifest_path) as f:
+                manifest = json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.error(f"Failed to read checkpoint manifest {self.manifest_path}: {e}")
+            return None
+        if manifest.get('version') != MANIFEST_VERSION:
+            logger.warning(f"Unsupported checkpoint manifest version {manifest.get('version')}; ignoring it.")
+            return None
+        return manifest
+
+    def _write_manifest(self):
+        temp_path = f"{self.manifest_path}.tmp"
+        with open(temp_path, 'w') as f:
+            json.dump(self.manifest, f, indent=1)
+        os.replace(temp_path, self.manifest_path)
+
+    def _ensure_manifest(self):
+        if self.manifest is None:
+            self.manifest = {'version': MANIFEST_VERSION, 'latest': None, 'best': None, 'checkpoints': [],
+                             'replay_buffers': []}
+
+    def path(self, name, suffix):
+        return os.path.join(self.folder, name + suffix)
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+            logger.info(f"Deleted old checkpoint file: {path}")
+        except FileNotFoundError:
+            pass
+
+    def save(self, name, weights, training_state, meta, best=False):
+        """
+        Write a checkpoint and record it in the manifest.
+
+        Args:
+            name (str): Checkpoint name, e.g. `step_000120`.
+            weights (dict): Network state dict.
+            training_state (dict): Optimizer, scheduler and scaler state dicts.
+            meta (dict): JSON-serializable counters (global step, epsilon, best reward, ...).
+            best (bool): Record the checkpoint as the best model instead of the latest one.
+        """
+        _atomic_save(weights, self.path(name, WEIGHTS_SUFFIX))
+        _atomic_save(training_state, self.path(name, TRAINING_STATE_SUFFIX))
+        entry = dict(meta, name=name)
+        with self.lock:
+            self._ensure_manifest()
+            if best:
+                self.manifest['best'] = entry
+            else:
+                self.manifest['latest'] = entry
+                checkpoints = [n for n in self.manifest['checkpoints'] if n != name] + [name]
+                expired, self.manifest['checkpoints'] = \
+                    checkpoints[:-self.max_checkpoints], checkpoints[-self.max_checkpoints:]
+            self._write_manifest()
+        if not best:
+            for old in expired:
+                self._remove(self.path(old, WEIGHTS_SUFFIX))
+                self._remove(self.path(old, TRAINING_STATE_SUFFIX))
+
+    def latest(self):
+        """Return the manifest entry of the latest checkpoint, or None."""
+        return self.manifest['latest'] if self.manifest else None
+
+    def best(self):
+        """Return the manifest entry of the best checkpoint, or None."""
+        return self.manifest['best'] if self.manifest else None
+
+    def load_weights(self, entry, map_location=None):
+        """Memory-map the network state dict of a checkpoint."""
+        return torch.load(self.path(entry['name'], WEIGHTS_SUFFIX), map_location=map_location, mmap=True,
+                          weights_only=True)
+
+    def load_training_state(self, entry, map_location=None):
+        """Memory-map the optimizer, scheduler and scaler state of a checkpoint."""
+        return torch.load(self.path(entry['name'], TRAINING_STATE_SUFFIX), map_location=map_location, mmap=True,
+                          weights_only=True)
+
+    def add_replay_buffer(self, filename, size):
+        """Record a saved replay buffer and delete all but the `max_replay_buffers` largest ones."""
+        with self.lock:
+            self._ensure_manifest()
+            buffers = [b for b in self.manifest['replay_buffers'] if b['file'] != filename]
+            buffers.append({'file': filename, 'size': size})
+            # Ties keep the newest file, matching the previous (size, mtime) ordering
+            buffers.sort(key=lambda b: b['size'])
+            expired = buffers[:-self.max_replay_buffers]
+            self.manifest['replay_buffers'] = buffers[-self.max_replay_buffers:]
+            self._write_manifest()
+        for buffer in expired:
+            if buffer['file'] != filename:
+                self._remove(os.path.join(self.folder, buffer['file']))
+
+    def prune_legacy_files(self):
+        """
+        Delete files written before the manifest format once the manifest supersedes them.
+
+        A legacy checkpoint goes once the manifest's latest checkpoint is at least as far; a replay buffer
+        missing from the manifest goes once the manifest records one, since only those are loaded then.
+        Legacy files that are kept are logged with their size.
+
+        Returns:
+            int: Bytes freed.
+        """
+        if not self.manifest or not os.path.isdir(self.folder):
+            return 0
+        latest = self.manifest['latest']
+        recorded = {b['file'] for b in self.manifest['replay_buffers']}
+        freed, kept = 0, []
+        for filename in os.listdir(self.folder):
+            if filename.startswith(LEGACY_CHECKPOINT_PREFIX) and filename.endswith(LEGACY_CHECKPOINT_SUFFIX):
+                try:
+                    step = int(filename[len(LEGACY_CHECKPOINT_PREFIX):-len(LEGACY_CHECKPOINT_SUFFIX)])
+                except ValueError:
+                    continue
+                superseded = latest is not None and step <= latest['global_step']
+            elif filename.startswith(REPLAY_BUFFER_PREFIX) and filename.endswith(REPLAY_BUFFER_SUFFIX):
+                if filename in recorded:
+                    continue
+                superseded = bool(recorded)
+            else:
+                continue
+            path = os.path.join(self.folder, filename)
+            try:
+                size = os.path.getsize(path)
+            except OSError:
+                continue
+            if superseded:
+                self._remove(path)
+                freed += size
+            else:
+                kept.append((filename, size))
+        if freed:
+            logger.info(f"Freed {freed / 2 ** 20:.1f} MiB of checkpoint files superseded by the manifest.")
+        if kept:
+            logger.info(f"{len(kept)} files from before the checkpoint manifest are kept "
+                        f"({sum(size for _, size in kept) / 2 ** 20:.1f} MiB): "
+                        f"{', '.join(name for name, _ in sorted(kept))}")
+        return freed
+
+    def largest_replay_buffer(self):
+        """Return (path, size) of the largest recorded replay buffer, or None."""
+        if not self.manifest or not self.manifest['replay_buffers']:
+            return None
+        buffer = self.manifest['replay_buffers'][-1]
+        return os.path.join(self.folder, buffer['file']), buffer['size']
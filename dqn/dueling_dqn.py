@@ -1,7 +1,9 @@
 import gzip
+import logging
 import os
 import pickle
 import random
+import sys
 import torch
 import time
 import math
@@ -16,6 +18,20 @@ from threading import Lock, Event
 from torchvision.models import resnet50
 from torch.utils.tensorboard import SummaryWriter
 from torch.amp import autocast, GradScaler
+from monitoring.tracing import traced
+from monitoring.profiling import profiled, learner_profiler, actor_profiler
+from monitoring.metrics_writer import MetricsWriter
+from dqn.checkpoints import CheckpointStore, BEST_NAME
+from dqn.frame_store import FrameStore, encode_state, decode_states
+from dqn.fused_forward import split_batch_norm, TargetCache
+from dqn.prefetcher import BatchPrefetcher
+from dqn.action_mask import ActionMask
+from dqn.batch_sizing import AdaptiveBatchSize
+from dqn.actor_refresh import ActorRefresher, build_quantized_actor, onnx_actor_builder, commit_onnx_actor
+from dqn.replay_memory import (component, grown, tensor_bytes, python_object_bytes, build_report, footprint_warnings,
+                               format_report)
+
+logger = logging.getLogger(__name__)
 
 # Experience replay buffer size
 REPLAY_SIZE = 7000
@@ -23,6 +39,8 @@ REPLAY_SIZE = 7000
 SMALL_BATCH_SIZE = 64
 BIG_BATCH_SIZE = 128
 BATCH_SIZE_DOOR = 1000
+# Transitions in the replay buffer before the learner starts training
+TRAINING_START_SIZE = 3500
 
 # Hyperparameters for Dueling DQN
 GAMMA = 0.99
@@ -34,6 +52,68 @@ ALPHA = 0.7
 BETA_START = 0.4
 BETA_FRAMES = 2000
 
+# Keep replay priorities and transitions in tensors on the learner device (DevicePrioritizedReplayBuffer).
+# States and next states are stored densely as float32, about 384 KiB per transition at 3x128x128
+# (50000 transitions need about 18 GiB), so this only applies when COMPRESSED_REPLAY is off.
+DEVICE_REPLAY = True
+# Keep replay frames as compressed uint8 in host memory instead (CompressedPrioritizedReplayBuffer), each
+# frame once when a transition's state is the previous next state; priorities stay on the learner device.
+# Frames between keyframes are stored as deltas (0 compresses every frame on its own)
+COMPRESSED_REPLAY = True
+COMPRESSED_KEYFRAME_INTERVAL = 8
+# On CPU-only machines, act with an int8 copy of eval_net (dqn.quantize), re-quantized on a background thread
+# with this many replay states for calibration. A copy whose greedy actions agree with eval_net on fewer than
+# QUANTIZED_MIN_AGREEMENT of those states is dropped in favour of the float network.
+QUANTIZED_ACTOR = False
+QUANTIZED_CALIBRATION_SIZE = 64
+QUANTIZED_MIN_AGREEMENT = 0.95
+# Rebuild the acting copy every ACTOR_REFRESH_INTERVAL weight versions (training bursts in process, pulled
+# snapshots in dqn.actor_learner); in between, the agent acts with the previous copy
+ACTOR_REFRESH_INTERVAL = 5
+# Act with eval_net exported to ONNX and run by onnxruntime (dqn.onnx_export), re-exported on a background
+# thread every ACTOR_REFRESH_INTERVAL training bursts. An export whose greedy actions agree with eval_net on
+# fewer than ONNX_MIN_AGREEMENT of ONNX_CHECK_SIZE replay states is discarded in favour of the float network.
+ONNX_ACTOR = False
+ONNX_CHECK_SIZE = 64
+ONNX_MIN_AGREEMENT = 0.99
+# Run eval_net once over cat(state, next_state) with per-half BatchNorm statistics. This saves kernel
+# launches but also back-propagates through the next-state half, so it only pays off when the learner is
+# launch-bound (small batches on a GPU); on CPU it is slower.
+FUSED_EVAL_FORWARD = False
+# Reuse target-net Q-values of transitions resampled before the next target sync; puts the target net in
+# eval mode so its outputs do not depend on the rest of the batch
+TARGET_CACHE = False
+# The online learner wakes up every TRAINING_WAKEUP_INTERVAL seconds and runs TRAINING_STEPS_PER_WAKEUP
+# gradient steps back to back on batches prefetched PREFETCH_DEPTH ahead (which also bounds how many
+# priority updates a batch can be behind). Epsilon decay and target syncs follow learner steps, so more
+# steps per wakeup also speeds them up in wall-clock time; checkpoint intervals scale with it.
+TRAINING_WAKEUP_INTERVAL = 60
+TRAINING_STEPS_PER_WAKEUP = 1
+PREFETCH_DEPTH = 2
+# Minibatches whose gradients are summed into one optimizer step (effective batch size multiplier)
+GRADIENT_ACCUMULATION_STEPS = 1
+# Adapt the learner batch size (starting at BIG_BATCH_SIZE) so an update takes about TARGET_STEP_TIME
+# seconds, or less to reach TARGET_UPDATES_PER_SEC if set; otherwise always train on BIG_BATCH_SIZE
+ADAPTIVE_BATCH_SIZE = True
+ADAPTIVE_BATCH_MIN = 32
+ADAPTIVE_BATCH_MAX = 512
+TARGET_STEP_TIME = 1.0
+TARGET_UPDATES_PER_SEC = None
+
+# Training statistics reduced on the device each step, in transfer order
+TRAINING_STATS = ('loss', 'reward_sum', 'q_max', 'q_min', 'q_mean', 'target_q_max', 'target_q_min', 'target_q_mean',
+                  'total_norm')
+# Seconds between metrics writer flushes, and learner steps between Q-value/TD error histograms (0 disables)
+METRICS_FLUSH_INTERVAL = 5.0
+HISTOGRAM_INTERVAL = 10
+# The best model is the one with the highest rolling mean episode reward reported by the control loop;
+# checkpoints store the metric name with the best value, so values of another metric are not compared
+BEST_REWARD_METRIC = 'rolling_mean_episode_reward'
+# Seconds between replay memory reports (bytes per component, projected footprint at capacity); 0 disables
+REPLAY_MEMORY_REPORT_INTERVAL = 600
+# Shape of a stored state, used to project the footprint before the first transition arrives
+STATE_SHAPE = (3, 128, 128)
+
 # Check if GPU is available
 device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
 
@@ -158,6 +238,8 @@ class SumTree:
 
 
 class PrioritizedReplayBuffer:
+    priorities_on_device = False
+
     def __init__(self, capacity):
         self.capacity = capacity
         self.tree = SumTree(capacity)
@@ -167,7 +249,7 @@ class PrioritizedReplayBuffer:
         self.min_priority = 1.0
         self.size = 0
         self.lock = Lock()
-        print("PrioritizedReplayBuffer initialized with lock.")
+        logger.info("PrioritizedReplayBuffer initialized with lock.")
 
     def __getstate__(self):
         state = self.__dict__.copy()
@@ -182,9 +264,11 @@ class PrioritizedReplayBuffer:
     def add(self, error, sample):
         state, action, reward, next_state, done = sample
         if torch.isnan(state).any() or torch.isnan(next_state).any() or math.isnan(reward):
-            print("NaN detected in sample, skipping.")
+            logger.warning("NaN detected in sample, skipping.")
             return
-        p = (error + 1e-5) ** self.alpha
+        self._store((error + 1e-5) ** self.alpha, sample)
+
+    def _store(self, p, sample):
         with self.lock:
             self.max_priority = max(self.max_priority, p)
             self.min_priority = min(self.min_priority, p)
@@ -192,6 +276,29 @@ class PrioritizedReplayBuffer:
             if self.size < self.capacity:
                 self.size += 1
 
+    def transitions(self):
+        """Yield (priority, transition) pairs from the oldest to the newest transition."""
+        tree = self.tree
+        order = range(self.size) if self.size < tree.capacity else \
+            [(tree.write + i) % tree.capacity for i in range(tree.capacity)]
+        for slot in order:
+            yield float(tree.tree[slot + tree.capacity - 1]), tree.data[slot]
+
+    def extend(self, buffer):
+        """Append all transitions of another replay buffer, oldest first, keeping their priorities."""
+        for p, sample in buffer.transitions():
+            self._store(p, sample)
+
+    def merge_restored(self, restored):
+        """
+        Combine this live buffer with a replay buffer restored from disk.
+
+        The restored transitions are older, so the live ones are appended to the restored buffer,
+        which replaces this one.
+        """
+        restored.extend(self)
+        return restored
+
     def sample(self, batch_size, beta):
         batch = []
         idxs = []
@@ -211,7 +318,22 @@ class PrioritizedReplayBuffer:
 
         return batch, idxs, is_weight
 
-    def update(self, idxs, errors):
+    def sample_tensors(self, batch_size, beta):
+        """Sample and collate a minibatch: (state, action, reward, next_state, done, is_weights, idxs, None)."""
+        samples, idxs, is_weights = self.sample(batch_size, beta)
+        batch = list(zip(*samples))
+        return (
+            torch.stack(batch[0]),
+            torch.tensor(batch[1], dtype=torch.long).unsqueeze(1),
+            torch.tensor(batch[2], dtype=torch.float32),
+            torch.stack(batch[3]),
+            torch.tensor(batch[4], dtype=torch.float32),
+            torch.tensor(is_weights, dtype=torch.float32),
+            idxs,
+            None,
+        )
+
+    def update(self, idxs, errors, sequences=None):
         """Batch update multiple priorities"""
         if not hasattr(idxs, '__iter__') or not hasattr(errors, '__iter__'):
             raise TypeError("idxs and errors must be iterable")
@@ -225,21 +347,359 @@ class PrioritizedReplayBuffer:
                 self.min_priority = min(self.min_priority, p)
                 self.tree.update(idx, p)
 
+    def memory_report(self, state_shape=STATE_SHAPE):
+        """
+        Bytes held by the SumTree, the slot list and the stored transitions, with the footprint
+        projected to capacity from the average transition so far (or from `state_shape` while empty).
+
+        Transitions are Python tuples whose states are tensors on whatever device `prepare_state`
+        put them; a state shared with the previous transition's next state is counted once.
+        """
+        with self.lock:
+            samples = [sample for sample in self.tree.data if sample is not None]
+        states = [t for sample in samples for t in (sample[0], sample[3])]
+        objects = [obj for sample in samples for obj in sample] + samples
+        components = [component('sumtree', 'cpu', self.tree.tree.nbytes),
+                      component('slots', 'cpu', sys.getsizeof(self.tree.data))]
+        size = len(samples)
+        if size:
+            for name, nbytes in tensor_bytes(states).items():
+                components.append(component('states', name, nbytes, grown(nbytes, size, self.capacity)))
+            nbytes = python_object_bytes(objects)
+            components.append(component('transitions', 'cpu', nbytes, grown(nbytes, size, self.capacity)))
+        else:
+            frame_bytes = 2 * math.prod(state_shape) * torch.float32.itemsize
+            components.append(component('states', device, 0, frame_bytes * self.capacity))
+        return build_report(self, components)
+
+    def __len__(self):
+        return self.size
+
+
+class DevicePrioritizedReplayBuffer:
+    """
+    Prioritized replay whose priorities and transitions live in preallocated tensors on one device.
+
+    Sampling is stratified over the cumulative sum of the priorities with `torch.searchsorted`, the
+    minibatch is gathered by indexing, and priority updates are a single scatter, so a sample/update
+    round trip costs a handful of kernels and never copies indices or errors back to the host.
+    """
+
+    priorities_on_device = True
+
+    def __init__(self, capacity, storage_device=None):
+        self.capacity = capacity
+        self.device = torch.device(storage_device) if storage_device is not None else device
+        self.alpha = ALPHA
+        self.priorities = torch.zeros(capacity, dtype=torch.float64, device=self.device)
+        self.max_priority = torch.ones((), dtype=torch.float64, device=self.device)
+        self.min_priority = torch.ones((), dtype=torch.float64, device=self.device)
+        self.states = None
+        self.next_states = None
+        self.actions = torch.zeros(capacity, dtype=torch.long, device=self.device)
+        self.rewards = torch.zeros(capacity, dtype=torch.float32, device=self.device)
+        self.dones = torch.zeros(capacity, dtype=torch.float32, device=self.device)
+        # Write sequence of each slot, so caches keyed by slot can tell when it was overwritten
+        self.slot_sequence = torch.zeros(capacity, dtype=torch.int64, device=self.device)
+        self.writes = 0
+        self.write = 0
+        self.size = 0
+        self.lock = Lock()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        if 'lock' in state:
+            del state['lock']
+        return state
+
+    def __setstate__(self, state):
+        if 'slot_sequence' not in state:
+            state['slot_sequence'] = torch.zeros(state['capacity'], dtype=torch.int64, device=state['device'])
+            state['writes'] = 0
+        self.__dict__.update(state)
+        self.lock = Lock()
+
+    def _allocate(self, state):
+        """Allocate frame storage on the first add, once the state shape is known."""
+        shape = (self.capacity,) + tuple(state.shape)
+        self.states = torch.zeros(shape, dtype=state.dtype, device=self.device)
+        self.next_states = torch.zeros(shape, dtype=state.dtype, device=self.device)
+
+    def _store(self, p, sample):
+        state, action, reward, next_state, done = sample
+        with self.lock:
+            if self.states is None:
+                self._allocate(state)
+            slot = self.write
+            self.states[slot].copy_(state, non_blocking=True)
+            self.next_states[slot].copy_(next_state, non_blocking=True)
+            self.actions[slot] = action
+            self.rewards[slot] = reward
+            self.dones[slot] = done
+            self.writes += 1
+            self.slot_sequence[slot] = self.writes
+            self.priorities[slot] = p
+            self.max_priority = torch.maximum(self.max_priority, self.priorities[slot])
+            self.min_priority = torch.minimum(self.min_priority, self.priorities[slot])
+            self.write = (slot + 1) % self.capacity
+            if self.size < self.capacity:
+                self.size += 1
+
+    def add(self, error, sample):
+        state, action, reward, next_state, done = sample
+        if torch.isnan(state).any() or torch.isnan(next_state).any() or math.isnan(reward):
+            logger.warning("NaN detected in sample, skipping.")
+            return
+        self._store((error + 1e-5) ** self.alpha, sample)
+
+    def _sample_indices(self, batch_size, beta):
+        """Stratified proportional sampling of slot indices with IS weights; call with the lock held."""
+        cumulative = torch.cumsum(self.priorities[:self.size], dim=0)
+        total = cumulative[-1]
+        targets = (torch.arange(batch_size, device=self.device, dtype=torch.float64)
+                   + torch.rand(batch_size, device=self.device, dtype=torch.float64)) * (total / batch_size)
+        idxs = torch.searchsorted(cumulative, targets).clamp_(max=self.size - 1)
+
+        sampling_probabilities = self.priorities[idxs] / total
+        is_weights = torch.pow(self.capacity * sampling_probabilities, -beta)
+        return idxs, (is_weights / is_weights.max()).float()
+
+    def sample_tensors(self, batch_size, beta):
+        """
+        Sample and gather a minibatch: (state, action, reward, next_state, done, is_weights, idxs, sequences).
+
+        `sequences` are the slots' write sequences, so later priority updates can skip rewritten slots.
+        """
+        with self.lock:
+            idxs, is_weights = self._sample_indices(batch_size, beta)
+
+            # States may be stored at reduced precision (e.g. the shared float16 storage); train in float32
+            return (
+                self.states[idxs].float(),
+                self.actions[idxs].unsqueeze(1),
+                self.rewards[idxs],
+                self.next_states[idxs].float(),
+                self.dones[idxs],
+                is_weights,
+                idxs,
+                self.slot_sequence[idxs],
+            )
+
+    def importance_weights(self, idxs, beta, sampled_weights=None):
+        """
+        IS weights of sampled slots under the current priorities, normalized by their maximum.
+
+        A slot whose priority dropped to 0 since sampling (shared storage excludes slots that are being
+        rewritten) would get an infinite weight; it keeps its `sampled_weights` entry instead, or 0
+        without them, and the normalization only covers the other slots.
+        """
+        with self.lock:
+            priorities = self.priorities[idxs]
+            total = self.priorities[:self.size].sum()
+        tiny = torch.finfo(priorities.dtype).tiny
+        live = priorities > 0
+        sampling_probabilities = priorities.clamp_min(tiny) / total.clamp_min(tiny)
+        is_weights = torch.where(live, torch.pow(self.capacity * sampling_probabilities, -beta), 0.0)
+        is_weights = (is_weights / is_weights.max().clamp_min(tiny)).float()
+        if sampled_weights is not None:
+            is_weights = torch.where(live, is_weights, sampled_weights.to(is_weights.device, torch.float32))
+        return is_weights
+
+    def update(self, idxs, errors, sequences=None):
+        """
+        Scatter new priorities for the sampled slots from device TD errors.
+
+        With the `sequences` returned by `sample_tensors`, slots rewritten since the batch was sampled
+        keep their priority, so prefetched batches cannot re-prioritize newer transitions.
+        """
+        if len(idxs) != len(errors):
+            raise ValueError("idxs and errors must have the same length")
+        p = (errors.detach().to(self.device, torch.float64) + 1e-5) ** self.alpha
+        with self.lock:
+            if sequences is not None:
+                sequences = sequences.to(self.device)
+                current = (self.slot_sequence[idxs] == sequences) & (sequences > 0)
+                p = torch.where(current, p, self.priorities[idxs])
+            self.priorities[idxs] = p
+            self.max_priority = torch.maximum(self.max_priority, p.max())
+            self.min_priority = torch.minimum(self.min_priority, p.min())
+
+    def transitions(self):
+        """Yield (priority, transition) pairs from the oldest to the newest transition."""
+        order = list(range(self.size)) if self.size < self.capacity else \
+            [(self.write + i) % self.capacity for i in range(self.capacity)]
+        priorities = self.priorities[order].tolist()
+        for p, slot in zip(priorities, order):
+            yield p, (self.states[slot], int(self.actions[slot]), float(self.rewards[slot]), self.next_states[slot],
+                      float(self.dones[slot]))
+
+    def extend(self, buffer):
+        """Append all transitions of another replay buffer, oldest first, keeping their priorities."""
+        for p, sample in buffer.transitions():
+            self._store(p, sample)
+
+    def merge_restored(self, restored):
+        """
+        Combine this live buffer with a replay buffer restored from disk.
+
+        The restored transitions are older, so the live ones are appended to the restored buffer,
+        which replaces this one.
+        """
+        if isinstance(restored, PrioritizedReplayBuffer):
+            restored = DevicePrioritizedReplayBuffer.from_legacy(restored, self.capacity)
+        restored.extend(self)
+        return restored
+
+    def _slot_components(self):
+        """Report entries of the preallocated per-slot tensors."""
+        return [component(name, tensor.device, tensor.nbytes) for name, tensor in (
+            ('priorities', self.priorities), ('actions', self.actions), ('rewards', self.rewards),
+            ('dones', self.dones), ('slot_sequence', self.slot_sequence))]
+
+    def memory_report(self, state_shape=STATE_SHAPE):
+        """
+        Bytes held by each preallocated tensor. Frame storage is allocated on the first transition;
+        until then its projected size assumes float32 states of `state_shape`.
+        """
+        components = self._slot_components()
+        for name in ('states', 'next_states'):
+            tensor = getattr(self, name)
+            if tensor is not None:
+                components.append(component(name, tensor.device, tensor.nbytes))
+            else:
+                components.append(component(name, self.device, 0,
+                                            self.capacity * math.prod(state_shape) * torch.float32.itemsize))
+        return build_report(self, components)
+
+    @classmethod
+    def from_legacy(cls, buffer, capacity=None):
+        """Convert a SumTree-based PrioritizedReplayBuffer (e.g. an old pickle), oldest transition first."""
+        converted = cls(capacity or buffer.capacity)
+        converted.extend(buffer)
+        converted.max_priority.fill_(buffer.max_priority)
+        converted.min_priority.fill_(buffer.min_priority)
+        return converted
+
     def __len__(self):
         return self.size
 
 
+class CompressedPrioritizedReplayBuffer(DevicePrioritizedReplayBuffer):
+    """
+    DevicePrioritizedReplayBuffer that keeps its frames compressed in host memory.
+
+    States are stored as uint8 pixels in a `FrameStore` (zlib or lz4, optionally delta-encoded
+    against periodic keyframes). A transition whose state is the previous transition's next state
+    (the usual case in the control loop) references the same frame. Sampling collects the payloads
+    under the lock and decompresses the minibatch on the frame store's worker threads outside it.
+    """
+
+    def __init__(self, capacity, codec=None, keyframe_interval=COMPRESSED_KEYFRAME_INTERVAL, workers=2):
+        super().__init__(capacity)
+        self.codec = codec
+        self.keyframe_interval = keyframe_interval
+        self.workers = workers
+        self.frames = None
+        self.state_ids = np.zeros(capacity, dtype=np.int64)
+        self.next_state_ids = np.zeros(capacity, dtype=np.int64)
+        self.last_frame = None
+
+    def __getstate__(self):
+        state = super().__getstate__()
+        state['last_frame'] = None
+        return state
+
+    def _allocate(self, state):
+        # Each transition adds at most two frames; delta frames also need their keyframe
+        self.frames = FrameStore(2 * self.capacity + self.keyframe_interval + 1, tuple(state.shape), self.codec,
+                                 self.keyframe_interval, workers=self.workers)
+
+    def _store(self, p, sample):
+        state, action, reward, next_state, done = sample
+        with self.lock:
+            if self.frames is None:
+                self._allocate(state)
+            slot = self.write
+            if self.last_frame is not None and state is self.last_frame[0]:
+                state_id = self.last_frame[1]
+            else:
+                state_id = self.frames.add(encode_state(state))
+            next_state_id = self.frames.add(encode_state(next_state))
+            self.last_frame = (next_state, next_state_id)
+            self.state_ids[slot] = state_id
+            self.next_state_ids[slot] = next_state_id
+            self.actions[slot] = action
+            self.rewards[slot] = reward
+            self.dones[slot] = done
+            self.writes += 1
+            self.slot_sequence[slot] = self.writes
+            self.priorities[slot] = p
+            self.max_priority = torch.maximum(self.max_priority, self.priorities[slot])
+            self.min_priority = torch.minimum(self.min_priority, self.priorities[slot])
+            self.write = (slot + 1) % self.capacity
+            if self.size < self.capacity:
+                self.size += 1
+
+    def sample_tensors(self, batch_size, beta):
+        with self.lock:
+            idxs, is_weights = self._sample_indices(batch_size, beta)
+            host_idxs = idxs.cpu().numpy()
+            frames = self.frames.payloads_for(np.concatenate([self.state_ids[host_idxs],
+                                                              self.next_state_ids[host_idxs]]))
+            actions, rewards, dones = self.actions[idxs].unsqueeze(1), self.rewards[idxs], self.dones[idxs]
+            sequences = self.slot_sequence[idxs]
+        states = decode_states(self.frames.decode(frames), self.device)
+        return (states[:batch_size], actions, rewards, states[batch_size:], dones, is_weights, idxs, sequences)
+
+    def transitions(self):
+        order = list(range(self.size)) if self.size < self.capacity else \
+            [(self.write + i) % self.capacity for i in range(self.capacity)]
+        priorities = self.priorities[order].tolist()
+        for p, slot in zip(priorities, order):
+            states = decode_states(self.frames.get([self.state_ids[slot], self.next_state_ids[slot]]), self.device)
+            yield p, (states[0], int(self.actions[slot]), float(self.rewards[slot]), states[1],
+                      float(self.dones[slot]))
+
+    def memory_bytes(self):
+        """Bytes held by the compressed frames."""
+        return self.frames.stored_bytes if self.frames is not None else 0
+
+    def memory_report(self, state_shape=STATE_SHAPE):
+        """
+        Bytes held by the per-slot tensors, the frame ids and the compressed frames in host memory.
+        The frames are projected to capacity from the compression achieved so far; while empty, the
+        projection is the uncompressed uint8 size, an upper bound.
+        """
+        components = self._slot_components()
+        components.append(component('frame_ids', 'cpu', self.state_ids.nbytes + self.next_state_ids.nbytes))
+        if self.frames is not None:
+            frames = self.frames
+            # Payloads are bytes objects referenced from a preallocated list
+            payloads = sum(payload is not None for payload in frames.payloads)
+            nbytes = frames.stored_bytes + payloads * sys.getsizeof(b'')
+            components.append(component('frames', 'cpu', nbytes, grown(nbytes, len(self), self.capacity)))
+            components.append(component('frame_index', 'cpu', sys.getsizeof(frames.payloads) + frames.keyframes.nbytes))
+        else:
+            components.append(component('frames', 'cpu', 0, 2 * self.capacity * math.prod(state_shape)))
+        return build_report(self, components)
+
+
 class DQNAgent:
-    def __init__(self, input_channels, action_space, model_file, model_folder):
+    def __init__(self, input_channels, action_space, model_file, model_folder, replay_size=REPLAY_SIZE,
+                 restore_replay=True, start_training=True):
         self.global_step = 0
         self.global_episode = 0
 
         self.state_dim = input_channels
         self.action_space = action_space
-        self.replay_buffer = PrioritizedReplayBuffer(REPLAY_SIZE)
+        self.replay_size = replay_size
+        self.replay_buffer = self.new_replay_buffer()
         self.eval_net = DuelingDQN(input_channels, action_space).to(device)
         self.target_net = DuelingDQN(input_channels, action_space).to(device)
         self.update_target_network()
+        self.target_cache = TargetCache(replay_size, action_space, device) if TARGET_CACHE else None
+        if self.target_cache is not None:
+            self.target_net.eval()
         trainable_params = filter(lambda p: p.requires_grad, self.eval_net.parameters())
         self.optimizer = optim.AdamW(trainable_params, lr=LR, weight_decay=1e-5)
         self.scheduler = lr_scheduler.CosineAnnealingLR(self.optimizer, T_max=100000)
@@ -249,28 +709,75 @@ class DQNAgent:
         self.model_folder = model_folder
         self.model_file = model_file
         self.scaler = GradScaler()
+        self.checkpoints = CheckpointStore(model_folder)
 
         self.save_lock = Lock()
 
+        # Checkpoint every `checkpoint_interval` steps, save the replay buffer every `replay_save_interval`
+        # steps (0 disables replay snapshots); by default once per training wakeup and every 10 wakeups
+        self.checkpoint_interval = TRAINING_STEPS_PER_WAKEUP
+        self.replay_save_interval = 10 * TRAINING_STEPS_PER_WAKEUP
+        self.gradient_accumulation_steps = GRADIENT_ACCUMULATION_STEPS
+        self.batch_sizer = AdaptiveBatchSize(BIG_BATCH_SIZE, ADAPTIVE_BATCH_MIN, ADAPTIVE_BATCH_MAX, TARGET_STEP_TIME,
+                                             TARGET_UPDATES_PER_SEC) if ADAPTIVE_BATCH_SIZE else None
+
         # Added: Initialize best reward
         self.best_reward = -float('inf')
+        # Rolling mean episode reward reported since the last training step, checked against best_reward
+        self.pending_episode_reward = None
 
         # Training thread control
         self.training_thread = None
         self.training_stop_event = Event()
 
-        # Load checkpoint or replay_buffer
-        self.load_largest_replay_buffer()
+        # Restore the replay buffer in the background (transitions are accepted meanwhile) and load the
+        # checkpoint, which only memory-maps weights and optimizer state
+        self.replay_swap_lock = Lock()
+        self.replay_restored = Event()
+        if restore_replay:
+            self.start_replay_restore()
+        else:
+            self.replay_restored.set()
         self.load_checkpoint_or_model()
 
+        # Network used by choose_action: eval_net itself, its quantized copy on CPU-only machines or its
+        # ONNX export
+        self.actor_net = self.eval_net
+        self.quantized_actor = QUANTIZED_ACTOR and device.type == 'cpu'
+        self.onnx_actor = ONNX_ACTOR and not self.quantized_actor
+        self.actor_refresher = None
+        if self.quantized_actor:
+            self.load_quantized_actor()
+            self.actor_refresher = ActorRefresher('quantized', build_quantized_actor, self.set_actor,
+                                                  ACTOR_REFRESH_INTERVAL, QUANTIZED_MIN_AGREEMENT)
+        elif self.onnx_actor:
+            self.load_onnx_actor()
+            self.actor_refresher = ActorRefresher('ONNX', onnx_actor_builder(self.onnx_actor_path()),
+                                                  self.set_onnx_actor, ACTOR_REFRESH_INTERVAL, ONNX_MIN_AGREEMENT)
+
         self.writer = SummaryWriter(log_dir='./logs')
+        self.metrics = MetricsWriter(self.writer, flush_interval=METRICS_FLUSH_INTERVAL)
+
+        # Report the replay footprint once up front, so a capacity that cannot fit is flagged before it fills
+        self.last_memory_report = 0.0
+        if REPLAY_MEMORY_REPORT_INTERVAL:
+            self.report_replay_memory()
 
         # Start training thread
-        self.start_training_thread()
+        if start_training:
+            self.start_training_thread()
+
+    def new_replay_buffer(self):
+        """Create an empty replay buffer of the configured kind and capacity."""
+        if COMPRESSED_REPLAY:
+            return CompressedPrioritizedReplayBuffer(self.replay_size)
+        if DEVICE_REPLAY:
+            return DevicePrioritizedReplayBuffer(self.replay_size)
+        return PrioritizedReplayBuffer(self.replay_size)
 
     def initialize_networks(self):
         """Initialize networks with random weights."""
-        print("Initializing evaluation and target networks with random weights.")
+        logger.info("Initializing evaluation and target networks with random weights.")
         self.eval_net.apply(self._init_weights)
         self.target_net.load_state_dict(self.eval_net.state_dict())
         # Reset optimizer and scheduler
@@ -297,75 +804,191 @@ class DQNAgent:
             update_interval = 18
         if self.global_step % update_interval == 0:
             self.target_net.load_state_dict(self.eval_net.state_dict())
-            print(f"Target network updated at step {self.global_step}")
+            if getattr(self, 'target_cache', None) is not None:
+                self.target_cache.clear()
+            logger.info(f"Target network updated at step {self.global_step}")
 
+    @traced('agent.choose_action')
+    @profiled(actor_profiler)
+    @torch.no_grad()
     def choose_action(self, state, action_mask):
+        """Epsilon-greedy action among the valid actions of `action_mask` (an ActionMask or a 0/1 sequence)."""
+        if not isinstance(action_mask, ActionMask):
+            action_mask = ActionMask(action_mask)
         if random.random() <= self.epsilon:
-            valid_actions = [i for i, valid in enumerate(action_mask) if valid]
-            if valid_actions:
-                action = random.choice(valid_actions)
+            if action_mask.valid_actions:
+                action = random.choice(action_mask.valid_actions)
             else:
                 action = None
         else:
             state = state.unsqueeze(0).to(device)
             if len(state.shape) == 4:
-                q_values = self.eval_net(state).squeeze(0)
-                action_mask_tensor = torch.FloatTensor(action_mask).to(device)
-                masked_q_values = q_values * action_mask_tensor + (1 - action_mask_tensor) * (-1e9)
+                q_values = self.actor_net(state).squeeze(0)
+                masked_q_values = q_values.masked_fill(~action_mask.to_tensor(q_values.device), -1e9)
                 action = torch.argmax(masked_q_values).item()
             else:
                 raise ValueError("State input must have 4 dimensions: [batch, channels, height, width]")
         self.epsilon = FINAL_EPSILON + (INITIAL_EPSILON - FINAL_EPSILON) * math.exp(-1. * self.global_step / EPSILON_DECAY)
         return action
 
+    def load_quantized_actor(self):
+        """Act with the quantized actor exported by `python -m dqn.quantize` if it matches the loaded weights."""
+        from dqn.quantize import load_quantized_actor, QUANTIZED_ACTOR_FILE
+        try:
+            loaded = load_quantized_actor(os.path.join(self.model_folder, QUANTIZED_ACTOR_FILE))
+        except Exception as e:
+            logger.error(f"Failed to load quantized actor: {e}")
+            return
+        if loaded is not None and loaded[1] == self.global_step:
+            self.actor_net = loaded[0]
+            logger.info(f"Acting with the quantized actor for step {self.global_step}.")
+
+    def refresh_quantized_actor(self):
+        """Queue a re-quantization of eval_net, calibrated and checked on states sampled from the replay buffer."""
+        self.actor_refresher.submit(self.eval_net, self.global_step,
+                                    lambda: self.replay_buffer.sample_tensors(QUANTIZED_CALIBRATION_SIZE, self.beta)[0])
+
+    def set_actor(self, actor, global_step):
+        """Act with a rebuilt actor network, or with eval_net itself if `actor` is None."""
+        self.actor_net = self.eval_net if actor is None else actor
+
+    def load_onnx_actor(self):
+        """Act with the ONNX actor exported by `python -m dqn.onnx_export` if it matches the loaded weights."""
+        from dqn.onnx_actor import load_onnx_actor
+        try:
+            actor = load_onnx_actor(self.onnx_actor_path())
+        except Exception as e:
+            logger.error(f"Failed to load ONNX actor: {e}")
+            return
+        if actor is not None and actor.global_step == self.global_step:
+            self.actor_net = actor
+            logger.info(f"Acting with the ONNX actor for step {self.global_step}.")
+
+    def onnx_actor_path(self):
+        from dqn.onnx_actor import ONNX_ACTOR_FILE
+        return os.path.join(self.model_folder, ONNX_ACTOR_FILE)
+
+    def refresh_onnx_actor(self):
+        """Queue a re-export of eval_net to ONNX, checked against eval_net on states sampled from the replay buffer."""
+        self.actor_refresher.submit(self.eval_net, self.global_step,
+                                    lambda: self.replay_buffer.sample_tensors(ONNX_CHECK_SIZE, self.beta)[0])
+
+    def set_onnx_actor(self, actor, global_step):
+        """Act with a checked ONNX export and move it into place for the next start, or discard a rejected one."""
+        try:
+            commit_onnx_actor(self.onnx_actor_path(), actor is not None)
+        except OSError as e:
+            logger.error(f"Failed to move the ONNX actor into place: {e}")
+        self.set_actor(actor, global_step)
+
+    @traced('agent.store_transition')
     def store_transition(self, state, action, reward, next_state, done):
-        self.replay_buffer.add(self.replay_buffer.max_priority, (state, action, reward, next_state, done))
-
-    def log_metrics(self, loss, reward_sum, q_max, q_min, q_mean, target_q_max, target_q_min, target_q_mean,
-                    total_norm):
-        self.writer.add_scalar('Loss/train', loss, self.global_step)
-        self.writer.add_scalar('Epsilon', self.epsilon, self.global_step)
-        self.writer.add_scalar('Beta', self.beta, self.global_step)
-        self.writer.add_scalar('Total reward', reward_sum, self.global_step)
-
-        self.writer.add_scalar('Q-values/max', q_max, self.global_step)
-        self.writer.add_scalar('Q-values/min', q_min, self.global_step)
-        self.writer.add_scalar('Q-values/mean', q_mean, self.global_step)
-
-        self.writer.add_scalar('Target Q-values/max', target_q_max, self.global_step)
-        self.writer.add_scalar('Target Q-values/min', target_q_min, self.global_step)
-        self.writer.add_scalar('Target Q-values/mean', target_q_mean, self.global_step)
+        with self.replay_swap_lock:
+            self.replay_buffer.add(self.replay_buffer.max_priority, (state, action, reward, next_state, done))
 
-        self.writer.add_scalar('Gradient norm', total_norm, self.global_step)
-
-        # Log current learning rate
-        current_lr = self.optimizer.param_groups[0]['lr']
-        self.writer.add_scalar('Learning Rate', current_lr, self.global_step)
+    def log_metrics(self, stats, q_values, td_errors):
+        """
+        Queue training statistics for the background metrics writer.
 
-    def train_step(self):
-        """Perform a single training step."""
-        # Update Beta value for prioritized experience replay
-        self.beta = min(1.0, self.beta + (1.0 - BETA_START) / BETA_FRAMES)
+        Args:
+            stats (dict): Host scalar statistics of the step, keyed by TRAINING_STATS names.
+            q_values (np.ndarray): Q-values of the taken actions, logged as a histogram.
+            td_errors (np.ndarray): TD errors, logged as a histogram.
+        """
+        scalars = {
+            'Loss/train': stats['loss'],
+            'Epsilon': self.epsilon,
+            'Beta': self.beta,
+            'Total reward': stats['reward_sum'],
+            'Q-values/max': stats['q_max'],
+            'Q-values/min': stats['q_min'],
+            'Q-values/mean': stats['q_mean'],
+            'Target Q-values/max': stats['target_q_max'],
+            'Target Q-values/min': stats['target_q_min'],
+            'Target Q-values/mean': stats['target_q_mean'],
+            'Gradient norm': stats['total_norm'],
+            # Log current learning rate
+            'Learning Rate': self.optimizer.param_groups[0]['lr'],
+        }
+        if self.target_cache is not None:
+            scalars['Target cache/hit rate'] = self.target_cache.hit_rate()
+        if self.batch_sizer is not None:
+            batch_stats = self.batch_sizer.stats()
+            scalars.update({
+                'Learner/BatchSize': batch_stats['batch_size'],
+                'Learner/StepTimeMs': batch_stats['step_time_ms'],
+                'Learner/UpdatesPerSec': batch_stats['updates_per_sec'],
+                'Learner/SamplesPerSec': batch_stats['samples_per_sec'],
+            })
+        self.metrics.add_scalars(scalars, self.global_step)
+        if HISTOGRAM_INTERVAL and self.global_step % HISTOGRAM_INTERVAL == 0:
+            self.metrics.add_histogram('Q-values/taken', q_values, self.global_step)
+            self.metrics.add_histogram('TD errors', td_errors, self.global_step)
+
+    @property
+    def batch_size(self):
+        """Minibatch size of the next learner update."""
+        return self.batch_sizer.batch_size if self.batch_sizer is not None else BIG_BATCH_SIZE
+
+    @traced('agent.sample_batch')
+    def sample_batch(self, batch_size=BIG_BATCH_SIZE, pin_memory=False):
+        """
+        Sample a minibatch from the replay buffer and collate it onto the learner device.
 
-        # Sample from replay buffer
-        samples, idxs, is_weights = self.replay_buffer.sample(BIG_BATCH_SIZE, self.beta)
-        batch = list(zip(*samples))
-        state_batch = torch.stack(batch[0]).to(device, non_blocking=True)
-        action_batch = torch.tensor(batch[1], dtype=torch.long, device=device).unsqueeze(1)
-        reward_batch = torch.tensor(batch[2], dtype=torch.float32, device=device)
-        next_state_batch = torch.stack(batch[3]).to(device, non_blocking=True)
-        done_batch = torch.tensor(batch[4], dtype=torch.float32, device=device)
-        is_weights = torch.tensor(is_weights, dtype=torch.float32, device=device)
+        With `pin_memory`, host tensors are staged in pinned memory so the copy to a CUDA device is
+        asynchronous. Returns (state, action, reward, next_state, done, is_weights, idxs, sequences), where
+        `sequences` are the write sequences of the sampled slots (None for the SumTree buffer).
+        """
+        *tensors, idxs, sequences = self.replay_buffer.sample_tensors(batch_size, self.beta)
+        if pin_memory and device.type == 'cuda':
+            tensors = [t if t.is_cuda else t.pin_memory() for t in tensors]
+        tensors = [t.to(device, non_blocking=True) for t in tensors]
+        return (*tensors, idxs, sequences)
+
+    def target_q_values(self, next_state_batch, idxs, sequences):
+        """Target-net Q-values for a batch, served from the target cache where possible."""
+        if self.target_cache is None or sequences is None:
+            return self.target_net(next_state_batch)
+        return self.target_cache.target_q_values(self.target_net, next_state_batch, idxs, sequences)
+
+    def importance_weights(self, idxs, is_weights):
+        """IS weights of a (possibly prefetched) batch under the current priorities, when the buffer can provide them."""
+        if not hasattr(self.replay_buffer, 'importance_weights'):
+            return is_weights
+        return self.replay_buffer.importance_weights(idxs, self.beta, is_weights).to(device, non_blocking=True)
+
+    def accumulate_gradients(self, batch, scale=1.0):
+        """
+        Forward and backward one minibatch, adding `scale` times its loss gradient to the parameters.
 
-        with autocast(device_type=device.type):
-            # Current Q values
-            q_values = self.eval_net(state_batch).gather(1, action_batch).squeeze(1)
+        Returns:
+            tuple: Detached (loss, reward_batch, q_values, target_q_values, td_errors) of the minibatch.
+        """
+        state_batch, action_batch, reward_batch, next_state_batch, done_batch, is_weights, idxs, sequences = batch
+        # Prefetched batches were sampled a few priority updates ago; weight them by the current priorities
+        is_weights = self.importance_weights(idxs, is_weights)
+        if sequences is not None:
+            # Sequence 0 marks rows torn by a concurrent write to shared replay storage; they do not train
+            is_weights = is_weights * (sequences > 0).to(is_weights.device, is_weights.dtype)
+
+        with torch.profiler.record_function('train_step.forward'), autocast(device_type=device.type):
+            if FUSED_EVAL_FORWARD:
+                # Current Q values and Double DQN action selection from one eval_net forward
+                batch_size = state_batch.shape[0]
+                with split_batch_norm(self.eval_net):
+                    all_q_values = self.eval_net(torch.cat([state_batch, next_state_batch]))
+                q_values = all_q_values[:batch_size].gather(1, action_batch).squeeze(1)
+                next_actions = all_q_values[batch_size:].detach().argmax(1, keepdim=True)
+            else:
+                # Current Q values
+                q_values = self.eval_net(state_batch).gather(1, action_batch).squeeze(1)
 
             # Calculate target Q values
             with torch.no_grad():
                 # Double DQN: Action selection by eval_net, Q values by target_net
-                next_actions = self.eval_net(next_state_batch).argmax(1, keepdim=True)
-                next_q_values = self.target_net(next_state_batch).gather(1, next_actions).squeeze(1)
+                if not FUSED_EVAL_FORWARD:
+                    next_actions = self.eval_net(next_state_batch).argmax(1, keepdim=True)
+                next_q_values = self.target_q_values(next_state_batch, idxs, sequences).gather(1, next_actions).squeeze(1)
                 target_q_values = reward_batch + (1 - done_batch) * GAMMA * next_q_values
 
             # TD errors
@@ -374,101 +997,198 @@ class DQNAgent:
             # Compute loss using importance sampling weights
             loss = (is_weights * F.smooth_l1_loss(q_values, target_q_values, reduction='none')).mean()
 
-        # Backpropagation and optimization
-        self.optimizer.zero_grad()
-        self.scaler.scale(loss).backward()
-
-        # Gradient clipping
-        self.scaler.unscale_(self.optimizer)
-        total_norm = torch.nn.utils.clip_grad_norm_(self.eval_net.parameters(), max_norm=1)
-
-        # Optimizer step
-        self.scaler.step(self.optimizer)
-        self.scaler.update()
+        with torch.profiler.record_function('train_step.backward'):
+            self.scaler.scale(loss * scale).backward()
+        return loss.detach(), reward_batch, q_values.detach(), target_q_values, td_errors.detach()
 
-        # Update learning rate scheduler
-        self.scheduler.step()
+    @traced('agent.train_step')
+    @profiled(learner_profiler, step_attr='global_step')
+    def train_step(self, batch=None):
+        """
+        Perform a single training step, on a prefetched batch from `sample_batch` if one is given.
 
-        # Compute total reward
-        reward_sum = torch.sum(reward_batch).item()
+        `batch` may also be a list of batches whose gradients are accumulated into one optimizer step.
+        Without a batch, `gradient_accumulation_steps` batches are sampled. Its phases are labelled
+        'train_step.<phase>' for torch.profiler (e.g. benchmarks/bench_dqn.py and the on-demand profiles).
+        """
+        step_start = time.perf_counter()
+        # Update Beta value for prioritized experience replay
+        self.beta = min(1.0, self.beta + (1.0 - BETA_START) / BETA_FRAMES)
 
-        # Compute Q value statistics
-        q_max = q_values.max().item()
-        q_min = q_values.min().item()
-        q_mean = q_values.mean().item()
+        # Sample from replay buffer
+        if batch is None:
+            with torch.profiler.record_function('train_step.sample'):
+                batches = [self.sample_batch(self.batch_size) for _ in range(self.gradient_accumulation_steps)]
+        else:
+            batches = batch if isinstance(batch, list) else [batch]
 
-        # Compute target Q value statistics
-        target_q_max = target_q_values.max().item()
-        target_q_min = target_q_values.min().item()
-        target_q_mean = target_q_values.mean().item()
+        # Backpropagation, accumulated over the minibatches
+        self.optimizer.zero_grad()
+        results = [self.accumulate_gradients(b, 1.0 / len(batches)) for b in batches]
+        losses, reward_batches, q_values, target_q_values, td_errors = (list(column) for column in zip(*results))
+        q_values, target_q_values = torch.cat(q_values), torch.cat(target_q_values)
+
+        with torch.profiler.record_function('train_step.optimizer'):
+            # Gradient clipping
+            self.scaler.unscale_(self.optimizer)
+            total_norm = torch.nn.utils.clip_grad_norm_(self.eval_net.parameters(), max_norm=1)
+
+            # Optimizer step
+            self.scaler.step(self.optimizer)
+            self.scaler.update()
+
+            # Update learning rate scheduler
+            self.scheduler.step()
+
+        with torch.profiler.record_function('train_step.stats'):
+            # Reduce all statistics on the device and bring them, the Q-values and the TD errors to the host
+            # in a single transfer
+            stats = torch.stack([
+                torch.stack(losses).float().mean(),
+                torch.stack([r.sum() for r in reward_batches]).sum(),
+                q_values.max().float(),
+                q_values.min().float(),
+                q_values.float().mean(),
+                target_q_values.max().float(),
+                target_q_values.min().float(),
+                target_q_values.float().mean(),
+                total_norm.float(),
+            ])
+            batch_size = q_values.shape[0]
+            abs_td_errors = [e.float().abs() for e in td_errors]
+            host = torch.cat([stats, q_values.float()] + abs_td_errors).cpu().numpy()
+            stats = dict(zip(TRAINING_STATS, host[:len(TRAINING_STATS)].tolist()))
+            host_q_values = host[len(TRAINING_STATS):len(TRAINING_STATS) + batch_size]
+            host_abs_td_errors = host[len(TRAINING_STATS) + batch_size:]
+
+        # The host transfer waited for the device, so this is the full update time
+        if self.batch_sizer is not None:
+            self.batch_sizer.observe(time.perf_counter() - step_start)
 
         # Log metrics
-        self.log_metrics(
-            loss.item(),
-            reward_sum,
-            q_max,
-            q_min,
-            q_mean,
-            target_q_max,
-            target_q_min,
-            target_q_mean,
-            total_norm
-        )
-
-        # Check and save best model
-        self.check_and_save_best_model(reward_sum)
-
-        # Calculate and update priorities in prioritized experience replay
-        td_errors_cpu = td_errors.detach().cpu().numpy()
-        abs_td_errors = np.abs(td_errors_cpu)
-        self.replay_buffer.update(idxs, abs_td_errors)
+        self.log_metrics(stats, host_q_values, host_abs_td_errors)
+
+        # Check and save best model against the latest episode reward reported by the control loop
+        if self.pending_episode_reward is not None:
+            episode_reward, self.pending_episode_reward = self.pending_episode_reward, None
+            self.check_and_save_best_model(episode_reward)
+
+        with torch.profiler.record_function('train_step.priorities'):
+            # Update priorities in prioritized experience replay, skipping slots rewritten since sampling
+            offset = 0
+            for b, errors in zip(batches, abs_td_errors):
+                idxs, sequences = b[6], b[7]
+                if self.replay_buffer.priorities_on_device:
+                    self.replay_buffer.update(idxs, errors, sequences)
+                else:
+                    self.replay_buffer.update(idxs, host_abs_td_errors[offset:offset + len(errors)])
+                offset += len(errors)
 
         # Periodically update target network
         self.update_target_network()
 
         # Periodically save model checkpoints
-        self.save_checkpoint()
+        if self.global_step % self.checkpoint_interval == 0:
+            self.save_checkpoint()
 
         # Increment global_step
         self.global_step += 1
 
-        # Save replay buffer every 10 steps
-        if self.global_step % 10 == 0:
+        # Save replay buffer every `replay_save_interval` steps
+        if self.replay_save_interval and self.global_step % self.replay_save_interval == 0:
             replay_buffer_path = os.path.join(self.model_folder, f"replay_buffer_size_{len(self.replay_buffer)}.pkl.gz")
             self.save_replay_buffer_async(replay_buffer_path)
 
+    def train_steps(self, steps, prefetch_depth=PREFETCH_DEPTH):
+        """Run `steps` optimizer steps back to back on batches sampled ahead by a BatchPrefetcher."""
+        prefetcher = BatchPrefetcher(lambda: self.sample_batch(self.batch_size, pin_memory=True), depth=prefetch_depth)
+        try:
+            for _ in range(steps):
+                if self.training_stop_event.is_set():
+                    break
+                self.train_step([prefetcher.get() for _ in range(self.gradient_accumulation_steps)])
+        finally:
+            prefetcher.stop()
+
     def training_loop(self):
         """Continuous training loop running in a separate thread."""
         while not self.training_stop_event.is_set():
+            self.maybe_report_replay_memory()
             buffer_length = len(self.replay_buffer)
-            if buffer_length >= 3500:
-                print(f"Starting training step with buffer size: {buffer_length}")
-                self.train_step()
-                print(f"Completed training step. Current step: {self.global_step}")
-                time.sleep(60)
+            if self.replay_restored.is_set() and buffer_length >= TRAINING_START_SIZE:
+                logger.info(f"Starting {TRAINING_STEPS_PER_WAKEUP} training steps with buffer size: {buffer_length}")
+                self.train_steps(TRAINING_STEPS_PER_WAKEUP)
+                if self.quantized_actor:
+                    self.refresh_quantized_actor()
+                elif self.onnx_actor:
+                    self.refresh_onnx_actor()
+                logger.info(f"Completed training steps. Current step: {self.global_step}")
+                self.training_stop_event.wait(TRAINING_WAKEUP_INTERVAL)
             else:
-                print(f"Current buffer size is: {buffer_length}")
+                logger.info(f"Current buffer size is: {buffer_length}")
                 time.sleep(5)
 
+    def report_replay_memory(self):
+        """
+        Log the replay buffer's memory by component and device with its projected footprint at
+        capacity, warn if that would not fit in the available memory, and record the totals as metrics.
+
+        Returns:
+            dict: The report of `memory_report`.
+        """
+        self.last_memory_report = time.monotonic()
+        try:
+            report = self.replay_buffer.memory_report()
+        except Exception as e:
+            logger.error(f"Failed to build the replay memory report: {e}")
+            return None
+        logger.info(format_report(report))
+        for message in footprint_warnings(report):
+            logger.warning(message)
+        self.metrics.add_scalars({'Replay/MemoryBytes': report['bytes'],
+                                  'Replay/ProjectedBytes': report['projected_bytes'],
+                                  'Replay/BytesPerTransition': report['bytes_per_transition']}, self.global_step)
+        return report
+
+    def maybe_report_replay_memory(self):
+        """Report the replay memory if REPLAY_MEMORY_REPORT_INTERVAL seconds passed since the last report."""
+        interval = REPLAY_MEMORY_REPORT_INTERVAL
+        if interval and time.monotonic() - self.last_memory_report >= interval:
+            self.report_replay_memory()
+
     def start_training_thread(self):
         """Start the training thread."""
         self.training_thread = threading.Thread(target=self.training_loop, daemon=True)
         self.training_thread.start()
 
+    def close_metrics(self):
+        """Flush queued metrics and close the SummaryWriter."""
+        self.metrics.close()
+        self.writer.close()
+
     def stop_training_thread(self):
         """Stop the training thread."""
         self.training_stop_event.set()
         if self.training_thread is not None:
             self.training_thread.join()
-            print("Training thread stopped.")
+            logger.info("Training thread stopped.")
 
-    def check_and_save_best_model(self, reward_sum):
+    def report_episode_reward(self, reward_mean):
+        """
+        Report the rolling mean episode reward of the control loop. It is compared with the best one on
+        the next training step, so the best model is saved from the training thread with consistent weights.
         """
-        Check if the current reward exceeds the best reward, and if so, save the model as the best model.
+        self.pending_episode_reward = reward_mean
+
+    def check_and_save_best_model(self, reward_mean):
+        """
+        Check if the rolling mean episode reward exceeds the best one, and if so, save the model as the best model.
+
+        Batch reward sums are not used, as they grow with the (adaptive) batch size.
         """
-        if reward_sum > self.best_reward:
-            print(f"New best reward: {reward_sum} (previous best: {self.best_reward})")
-            self.best_reward = reward_sum
+        if reward_mean > self.best_reward:
+            logger.info(f"New best mean episode reward: {reward_mean} (previous best: {self.best_reward})")
+            self.best_reward = reward_mean
             self.save_best_model()
 
     def save_replay_buffer(self, path):
@@ -476,12 +1196,14 @@ class DQNAgent:
         temp_path = f"{path}.tmp"
         with self.save_lock:
             try:
+                size = len(self.replay_buffer)
                 with gzip.open(temp_path, 'wb') as f:
                     pickle.dump(self.replay_buffer, f)
                 os.replace(temp_path, path)
-                print(f"Replay buffer saved to {path}")
+                self.checkpoints.add_replay_buffer(os.path.basename(path), size)
+                logger.info(f"Replay buffer saved to {path}")
             except Exception as e:
-                print(f"Failed to save replay buffer to {path}: {e}")
+                logger.error(f"Failed to save replay buffer to {path}: {e}")
                 if os.path.exists(temp_path):
                     os.remove(temp_path)
 
@@ -490,29 +1212,74 @@ class DQNAgent:
         thread = threading.Thread(target=self.save_replay_buffer, args=(path,))
         thread.start()
 
-    def save_checkpoint(self):
-        # Save the model checkpoint
-        checkpoint_path = os.path.join(self.model_folder, f"checkpoint_step_{self.global_step}.pth")
-        torch.save({
+    def checkpoint_meta(self):
+        """Counters stored with a checkpoint in the manifest."""
+        return {
             'global_step': self.global_step,
             'global_episode': self.global_episode,
-            'model_state_dict': self.eval_net.state_dict(),
-            'optimizer_state_dict': self.optimizer.state_dict(),
-            'scheduler_state_dict': self.scheduler.state_dict(),
             'epsilon': self.epsilon,
             'beta': self.beta,
             'best_reward': self.best_reward,
-        }, checkpoint_path)
-        print(f"Checkpoint saved at step {self.global_step} to {checkpoint_path}")
+            'best_reward_metric': BEST_REWARD_METRIC,
+        }
+
+    def training_state(self):
+        """Optimizer, scheduler and scaler state, stored apart from the network weights."""
+        return {
+            'optimizer_state_dict': self.optimizer.state_dict(),
+            'scheduler_state_dict': self.scheduler.state_dict(),
+            'scaler_state_dict': self.scaler.state_dict(),
+        }
+
+    def save_checkpoint(self):
+        # Save the model checkpoint; the manifest keeps the last checkpoints and deletes older ones
+        name = f"step_{self.global_step:08d}"
+        self.checkpoints.save(name, self.eval_net.state_dict(), self.training_state(), self.checkpoint_meta())
+        logger.info(f"Checkpoint saved at step {self.global_step} to {self.checkpoints.path(name, '')}")
 
         with open(os.path.join(self.model_folder, "last_step.txt"), "w") as f:
             f.write(str(self.global_step))
 
-        # Manage old checkpoints and replay buffer files
-        self.manage_old_checkpoints()
+    def restore_checkpoint(self, entry, load_training_state=True):
+        """
+        Restore the networks and counters from a manifest checkpoint entry.
+
+        Args:
+            entry (dict): Entry returned by `CheckpointStore.latest` or `CheckpointStore.best`.
+            load_training_state (bool): Also restore optimizer, scheduler and scaler state.
+        """
+        weights = self.checkpoints.load_weights(entry, map_location=device)
+        self.eval_net.load_state_dict(weights)
+        self.target_net.load_state_dict(weights)  # Ensure target_net is synced
+        if load_training_state:
+            training_state = self.checkpoints.load_training_state(entry, map_location=device)
+            self.optimizer.load_state_dict(training_state['optimizer_state_dict'])
+            self.scheduler.load_state_dict(training_state['scheduler_state_dict'])
+            self.scaler.load_state_dict(training_state['scaler_state_dict'])
+        self.global_step = entry.get('global_step', 0)
+        self.global_episode = entry.get('global_episode', 0)
+        self.epsilon = entry.get('epsilon', INITIAL_EPSILON)
+        self.beta = entry.get('beta', BETA_START)
+        # Older checkpoints kept the best batch reward sum, which is not comparable
+        if entry.get('best_reward_metric') == BEST_REWARD_METRIC:
+            self.best_reward = entry.get('best_reward', -float('inf'))
+        else:
+            self.best_reward = -float('inf')
 
     def load_checkpoint_or_model(self):
-        # Load the model checkpoint
+        # Load the latest checkpoint recorded in the manifest
+        entry = self.checkpoints.latest()
+        if entry is not None:
+            try:
+                self.restore_checkpoint(entry)
+                logger.info(f"Checkpoint {entry['name']} loaded successfully. Global Step: {self.global_step}, "
+                            f"Best Reward: {self.best_reward}")
+                self.checkpoints.prune_legacy_files()
+                return
+            except Exception as e:
+                logger.error(f"Failed to load checkpoint {entry['name']}: {e}")
+
+        # Fall back to checkpoints written before the manifest format
         checkpoint_dir = self.model_folder
         if os.path.exists(checkpoint_dir) and os.path.isdir(checkpoint_dir):
             checkpoints = sorted(
@@ -522,7 +1289,7 @@ class DQNAgent:
             )
             if checkpoints:
                 checkpoint_path = os.path.join(checkpoint_dir, checkpoints[0])
-                print(f"Loading checkpoint from {checkpoint_path}...\n")
+                logger.info(f"Loading checkpoint from {checkpoint_path}...")
 
                 checkpoint = torch.load(checkpoint_path, map_location=device)
 
@@ -535,19 +1302,23 @@ class DQNAgent:
                 self.global_episode = checkpoint.get('global_episode', 0)
                 self.epsilon = checkpoint.get('epsilon', INITIAL_EPSILON)
                 self.beta = checkpoint.get('beta', BETA_START)
-                self.best_reward = checkpoint.get('best_reward', -float('inf'))  # Restore best reward
+                # Legacy checkpoints kept the best batch reward sum, which is not comparable
+                self.best_reward = -float('inf')
 
-                print(
+                logger.info(
                     f"Checkpoint loaded successfully. Global Step: {self.global_step}, Best Reward: {self.best_reward}")
                 return  # Successfully loaded from checkpoint
 
         # If no checkpoints found, try to load from model_file
-        print("No checkpoints found. Attempting to load model from file...\n")
+        logger.info("No checkpoints found. Attempting to load model from file...")
         self.load_model()
 
     def load_model(self):
-        """Load the model and optimizer state from a file."""
-        if os.path.exists(self.model_file):
+        """Load the model and optimizer state from a file; without a model file, initialize randomly."""
+        if self.model_file is None:
+            logger.info("No model file given. Initializing networks randomly.")
+            self.initialize_networks()
+        elif os.path.isfile(self.model_file):
             try:
                 checkpoint = torch.load(self.model_file, map_location=device)
                 self.eval_net.load_state_dict(checkpoint['model_state_dict'])
@@ -559,105 +1330,122 @@ class DQNAgent:
                 self.beta = checkpoint.get('beta', BETA_START)
                 self.global_step = checkpoint.get('global_step', 0)
                 self.global_episode = checkpoint.get('global_episode', 0)
-                self.best_reward = checkpoint.get('best_reward', -float('inf'))  # Restore best reward
+                # Legacy model files kept the best batch reward sum, which is not comparable
+                self.best_reward = -float('inf')
 
-                print(f"Model loaded successfully from {self.model_file}. Best Reward: {self.best_reward}")
+                logger.info(f"Model loaded successfully from {self.model_file}. Best Reward: {self.best_reward}")
             except Exception as e:
-                print(f"Failed to load model from {self.model_file}: {e}")
-                print("Initializing networks randomly.")
+                logger.error(f"Failed to load model from {self.model_file}: {e}")
+                logger.info("Initializing networks randomly.")
                 self.initialize_networks()
         else:
-            print(f"Model file {self.model_file} does not exist. Initializing networks randomly.")
+            logger.info(f"Model file {self.model_file} does not exist. Initializing networks randomly.")
             self.initialize_networks()
 
-    def load_largest_replay_buffer(self):
-        """Load the replay buffer with the largest size from the model folder."""
+    def find_largest_replay_buffer(self):
+        """Return the path of the largest saved replay buffer in the model folder, or None."""
+        largest = self.checkpoints.largest_replay_buffer()
+        if largest is not None:
+            replay_buffer_path, largest_size = largest
+            logger.info(f"Found replay buffer {replay_buffer_path} with size {largest_size}.")
+            return replay_buffer_path
+
+        # Fall back to scanning for replay buffers saved before the manifest format
         replay_buffer_files = [
             f for f in os.listdir(self.model_folder)
             if f.startswith('replay_buffer_size_') and f.endswith('.pkl.gz')
         ]
-        if replay_buffer_files:
-            # Extract sizes from filenames
-            sizes_and_files = []
-            for filename in replay_buffer_files:
-                try:
-                    size_str = filename[len('replay_buffer_size_'):-len('.pkl.gz')]
-                    size = int(size_str)
-                    sizes_and_files.append((size, filename))
-                except ValueError:
-                    pass
-            if sizes_and_files:
-                # Get the file with the largest size
-                sizes_and_files.sort(reverse=True)
-                largest_size, largest_file = sizes_and_files[0]
-                replay_buffer_path = os.path.join(self.model_folder, largest_file)
-                print(f"Loading replay buffer from {replay_buffer_path} with size {largest_size}...")
-                self.load_replay_buffer(replay_buffer_path)
-            else:
-                print("No valid replay buffer files found. Starting with an empty replay buffer.")
-                self.replay_buffer = PrioritizedReplayBuffer(REPLAY_SIZE)
+        if not replay_buffer_files:
+            logger.info("No replay buffer files found. Starting with an empty replay buffer.")
+            return None
+        # Extract sizes from filenames
+        sizes_and_files = []
+        for filename in replay_buffer_files:
+            try:
+                size_str = filename[len('replay_buffer_size_'):-len('.pkl.gz')]
+                size = int(size_str)
+                sizes_and_files.append((size, filename))
+            except ValueError:
+                pass
+        if not sizes_and_files:
+            logger.info("No valid replay buffer files found. Starting with an empty replay buffer.")
+            return None
+        # Get the file with the largest size
+        sizes_and_files.sort(reverse=True)
+        largest_size, largest_file = sizes_and_files[0]
+        logger.info(f"Found replay buffer {largest_file} with size {largest_size}.")
+        return os.path.join(self.model_folder, largest_file)
+
+    def load_largest_replay_buffer(self):
+        """Load the replay buffer with the largest size from the model folder."""
+        replay_buffer_path = self.find_largest_replay_buffer()
+        if replay_buffer_path is not None:
+            self.load_replay_buffer(replay_buffer_path)
         else:
-            print("No replay buffer files found. Starting with an empty replay buffer.")
-            self.replay_buffer = PrioritizedReplayBuffer(REPLAY_SIZE)
+            self.replay_buffer = self.new_replay_buffer()
 
-    def save_best_model(self):
-        """
-        Save the current best model. You can choose a dedicated filename, such as 'best_model.pth'.
+    def restore_replay_buffer(self):
         """
-        best_model_path = os.path.join(self.model_folder, "best_model.pth")
-        torch.save({
-            'global_step': self.global_step,
-            'global_episode': self.global_episode,
-            'model_state_dict': self.eval_net.state_dict(),
-            'optimizer_state_dict': self.optimizer.state_dict(),
-            'scheduler_state_dict': self.scheduler.state_dict(),
-            'epsilon': self.epsilon,
-            'beta': self.beta,
-            'best_reward': self.best_reward,
-        }, best_model_path)
-        print(f"Best model saved with reward {self.best_reward} at {best_model_path}")
-
-    def manage_old_checkpoints(self, max_checkpoints=8):
-        checkpoints = [f for f in os.listdir(self.model_folder) if
-                       f.startswith("checkpoint_step_") and f.endswith('.pth')]
-
-        if len(checkpoints) > max_checkpoints:
-            checkpoints.sort(key=lambda x: os.path.getmtime(os.path.join(self.model_folder, x)))
-            for checkpoint in checkpoints[:-max_checkpoints]:
-                checkpoint_path = os.path.join(self.model_folder, checkpoint)
-                os.remove(checkpoint_path)
-                print(f"Deleted old checkpoint: {checkpoint_path}")
+        Load the largest saved replay buffer and merge it with the transitions stored meanwhile.
 
-        replay_buffers = [f for f in os.listdir(self.model_folder) if
-                          f.startswith("replay_buffer_size_") and f.endswith('.pkl.gz')]
-
-        valid_replay_buffers = []
-        for f in replay_buffers:
-            try:
-                size_part = f.split('_')[3]
-                size = int(size_part.split('.')[0])
-                valid_replay_buffers.append((f, size))
-            except (IndexError, ValueError):
-                print(f"Invalid replay buffer format: {f}")
-
-        valid_replay_buffers.sort(key=lambda x: (x[1], os.path.getmtime(os.path.join(self.model_folder, x[0]))))
+        Runs on the restore thread; `replay_restored` is set when it finishes, even if nothing was loaded.
+        """
+        try:
+            replay_buffer_path = self.find_largest_replay_buffer()
+            restored = self.read_replay_buffer(replay_buffer_path) if replay_buffer_path is not None else None
+            if restored is not None and len(restored):
+                start_time = time.perf_counter()
+                with self.replay_swap_lock:
+                    live_size = len(self.replay_buffer)
+                    self.replay_buffer = self.replay_buffer.merge_restored(restored)
+                logger.info(f"Merged {len(restored)} restored transitions with {live_size} new ones in "
+                            f"{time.perf_counter() - start_time:.2f}s.")
+        except Exception as e:
+            logger.error(f"Background replay buffer restore failed: {e}")
+        finally:
+            self.replay_restored.set()
+
+    def start_replay_restore(self):
+        """Restore the replay buffer on a background thread; new transitions are accepted meanwhile."""
+        self.replay_restored.clear()
+        thread = threading.Thread(target=self.restore_replay_buffer, name='replay-restore', daemon=True)
+        thread.start()
+        return thread
 
-        for rb_file, _ in valid_replay_buffers[:-2]:
-            rb_file_path = os.path.join(self.model_folder, rb_file)
-            os.remove(rb_file_path)
-            print(f"Deleted old replay buffer: {rb_file_path}")
+    def save_best_model(self):
+        """
+        Save the current best model as the manifest's best checkpoint.
+        """
+        self.checkpoints.save(BEST_NAME, self.eval_net.state_dict(), self.training_state(), self.checkpoint_meta(),
+                              best=True)
+        logger.info(f"Best model saved with reward {self.best_reward} at "
+                    f"{self.checkpoints.path(BEST_NAME, '')}")
+
+    def read_replay_buffer(self, path):
+        """Read a replay buffer from a compressed file; returns None if it cannot be loaded."""
+        if not os.path.exists(path):
+            logger.info(f"Replay buffer file {path} does not exist.")
+            return None
+        try:
+            start_time = time.perf_counter()
+            with gzip.open(path, 'rb') as f:
+                replay_buffer = pickle.load(f)
+            if COMPRESSED_REPLAY and not isinstance(replay_buffer, CompressedPrioritizedReplayBuffer):
+                compressed = CompressedPrioritizedReplayBuffer(self.replay_size)
+                compressed.extend(replay_buffer)
+                replay_buffer = compressed
+            elif DEVICE_REPLAY and isinstance(replay_buffer, PrioritizedReplayBuffer):
+                replay_buffer = DevicePrioritizedReplayBuffer.from_legacy(replay_buffer, self.replay_size)
+            logger.info(f"Replay buffer loaded from {path} in {time.perf_counter() - start_time:.2f}s")
+            return replay_buffer
+        except Exception as e:
+            logger.error(f"Failed to load replay buffer from {path}: {e}")
+            return None
 
     def load_replay_buffer(self, path):
         """Load the replay buffer from a compressed file."""
-        if os.path.exists(path):
-            try:
-                with gzip.open(path, 'rb') as f:
-                    self.replay_buffer = pickle.load(f)
-                print(f"Replay buffer loaded from {path}")
-            except Exception as e:
-                print(f"Failed to load replay buffer from {path}: {e}")
-                print("Starting with an empty replay buffer.")
-                self.replay_buffer = PrioritizedReplayBuffer(REPLAY_SIZE)
-        else:
-            print(f"Replay buffer file {path} does not exist. Starting with an empty replay buffer.")
-            self.replay_buffer = PrioritizedReplayBuffer(REPLAY_SIZE)
+        replay_buffer = self.read_replay_buffer(path)
+        if replay_buffer is None:
+            logger.info("Starting with an empty replay buffer.")
+            replay_buffer = self.new_replay_buffer()
+        self.replay_buffer = replay_buffer
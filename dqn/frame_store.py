@@ -0,0 +1,162 @@
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import torch
+
+try:
+    import lz4.frame as lz4_frame
+except ImportError:
+    lz4_frame = None
+
+# Normalization applied by GameEnvironment.prepare_state; frames are stored as the uint8 pixels before it
+STATE_MEAN = torch.tensor([0.485, 0.456, 0.406]).view(3, 1, 1)
+STATE_STD = torch.tensor([0.229, 0.224, 0.225]).view(3, 1, 1)
+
+
+def default_codec():
+    """Return 'lz4' when the lz4 package is installed, otherwise 'zlib'."""
+    return 'lz4' if lz4_frame is not None else 'zlib'
+
+
+def encode_state(state):
+    """Map a normalized float state [C, H, W] back to its uint8 pixels as a contiguous NumPy array."""
+    pixels = (state.detach().float() * STATE_STD.to(state.device) + STATE_MEAN.to(state.device)) * 255.0
+    return pixels.round_().clamp_(0, 255).to(torch.uint8).cpu().numpy()
+
+
+def decode_states(pixels, target_device):
+    """Normalize a uint8 batch [N, C, H, W] on `target_device`, matching `prepare_state`."""
+    # Move the uint8 pixels (a quarter of the float bytes) and normalize there in one multiply-add
+    img = torch.from_numpy(pixels).to(target_device, non_blocking=True).float()
+    scale = (1.0 / (255.0 * STATE_STD)).to(target_device)
+    bias = (-STATE_MEAN / STATE_STD).to(target_device)
+    return torch.addcmul(bias, img, scale)
+
+
+class FrameStore:
+    """
+    Ring of compressed uint8 frames addressed by ever-increasing frame ids.
+
+    Frames are compressed one by one with zlib or lz4. With `keyframe_interval` > 0 only every
+    `keyframe_interval`-th frame is stored whole; the frames in between are stored as the wrapping
+    uint8 difference to that keyframe, which is mostly zeros for consecutive game frames and
+    compresses much better. A frame id stays readable until its slot or its keyframe's slot is
+    reused, i.e. for at least `capacity - keyframe_interval + 1` newer frames, so the ring must hold
+    every frame referenced by live transitions plus one keyframe interval. Reading an overwritten
+    frame raises KeyError.
+    Batches are decompressed on a small thread pool; zlib and lz4 release the GIL while they work.
+    """
+
+    def __init__(self, capacity, frame_shape, codec=None, keyframe_interval=0, level=1, workers=2):
+        codec = codec or default_codec()
+        if codec == 'lz4' and lz4_frame is None:
+            raise ValueError("codec 'lz4' needs the lz4 package")
+        if codec not in ('zlib', 'lz4', 'none'):
+            raise ValueError(f"Unknown frame codec: {codec}")
+        self.capacity = capacity
+        self.frame_shape = tuple(frame_shape)
+        self.codec = codec
+        self.keyframe_interval = keyframe_interval
+        self.level = level
+        self.workers = workers
+        self.payloads = [None] * capacity
+        self.frame_ids = np.full(capacity, -1, dtype=np.int64)
+        self.keyframes = np.zeros(capacity, dtype=np.int64)
+        self.next_id = 0
+        self.last_keyframe = -1
+        self.last_keyframe_pixels = None
+        self.stored_bytes = 0
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='frame-decode')
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['executor']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if 'frame_ids' not in state:
+            # Stores pickled before frame ids were kept hold the newest `capacity` ids
+            ids = np.arange(max(0, self.next_id - self.capacity), self.next_id, dtype=np.int64)
+            self.frame_ids = np.full(self.capacity, -1, dtype=np.int64)
+            self.frame_ids[ids % self.capacity] = ids
+        self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='frame-decode')
+
+    def _compress(self, pixels):
+        data = pixels.tobytes()
+        if self.codec == 'zlib':
+            return zlib.compress(data, self.level)
+        if self.codec == 'lz4':
+            return lz4_frame.compress(data)
+        return data
+
+    def _decompress(self, payload):
+        if self.codec == 'zlib':
+            data = zlib.decompress(payload)
+        elif self.codec == 'lz4':
+            data = lz4_frame.decompress(payload)
+        else:
+            data = payload
+        return np.frombuffer(data, dtype=np.uint8).reshape(self.frame_shape)
+
+    def add(self, pixels):
+        """Compress a uint8 frame and return its frame id."""
+        frame_id = self.next_id
+        slot = frame_id % self.capacity
+        keyframe = self.keyframe_interval <= 0 or self.last_keyframe < 0 or \
+            frame_id - self.last_keyframe >= self.keyframe_interval
+        if keyframe:
+            payload = self._compress(pixels)
+            self.last_keyframe, self.last_keyframe_pixels = frame_id, pixels
+        else:
+            payload = self._compress(pixels - self.last_keyframe_pixels)
+        if self.payloads[slot] is not None:
+            self.stored_bytes -= len(self.payloads[slot])
+        self.payloads[slot] = payload
+        self.frame_ids[slot] = frame_id
+        self.stored_bytes += len(payload)
+        self.keyframes[slot] = self.last_keyframe
+        self.next_id += 1
+        return frame_id
+
+    def payloads_for(self, frame_ids):
+        """
+        Collect what is needed to decode `frame_ids` later, without decompressing.
+
+        The payloads are immutable bytes, so the result stays valid after the ring moves on; take it
+        under the same lock that guards `add`, then decode outside of it. Raises KeyError for a frame
+        whose payload or keyframe was overwritten.
+        """
+        frames = []
+        for frame_id in frame_ids:
+            slot = frame_id % self.capacity
+            keyframe = int(self.keyframes[slot])
+            if self.frame_ids[slot] != frame_id or self.frame_ids[keyframe % self.capacity] != keyframe:
+                raise KeyError(f"Frame {frame_id} was overwritten")
+            key_payload = None if keyframe == frame_id else self.payloads[keyframe % self.capacity]
+            frames.append((self.payloads[slot], key_payload))
+        return frames
+
+    def decode(self, frames):
+        """Decompress payloads from `payloads_for` on the thread pool into one uint8 array [N, *frame_shape]."""
+        batch = np.empty((len(frames),) + self.frame_shape, dtype=np.uint8)
+        chunk = max(1, -(-len(frames) // self.workers))
+
+        def decode_chunk(start):
+            # Frames of a minibatch often share a keyframe; decompress each one once per chunk
+            keyframes = {}
+            for i in range(start, min(start + chunk, len(frames))):
+                payload, key_payload = frames[i]
+                batch[i] = self._decompress(payload)
+                if key_payload is not None:
+                    key_pixels = keyframes.get(id(key_payload))
+                    if key_pixels is None:
+                        key_pixels = keyframes[id(key_payload)] = self._decompress(key_payload)
+                    batch[i] += key_pixels
+
+        list(self.executor.map(decode_chunk, range(0, len(frames), chunk)))
+        return batch
+
+    def get(self, frame_ids):
+        """Decode frames by id; they must not have been overwritten yet."""
+        return self.decode(self.payloads_for(frame_ids))
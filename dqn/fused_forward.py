@@ -0,0 +1,82 @@
+import contextlib
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+
+
+@contextlib.contextmanager
+def split_batch_norm(module, splits=2):
+    """
+    Make the BatchNorm layers of `module` normalize each of `splits` equal batch chunks on its own.
+
+    In training mode BatchNorm couples all samples of a batch through its statistics. With this,
+    one forward over `torch.cat([a, b])` gives the outputs and running-statistics updates of two
+    separate forwards over `a` and then `b`, while every other layer runs once on the larger batch.
+    """
+    patched = [m for m in module.modules() if isinstance(m, nn.modules.batchnorm._BatchNorm)]
+
+    def make_forward(bn):
+        def forward(x):
+            if not bn.training:
+                return F.batch_norm(x, bn.running_mean, bn.running_var, bn.weight, bn.bias, False, 0.0, bn.eps)
+            if bn.num_batches_tracked is not None:
+                bn.num_batches_tracked.add_(splits)
+            momentum = bn.momentum if bn.momentum is not None else 0.0
+            return torch.cat([F.batch_norm(chunk, bn.running_mean, bn.running_var, bn.weight, bn.bias, True, momentum,
+                                           bn.eps) for chunk in x.chunk(splits)])
+        return forward
+
+    for bn in patched:
+        bn.forward = make_forward(bn)
+    try:
+        yield module
+    finally:
+        for bn in patched:
+            del bn.forward
+
+
+class TargetCache:
+    """
+    Target-network Q-values of replay slots, reused while neither the slot nor the target network changes.
+
+    Entries are tagged with the slot's write sequence, so a rewritten slot misses; `clear` must be
+    called whenever the target network is synced. Only meaningful if the target network's output
+    for a transition does not depend on the rest of the batch, i.e. with the target net in eval mode.
+    """
+
+    def __init__(self, capacity, action_space, device):
+        self.q_values = torch.zeros(capacity, action_space, device=device)
+        self.sequences = torch.full((capacity,), -1, dtype=torch.int64, device=device)
+        self.lookups = 0
+        self.hits = 0
+
+    def clear(self):
+        self.sequences.fill_(-1)
+
+    def target_q_values(self, target_net, next_states, idxs, sequences):
+        """
+        Q-values of `target_net` for `next_states`, computing only the entries missing from the cache.
+
+        Args:
+            target_net (nn.Module): Target network in eval mode.
+            next_states (torch.Tensor): Next states of the sampled transitions.
+            idxs (torch.Tensor): Replay slots of the transitions.
+            sequences (torch.Tensor): Write sequence of each slot when it was sampled; rows with
+                sequence 0 (torn by a concurrent write) are computed but not cached.
+        """
+        idxs = idxs.to(self.sequences.device)
+        sequences = sequences.to(self.sequences.device)
+        q_values = self.q_values[idxs]
+        miss = (self.sequences[idxs] != sequences).nonzero().squeeze(1)
+        self.lookups += len(idxs)
+        self.hits += len(idxs) - len(miss)
+        if len(miss):
+            computed = target_net(next_states[miss]).float()
+            q_values[miss] = computed
+            valid = sequences[miss] > 0
+            self.q_values[idxs[miss[valid]]] = computed[valid]
+            self.sequences[idxs[miss[valid]]] = sequences[miss[valid]]
+        return q_values
+
+    def hit_rate(self):
+        return self.hits / self.lookups if self.lookups else 0.0
@@ -0,0 +1,108 @@
+import logging
+import time
+import torch
+import torch.nn.functional as F
+from dqn.dueling_dqn import device
+from dqn.prefetcher import BatchPrefetcher
+
+logger = logging.getLogger(__name__)
+
+STATE_MEAN = torch.tensor([0.485, 0.456, 0.406]).view(1, 3, 1, 1)
+STATE_STD = torch.tensor([0.229, 0.224, 0.225]).view(1, 3, 1, 1)
+
+
+def preprocess_frames(frames, height=128, width=128, target_device='cpu'):
+    """
+    Turn recorded uint8 game window crops into normalized agent states.
+
+    Matches `GameEnvironment.resize_screen` followed by `GameEnvironment.prepare_state`, batched.
+
+    Args:
+        frames (np.ndarray): uint8 array of shape [N, H, W, 3].
+        height (int): State height.
+        width (int): State width.
+        target_device: Device the states are produced on.
+
+    Returns:
+        torch.Tensor: float32 states of shape [N, 3, height, width].
+    """
+    img = torch.from_numpy(frames).to(target_device).permute(0, 3, 1, 2).float()
+    img = F.interpolate(img, size=(height, width), mode='bilinear', align_corners=False)
+    img = img / 255.0
+    return (img - STATE_MEAN.to(img.device)) / STATE_STD.to(img.device)
+
+
+def load_trajectories(agent, readers, max_transitions=None):
+    """
+    Fill the agent's replay buffer with transitions rebuilt from recorded sessions.
+
+    Consecutive transitions share their state tensors. A CompressedPrioritizedReplayBuffer (the default)
+    stores each shared frame once; a dense DevicePrioritizedReplayBuffer copies it into both the state
+    and next-state slots, about 384 KiB per transition.
+
+    Args:
+        agent (DQNAgent): Agent whose replay buffer is filled.
+        readers (list): `TrajectoryReader` instances, one per session.
+        max_transitions (int): Stop after this many transitions (None loads everything).
+
+    Returns:
+        int: Number of transitions stored.
+    """
+    fields = ['step', 'game_window', 'action', 'reward', 'done']
+    stored = 0
+    for reader in readers:
+        for episode in reader.episodes():
+            pending = None
+            for chunk in reader.iter_episode_chunks(episode, fields):
+                states = preprocess_frames(chunk['game_window'])
+                for i in range(len(states)):
+                    step = int(chunk['step'][i])
+                    if pending is not None and step == pending[0] + 1:
+                        _, state, action, reward, done = pending
+                        agent.store_transition(state, action, reward, states[i], done)
+                        stored += 1
+                        if max_transitions is not None and stored >= max_transitions:
+                            return stored
+                    action = int(chunk['action'][i])
+                    if action >= 0:
+                        pending = (step, states[i], action, float(chunk['reward'][i]), int(chunk['done'][i]))
+                    else:
+                        pending = None
+            logger.info(f"Loaded episode {episode} from {reader.folder}; {stored} transitions in replay buffer.")
+    return stored
+
+
+def run_offline_training(agent, steps, batch_size=None, prefetch_depth=4, log_interval=100):
+    """
+    Run `train_step` back to back on prefetched batches and report gradient steps per second.
+
+    Args:
+        agent (DQNAgent): Agent created with `start_training=False` and a filled replay buffer.
+        steps (int): Number of gradient steps.
+        batch_size (int): Minibatch size; None follows the agent's adaptive batch size.
+        prefetch_depth (int): Number of batches kept ready by the prefetch thread.
+        log_interval (int): Steps between throughput reports.
+
+    Returns:
+        float: Average gradient steps per second over the run.
+    """
+    prefetcher = BatchPrefetcher(lambda: agent.sample_batch(batch_size or agent.batch_size, pin_memory=True),
+                                 depth=prefetch_depth)
+    start_time = time.perf_counter()
+    interval_start = start_time
+    try:
+        for i in range(1, steps + 1):
+            agent.train_step([prefetcher.get() for _ in range(agent.gradient_accumulation_steps)])
+            if i % log_interval == 0 or i == steps:
+                if device.type == 'cuda':
+                    torch.cuda.synchronize()
+                now = time.perf_counter()
+                steps_per_sec = (log_interval if i % log_interval == 0 else i % log_interval) / (now - interval_start)
+                interval_start = now
+                agent.metrics.add_scalars({'Offline/GradientStepsPerSec': steps_per_sec}, agent.global_step)
+                logger.info(f"Offline step {i}/{steps}: {steps_per_sec:.2f} gradient steps/sec")
+    finally:
+        prefetcher.stop()
+    total_rate = steps / (time.perf_counter() - start_time)
+    logger.info(f"Offline training finished: {steps} steps at {total_rate:.2f} gradient steps/sec on {device}.")
+    return total_rate
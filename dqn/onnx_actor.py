@@ -0,0 +1,62 @@
+import json
+import logging
+import os
+import numpy as np
+
+try:
+    import onnxruntime as ort
+except ImportError:
+    ort = None
+
+logger = logging.getLogger(__name__)
+
+ONNX_ACTOR_FILE = 'actor.onnx'
+# Metadata key of the learner step whose weights were exported
+META_KEY = 'meta'
+
+
+class OnnxActor:
+    """
+    DuelingDQN eval net exported by `python -m dqn.onnx_export`, run with onnxruntime.
+
+    This module only needs numpy and onnxruntime, so an acting process built on it starts without
+    torch, torchvision or tensorboard. It can also stand in for `DQNAgent.actor_net`: called with a
+    torch tensor it returns the Q-values as a CPU tensor, so `choose_action` works unchanged.
+    """
+
+    def __init__(self, path, providers=None, threads=None):
+        if ort is None:
+            raise RuntimeError("The ONNX actor needs the onnxruntime package")
+        options = ort.SessionOptions()
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = ort.InferenceSession(path, options, providers=providers or ort.get_available_providers())
+        self.input_name = self.session.get_inputs()[0].name
+        self.output_name = self.session.get_outputs()[0].name
+        meta = self.session.get_modelmeta().custom_metadata_map.get(META_KEY)
+        self.global_step = json.loads(meta).get('global_step', -1) if meta else -1
+
+    def q_values(self, states):
+        """Q-values [N, actions] of float32 states [N, C, H, W] as a numpy array."""
+        return self.session.run([self.output_name], {self.input_name: np.ascontiguousarray(states, np.float32)})[0]
+
+    def __call__(self, states):
+        if isinstance(states, np.ndarray):
+            return self.q_values(states)
+        import torch  # The caller passed a tensor, so torch is already loaded
+        return torch.from_numpy(self.q_values(states.detach().cpu().numpy()))
+
+    def act(self, state, valid_actions=None):
+        """Greedy action for a single state [C, H, W], restricted to `valid_actions` if given."""
+        q_values = self.q_values(state[None])[0]
+        if valid_actions is not None:
+            valid_actions = list(valid_actions)
+            return valid_actions[int(np.argmax(q_values[valid_actions]))]
+        return int(np.argmax(q_values))
+
+
+def load_onnx_actor(path, providers=None):
+    """Return an OnnxActor for `path`, or None if the file does not exist."""
+    if not os.path.exists(path):
+        return None
+    return OnnxActor(path, providers)
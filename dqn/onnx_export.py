@@ -0,0 +1,216 @@
+import argparse
+import contextlib
+import copy
+import json
+import logging
+import os
+import subprocess
+import sys
+import threading
+import time
+import warnings
+import torch
+from dqn.dueling_dqn import DuelingDQN
+from dqn.checkpoints import CheckpointStore
+from dqn.onnx_actor import OnnxActor, ONNX_ACTOR_FILE, META_KEY
+from dqn.quantize import recorded_states
+
+logger = logging.getLogger(__name__)
+
+OPSET_VERSION = 17
+# Repository root, the working directory of the startup measurement processes
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Time from a fresh interpreter to the first action, for each backend
+_TORCH_STARTUP = """
+import time
+start = time.perf_counter()
+import torch
+from dqn.dueling_dqn import DuelingDQN
+net = DuelingDQN(3, {actions}).eval()
+net.load_state_dict(torch.load({weights!r}, map_location='cpu', weights_only=True))
+with torch.no_grad():
+    net(torch.zeros(1, 3, 128, 128)).argmax(1)
+print(time.perf_counter() - start)
+"""
+_ONNX_STARTUP = """
+import time
+start = time.perf_counter()
+import numpy as np
+from dqn.onnx_actor import OnnxActor
+OnnxActor({path!r}).act(np.zeros((3, 128, 128), np.float32))
+print(time.perf_counter() - start)
+"""
+
+
+# Serializes `_export_mode`, so concurrent exports restore the fast path setting they found
+_export_lock = threading.Lock()
+
+
+@contextlib.contextmanager
+def _export_mode():
+    # In eval mode nn.MultiheadAttention takes a fused fast path that has no ONNX symbolic; export
+    # the regular attention ops instead. The switch is process-global: while an export runs (e.g. on
+    # the ActorRefresher thread), forwards on other threads also take the regular path, which is
+    # slower but computes the same attention. The TorchScript-based exporter is deprecated upstream
+    # and warns about traced Python values.
+    _export_lock.acquire()
+    fastpath = torch.backends.mha.get_fastpath_enabled()
+    torch.backends.mha.set_fastpath_enabled(False)
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', DeprecationWarning)
+            warnings.simplefilter('ignore', torch.jit.TracerWarning)
+            warnings.simplefilter('ignore', UserWarning)
+            yield
+    finally:
+        torch.backends.mha.set_fastpath_enabled(fastpath)
+        _export_lock.release()
+
+
+def export_onnx(net, path, global_step, opset=OPSET_VERSION, state_shape=(3, 128, 128)):
+    """
+    Export a DuelingDQN to ONNX for acting with `OnnxActor`.
+
+    The network is copied to the CPU in eval mode and exported with a dynamic batch axis; input
+    'state' is [N, C, H, W] float32, output 'q_values' is [N, actions]. The learner step of the
+    weights is stored in the model metadata. The file is written to a temporary path and moved into
+    place, so a running actor never sees a partial model.
+
+    Args:
+        net (DuelingDQN): Network to export; it is copied, not modified.
+        path (str): Output .onnx file.
+        global_step (int): Learner step of the weights.
+        opset (int): ONNX opset version.
+        state_shape (tuple): Shape of one state.
+    """
+    import onnx
+
+    net = copy.deepcopy(net).cpu().eval()
+    temp_path = f"{path}.tmp"
+    with _export_mode(), torch.no_grad():
+        torch.onnx.export(net, (torch.zeros(1, *state_shape),), temp_path, input_names=['state'],
+                          output_names=['q_values'], dynamic_axes={'state': {0: 'batch'}, 'q_values': {0: 'batch'}},
+                          opset_version=opset, dynamo=False)
+    model = onnx.load(temp_path)
+    onnx.helper.set_model_props(model, {META_KEY: json.dumps({'global_step': global_step})})
+    onnx.save(model, temp_path)
+    os.replace(temp_path, path)
+
+
+def compare_backends(net, actor, states, repeats=20):
+    """
+    Compare argmax actions and batch-1 latency of a PyTorch network and an ONNX actor on CPU.
+
+    Returns:
+        dict: `agreement` (fraction of states with the same greedy action), `max_abs_diff` of the
+        Q-values, `torch_ms` and `onnx_ms`.
+    """
+    net = copy.deepcopy(net).cpu().eval()
+    states = states.detach().float().cpu()
+    with torch.no_grad():
+        torch_q = net(states)
+        onnx_q = actor(states)
+        agreement = (torch_q.argmax(1) == onnx_q.argmax(1)).float().mean().item()
+        max_abs_diff = (torch_q - onnx_q).abs().max().item()
+        latencies = {}
+        for name, model in (('torch_ms', net), ('onnx_ms', actor)):
+            for _ in range(3):
+                model(states[:1])
+            start = time.perf_counter()
+            for i in range(repeats):
+                model(states[i % len(states)].unsqueeze(0))
+            latencies[name] = (time.perf_counter() - start) / repeats * 1000
+    return dict(agreement=agreement, max_abs_diff=max_abs_diff, **latencies)
+
+
+def _startup_seconds(code):
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, '-c', code], cwd=REPO_ROOT, capture_output=True, text=True, check=True)
+    return time.perf_counter() - start, float(result.stdout.strip().splitlines()[-1])
+
+
+def compare_startup(weights_path, onnx_path, action_space=3):
+    """
+    Time a fresh process from launch to its first action, for the PyTorch and the ONNX backend.
+
+    Returns:
+        dict: `torch_startup_s` / `onnx_startup_s` (whole process, interpreter included) and
+        `torch_load_s` / `onnx_load_s` (imports, model load and first action inside the process).
+    """
+    torch_total, torch_load = _startup_seconds(_TORCH_STARTUP.format(actions=action_space, weights=weights_path))
+    onnx_total, onnx_load = _startup_seconds(_ONNX_STARTUP.format(path=onnx_path))
+    return dict(torch_startup_s=torch_total, onnx_startup_s=onnx_total, torch_load_s=torch_load, onnx_load_s=onnx_load)
+
+
+def load_checkpoint(model_folder, checkpoint='latest'):
+    """
+    Weights of a checkpoint: 'latest' or 'best' of the manifest, a checkpoint name of the manifest,
+    or the path of a weights file (a state dict, or a legacy `checkpoint_step_*.pth` dict).
+
+    Returns:
+        tuple: (state dict, learner global step or -1 if unknown, checkpoint name)
+    """
+    checkpoints = CheckpointStore(model_folder)
+    if checkpoint in ('latest', 'best'):
+        entry = checkpoints.latest() if checkpoint == 'latest' else checkpoints.best()
+        if entry is None:
+            raise SystemExit(f"No {checkpoint} manifest checkpoint in {model_folder}")
+    elif checkpoints.manifest and checkpoint in checkpoints.manifest['checkpoints']:
+        latest = checkpoints.latest()
+        entry = latest if latest and latest['name'] == checkpoint else {'name': checkpoint, 'global_step': -1}
+    else:
+        weights = torch.load(checkpoint, map_location='cpu', weights_only=True)
+        name = os.path.basename(checkpoint)
+        if 'model_state_dict' in weights:
+            return weights['model_state_dict'], weights.get('global_step', -1), name
+        return weights, -1, name
+    return checkpoints.load_weights(entry, map_location='cpu'), entry.get('global_step', -1), entry['name']
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export a DuelingDQN checkpoint to ONNX for onnxruntime acting.")
+    parser.add_argument('sessions', nargs='*', help="Recorded session folders for the parity check.")
+    parser.add_argument('--model-folder', default='./models')
+    parser.add_argument('--checkpoint', default='latest',
+                        help="'latest', 'best', a manifest checkpoint name or the path of a weights file.")
+    parser.add_argument('--output', default=None, help=f"ONNX file (default: <model-folder>/{ONNX_ACTOR_FILE}).")
+    parser.add_argument('--action-space', type=int, default=3, help="Number of actions of the network.")
+    parser.add_argument('--opset', type=int, default=OPSET_VERSION)
+    parser.add_argument('--check', type=int, default=256, help="Number of recorded states for the parity check.")
+    parser.add_argument('--min-agreement', type=float, default=0.99,
+                        help="Remove the export if fewer greedy actions agree with PyTorch.")
+    parser.add_argument('--startup', action='store_true', help="Also time process startup to the first action.")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    weights, global_step, name = load_checkpoint(args.model_folder, args.checkpoint)
+    net = DuelingDQN(3, args.action_space)
+    net.load_state_dict(weights)
+    path = args.output or os.path.join(args.model_folder, ONNX_ACTOR_FILE)
+    export_onnx(net, path, global_step, args.opset)
+    print(f"Checkpoint {name} (step {global_step}) exported to {path}")
+
+    if args.sessions:
+        states = recorded_states(args.sessions, args.check)
+        result = compare_backends(net, OnnxActor(path), states)
+        print(f"{result['agreement']:.1%} greedy action agreement on {len(states)} states "
+              f"(max Q difference {result['max_abs_diff']:.2e}), "
+              f"torch {result['torch_ms']:.1f} ms vs onnxruntime {result['onnx_ms']:.1f} ms per action")
+        if result['agreement'] < args.min_agreement:
+            os.remove(path)
+            raise SystemExit(f"Agreement below {args.min_agreement:.0%}; ONNX actor removed.")
+    if args.startup:
+        weights_path = f"{path}.weights.pt"
+        torch.save(net.state_dict(), weights_path)
+        try:
+            result = compare_startup(os.path.abspath(weights_path), os.path.abspath(path), args.action_space)
+        finally:
+            os.remove(weights_path)
+        print(f"Startup to first action: torch {result['torch_startup_s']:.2f} s "
+              f"(imports and load {result['torch_load_s']:.2f} s) vs onnxruntime {result['onnx_startup_s']:.2f} s "
+              f"(imports and load {result['onnx_load_s']:.2f} s)")
+
+
+if __name__ == '__main__':
+    main()
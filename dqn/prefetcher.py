@@ -0,0 +1,52 @@
+import queue
+import threading
+
+
+class BatchPrefetcher:
+    """
+    Keep up to `depth` collated minibatches ready on a background thread.
+
+    `sample_fn` is called repeatedly on the prefetch thread and must return a device-ready batch
+    (e.g. `DQNAgent.sample_batch` with `pin_memory=True`), so the learner only dequeues it.
+    """
+
+    def __init__(self, sample_fn, depth=4):
+        self.sample_fn = sample_fn
+        self.queue = queue.Queue(maxsize=depth)
+        self.stop_event = threading.Event()
+        self.error = None
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        while not self.stop_event.is_set():
+            try:
+                batch = self.sample_fn()
+            except Exception as e:
+                self.error = e
+                self.stop_event.set()
+                break
+            while not self.stop_event.is_set():
+                try:
+                    self.queue.put(batch, timeout=0.1)
+                    break
+                except queue.Full:
+                    continue
+
+    def get(self, timeout=None):
+        """Return the next prefetched batch, re-raising any error from the prefetch thread."""
+        while True:
+            if self.error is not None:
+                raise RuntimeError("Batch prefetch thread failed") from self.error
+            try:
+                return self.queue.get(timeout=0.1 if timeout is None else timeout)
+            except queue.Empty:
+                if timeout is not None:
+                    raise
+
+    def stop(self):
+        """Stop the prefetch thread and drop any batches still queued."""
+        self.stop_event.set()
+        self.thread.join()
+        while not self.queue.empty():
+            self.queue.get_nowait()
@@ -0,0 +1,193 @@
+import argparse
+import logging
+import os
+import time
+import numpy as np
+import torch
+import torch.nn.functional as F
+from torch.amp import autocast
+from dqn.dueling_dqn import DQNAgent, BIG_BATCH_SIZE, GAMMA, device
+from dqn.frame_store import encode_state, decode_states
+from dqn.offline import preprocess_frames
+
+logger = logging.getLogger(__name__)
+
+# DQfD large-margin loss: Q(s, a) + MARGIN for every a other than the demonstrated action must not
+# exceed Q(s, a_demo)
+MARGIN = 0.8
+# Weight of the margin (or behaviour cloning) loss against the 1-step TD loss
+MARGIN_WEIGHT = 1.0
+
+
+class Demonstrations:
+    """
+    Demonstrated transitions from recorded sessions, with frames stored once as uint8 pixels.
+
+    `states` holds every recorded frame [N, 3, H, W]; each transition refers to its state and next
+    state by index. Steps recorded without player input (action -1) are kept as frames only, so a
+    demonstrated action's next state is the frame that followed it. A terminal step (done set) does
+    not bootstrap from its next state, so it is kept with its own frame as next state and done 1,
+    even when the episode's final frame was not recorded.
+    """
+
+    def __init__(self, states, state_idxs, next_state_idxs, actions, rewards, dones):
+        self.states = states
+        self.state_idxs = state_idxs
+        self.next_state_idxs = next_state_idxs
+        self.actions = actions
+        self.rewards = rewards
+        self.dones = dones
+
+    def __len__(self):
+        return len(self.actions)
+
+    @classmethod
+    def from_sessions(cls, readers, action_space, max_transitions=None):
+        """Load demonstrated transitions; actions outside `action_space` (e.g. disabled tool actions) are skipped."""
+        fields = ['step', 'game_window', 'action', 'reward', 'done']
+        frames, transitions = [], []
+        frame_count = 0
+        for reader in readers:
+            for episode in reader.episodes():
+                pending = None
+                for chunk in reader.iter_episode_chunks(episode, fields):
+                    frames.append(encode_state(preprocess_frames(chunk['game_window'])))
+                    for i in range(len(chunk['step'])):
+                        step, frame = int(chunk['step'][i]), frame_count + i
+                        if pending is not None and step == pending[0] + 1:
+                            transitions.append(pending[1:] + (frame, 0))
+                        action = int(chunk['action'][i])
+                        pending = None
+                        if 0 <= action < action_space:
+                            transition = (frame, action, float(chunk['reward'][i]))
+                            if chunk['done'][i]:
+                                transitions.append(transition + (frame, 1))
+                            else:
+                                pending = (step,) + transition
+                    frame_count += len(chunk['step'])
+                if max_transitions is not None and len(transitions) >= max_transitions:
+                    break
+            if max_transitions is not None and len(transitions) >= max_transitions:
+                break
+        if not transitions:
+            raise ValueError("No demonstrated transitions in the given sessions")
+        transitions = transitions[:max_transitions]
+        state_idxs, actions, rewards, next_state_idxs, dones = (np.array(column) for column in zip(*transitions))
+        return cls(torch.from_numpy(np.concatenate(frames)), torch.from_numpy(state_idxs),
+                   torch.from_numpy(next_state_idxs), torch.from_numpy(actions), torch.from_numpy(rewards).float(),
+                   torch.from_numpy(dones).float())
+
+    def action_counts(self, action_space):
+        return torch.bincount(self.actions, minlength=action_space).tolist()
+
+    def sample(self, batch_size):
+        """Uniform minibatch (state, action, reward, next_state, done) on the agent's device."""
+        idxs = torch.randint(len(self), (batch_size,))
+        states = decode_states(self.states[self.state_idxs[idxs]].numpy(), device)
+        next_states = decode_states(self.states[self.next_state_idxs[idxs]].numpy(), device)
+        return (states, self.actions[idxs].to(device).unsqueeze(1), self.rewards[idxs].to(device), next_states,
+                self.dones[idxs].to(device))
+
+
+def demonstration_loss(agent, batch, loss_type='dqfd', margin=MARGIN, margin_weight=MARGIN_WEIGHT):
+    """
+    Loss of the agent's eval_net on a demonstration minibatch.
+
+    'dqfd' adds the large-margin classification loss of Deep Q-learning from Demonstrations to the
+    Double DQN 1-step TD loss, so Q-values stay calibrated for later online training. 'bc' is plain
+    behaviour cloning: cross-entropy of the Q-values as logits against the demonstrated actions.
+
+    Returns:
+        tuple: (loss, accuracy of the greedy action against the demonstrated one)
+    """
+    state, action, reward, next_state, done = batch
+    q_all = agent.eval_net(state)
+    accuracy = (q_all.argmax(1, keepdim=True) == action).float().mean()
+    if loss_type == 'bc':
+        return F.cross_entropy(q_all.float(), action.squeeze(1)), accuracy
+
+    q_values = q_all.gather(1, action).squeeze(1)
+    with torch.no_grad():
+        next_actions = agent.eval_net(next_state).argmax(1, keepdim=True)
+        next_q_values = agent.target_net(next_state).gather(1, next_actions).squeeze(1)
+        target_q_values = reward + (1 - done) * GAMMA * next_q_values
+    td_loss = F.smooth_l1_loss(q_values, target_q_values)
+    margins = torch.full_like(q_all, margin).scatter_(1, action, 0.0)
+    margin_loss = ((q_all + margins).max(1).values - q_values).mean()
+    return td_loss + margin_weight * margin_loss, accuracy
+
+
+def pretrain(agent, demonstrations, steps, batch_size=BIG_BATCH_SIZE, loss_type='dqfd', margin=MARGIN,
+             margin_weight=MARGIN_WEIGHT, log_interval=100):
+    """
+    Supervised pretraining of the agent's networks on demonstrations.
+
+    Uses the agent's optimizer, scaler and target-network schedule and advances its global step,
+    so online training continues from the pretrained checkpoint.
+
+    Returns:
+        float: Greedy action accuracy over the last `log_interval` steps.
+    """
+    agent.eval_net.train()
+    interval_start, losses, accuracies = time.perf_counter(), [], []
+    accuracy_mean = 0.0
+    for i in range(1, steps + 1):
+        batch = demonstrations.sample(batch_size)
+        agent.optimizer.zero_grad()
+        with autocast(device_type=device.type):
+            loss, accuracy = demonstration_loss(agent, batch, loss_type, margin, margin_weight)
+        agent.scaler.scale(loss).backward()
+        agent.scaler.unscale_(agent.optimizer)
+        torch.nn.utils.clip_grad_norm_(agent.eval_net.parameters(), max_norm=1)
+        agent.scaler.step(agent.optimizer)
+        agent.scaler.update()
+        agent.update_target_network()
+        agent.global_step += 1
+        losses.append(loss.detach())
+        accuracies.append(accuracy)
+
+        if i % log_interval == 0 or i == steps:
+            loss_mean, accuracy_mean = torch.stack(losses).mean().item(), torch.stack(accuracies).mean().item()
+            steps_per_sec = len(losses) / (time.perf_counter() - interval_start)
+            agent.metrics.add_scalars({'Pretrain/Loss': loss_mean, 'Pretrain/Accuracy': accuracy_mean,
+                                       'Pretrain/StepsPerSec': steps_per_sec}, agent.global_step)
+            logger.info(f"Pretrain step {i}/{steps}: loss {loss_mean:.4f}, action accuracy {accuracy_mean:.1%}, "
+                        f"{steps_per_sec:.2f} steps/sec")
+            interval_start, losses, accuracies = time.perf_counter(), [], []
+    return accuracy_mean
+
+
+def main():
+    from recording.trajectory_reader import TrajectoryReader
+    from monitoring.async_logging import setup_logging
+
+    parser = argparse.ArgumentParser(description="Pretrain the Dueling DQN agent on recorded manual play.")
+    parser.add_argument('sessions', nargs='+', help="Demonstration session folders (e.g. ./demonstrations/session_*).")
+    parser.add_argument('--model-folder', default='./models', help="Folder for checkpoints.")
+    parser.add_argument('--steps', type=int, default=2000, help="Number of gradient steps.")
+    parser.add_argument('--batch-size', type=int, default=BIG_BATCH_SIZE)
+    parser.add_argument('--loss', choices=('dqfd', 'bc'), default='dqfd',
+                        help="DQfD TD + large-margin loss, or plain behaviour cloning.")
+    parser.add_argument('--margin', type=float, default=MARGIN)
+    parser.add_argument('--margin-weight', type=float, default=MARGIN_WEIGHT)
+    parser.add_argument('--action-space', type=int, default=3, help="Number of actions of the network.")
+    parser.add_argument('--max-transitions', type=int, default=None)
+    parser.add_argument('--log-interval', type=int, default=100)
+    args = parser.parse_args()
+    setup_logging('./logs/pretrain.log')
+    os.makedirs(args.model_folder, exist_ok=True)
+
+    demonstrations = Demonstrations.from_sessions([TrajectoryReader(folder) for folder in args.sessions],
+                                                  args.action_space, args.max_transitions)
+    # Pretraining starts from the latest checkpoint of the model folder, or from random weights
+    agent = DQNAgent(3, args.action_space, None, args.model_folder, restore_replay=False, start_training=False)
+    logger.info(f"{len(demonstrations)} demonstrated transitions ({len(demonstrations.states)} frames), "
+                f"actions {demonstrations.action_counts(agent.action_space)}")
+    pretrain(agent, demonstrations, args.steps, args.batch_size, args.loss, args.margin, args.margin_weight,
+             args.log_interval)
+    agent.save_checkpoint()
+    agent.close_metrics()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,155 @@
+import argparse
+import contextlib
+import copy
+import json
+import logging
+import os
+import time
+import warnings
+import torch
+import torch.nn as nn
+from dqn.dueling_dqn import DuelingDQN
+from dqn.checkpoints import CheckpointStore
+
+logger = logging.getLogger(__name__)
+
+QUANTIZED_ACTOR_FILE = 'actor_int8.pt'
+META_FILE = 'meta.json'
+
+
+@contextlib.contextmanager
+def _quiet_deprecations():
+    # torch.ao.quantization and TorchScript are deprecated upstream but remain the CPU int8 path here
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', DeprecationWarning)
+        warnings.simplefilter('ignore', FutureWarning)
+        warnings.simplefilter('ignore', UserWarning)
+        yield
+
+
+def quantize_actor(net, calibration_states, backend=None):
+    """
+    Build an int8 copy of a DuelingDQN for batch-1 CPU inference.
+
+    The ResNet50 backbone is quantized statically with FX graph mode (conv/bn/relu fused, activation
+    ranges observed on `calibration_states`); the Linear layers of the head are quantized
+    dynamically. The attention projections stay float, as PyTorch does not quantize
+    `nn.MultiheadAttention`. The result is traced to TorchScript.
+
+    Args:
+        net (DuelingDQN): Float network; it is copied, not modified.
+        calibration_states (torch.Tensor): Representative states [N, C, H, W], e.g. from recordings.
+        backend (str): Quantized engine ('x86', 'fbgemm', 'qnnpack'); defaults to the current engine.
+
+    Returns:
+        torch.jit.ScriptModule: The quantized actor network, on the CPU.
+    """
+    from torch.ao.quantization import get_default_qconfig_mapping, quantize_dynamic
+    from torch.ao.quantization.quantize_fx import prepare_fx, convert_fx
+
+    backend = backend or torch.backends.quantized.engine
+    torch.backends.quantized.engine = backend
+    calibration_states = calibration_states.detach().float().cpu()
+    example = calibration_states[:1]
+    with _quiet_deprecations(), torch.no_grad():
+        quantized = copy.deepcopy(net).cpu().eval()
+        backbone = prepare_fx(quantized.resnet, get_default_qconfig_mapping(backend), example_inputs=(example,))
+        for batch in calibration_states.split(16):
+            backbone(batch)
+        quantized.resnet = convert_fx(backbone)
+        quantized = quantize_dynamic(quantized, {nn.Linear}, dtype=torch.qint8)
+        return torch.jit.freeze(torch.jit.trace(quantized, example))
+
+
+def compare_actors(float_net, quantized_net, states, repeats=20):
+    """
+    Compare argmax actions and batch-1 latency of a float and a quantized actor on CPU.
+
+    Returns:
+        dict: `agreement` (fraction of states with the same greedy action), `float_ms` and `quantized_ms`.
+    """
+    float_net = copy.deepcopy(float_net).cpu().eval()
+    states = states.detach().float().cpu()
+    with torch.no_grad():
+        agreement = (float_net(states).argmax(1) == quantized_net(states).argmax(1)).float().mean().item()
+        latencies = {}
+        for name, model in (('float_ms', float_net), ('quantized_ms', quantized_net)):
+            single = states[:1]
+            for _ in range(3):
+                model(single)
+            start = time.perf_counter()
+            for i in range(repeats):
+                model(states[i % len(states)].unsqueeze(0))
+            latencies[name] = (time.perf_counter() - start) / repeats * 1000
+    return dict(agreement=agreement, **latencies)
+
+
+def save_quantized_actor(quantized_net, path, global_step):
+    """Save a quantized actor as TorchScript, tagged with the learner step of its weights."""
+    with _quiet_deprecations():
+        torch.jit.save(quantized_net, path, _extra_files={META_FILE: json.dumps({'global_step': global_step})})
+
+
+def load_quantized_actor(path):
+    """
+    Load a quantized actor saved by `save_quantized_actor`.
+
+    Returns:
+        tuple: (module, learner global step of its weights), or None if the file does not exist.
+    """
+    if not os.path.exists(path):
+        return None
+    extra_files = {META_FILE: ''}
+    with _quiet_deprecations():
+        module = torch.jit.load(path, map_location='cpu', _extra_files=extra_files)
+    return module, json.loads(extra_files[META_FILE]).get('global_step', -1)
+
+
+def recorded_states(folders, count):
+    """Up to `count` states rebuilt from recorded sessions, spread evenly over their frames."""
+    from dqn.offline import preprocess_frames
+    from recording.trajectory_reader import TrajectoryReader
+    frames = []
+    for folder in folders:
+        reader = TrajectoryReader(folder)
+        for episode in reader.episodes():
+            for chunk in reader.iter_episode_chunks(episode, ['game_window']):
+                frames.append(preprocess_frames(chunk['game_window']))
+    states = torch.cat(frames)
+    return states[torch.linspace(0, len(states) - 1, min(count, len(states))).long()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Quantize the latest DuelingDQN checkpoint for CPU acting.")
+    parser.add_argument('sessions', nargs='+', help="Recorded session folders used for calibration and checks.")
+    parser.add_argument('--model-folder', default='./models')
+    parser.add_argument('--calibration', type=int, default=256, help="Number of calibration states.")
+    parser.add_argument('--check', type=int, default=256, help="Number of states for the agreement check.")
+    parser.add_argument('--backend', default=None, help="Quantized engine, e.g. x86, fbgemm or qnnpack.")
+    parser.add_argument('--min-agreement', type=float, default=0.95,
+                        help="Do not save the actor if fewer greedy actions agree with the float model.")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    checkpoints = CheckpointStore(args.model_folder)
+    entry = checkpoints.latest()
+    if entry is None:
+        raise SystemExit(f"No manifest checkpoint in {args.model_folder}")
+    net = DuelingDQN(3, 3)
+    net.load_state_dict(checkpoints.load_weights(entry, map_location='cpu'))
+
+    states = recorded_states(args.sessions, args.calibration + args.check)
+    calibration, check = states[0::2][:args.calibration], states[1::2][:args.check]
+    quantized = quantize_actor(net, calibration, args.backend)
+    result = compare_actors(net, quantized, check)
+    print(f"Checkpoint {entry['name']}: {result['agreement']:.1%} greedy action agreement on {len(check)} states, "
+          f"float {result['float_ms']:.1f} ms vs int8 {result['quantized_ms']:.1f} ms per action")
+    if result['agreement'] < args.min_agreement:
+        raise SystemExit(f"Agreement below {args.min_agreement:.0%}; quantized actor not saved.")
+    path = os.path.join(args.model_folder, QUANTIZED_ACTOR_FILE)
+    save_quantized_actor(quantized, path, entry['global_step'])
+    print(f"Quantized actor saved to {path}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,156 @@
+import ctypes
+import logging
+import os
+import sys
+import torch
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+logger = logging.getLogger(__name__)
+
+# Warn when the memory a replay buffer still needs to reach its capacity exceeds this fraction of
+# what is available on its device
+MEMORY_WARNING_FRACTION = 0.9
+
+
+def component(name, device, nbytes, projected_bytes=None):
+    """
+    One entry of a replay memory report.
+
+    Args:
+        name (str): Component name, e.g. 'states' or 'sumtree'.
+        device: Device the bytes live on ('cpu' for host memory and Python objects).
+        nbytes (int): Bytes held now.
+        projected_bytes (int): Bytes held at capacity; defaults to `nbytes` (preallocated storage).
+    """
+    return {'name': name, 'device': str(device), 'bytes': int(nbytes),
+            'projected_bytes': int(nbytes if projected_bytes is None else projected_bytes)}
+
+
+def grown(nbytes, size, capacity):
+    """Projected bytes at capacity of storage that grows linearly with the number of transitions."""
+    return nbytes * capacity // size if 0 < size < capacity else nbytes
+
+
+def tensor_bytes(tensors):
+    """
+    Bytes of the storages behind `tensors` per device, counting a storage shared by several
+    tensors (e.g. a state that is also the previous transition's next state) once.
+    """
+    storages, totals = set(), {}
+    for tensor in tensors:
+        storage = tensor.untyped_storage()
+        key = (str(tensor.device), storage.data_ptr())
+        if key in storages:
+            continue
+        storages.add(key)
+        totals[key[0]] = totals.get(key[0], 0) + storage.nbytes()
+    return totals
+
+
+def python_object_bytes(objects):
+    """Shallow size of Python objects (tuples, scalars, tensor wrappers), not of tensor storage."""
+    return sum(sys.getsizeof(obj) for obj in objects)
+
+
+def available_memory(device):
+    """
+    Bytes that can still be allocated on `device`, or None if unknown.
+
+    For CUDA this includes memory reserved but unused by PyTorch's caching allocator. Host memory
+    comes from psutil when installed, otherwise /proc/meminfo or GlobalMemoryStatusEx on Windows.
+    """
+    device = torch.device(device)
+    if device.type == 'cuda':
+        free, _ = torch.cuda.mem_get_info(device)
+        return free + torch.cuda.memory_reserved(device) - torch.cuda.memory_allocated(device)
+    if device.type != 'cpu':
+        return None
+    if psutil is not None:
+        return psutil.virtual_memory().available
+    if os.path.exists('/proc/meminfo'):
+        with open('/proc/meminfo') as f:
+            for line in f:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) * 1024
+    if sys.platform == 'win32':
+        class MemoryStatus(ctypes.Structure):
+            _fields_ = [('dwLength', ctypes.c_ulong), ('dwMemoryLoad', ctypes.c_ulong),
+                        ('ullTotalPhys', ctypes.c_ulonglong), ('ullAvailPhys', ctypes.c_ulonglong),
+                        ('ullTotalPageFile', ctypes.c_ulonglong), ('ullAvailPageFile', ctypes.c_ulonglong),
+                        ('ullTotalVirtual', ctypes.c_ulonglong), ('ullAvailVirtual', ctypes.c_ulonglong),
+                        ('ullAvailExtendedVirtual', ctypes.c_ulonglong)]
+        status = MemoryStatus(dwLength=ctypes.sizeof(MemoryStatus))
+        if ctypes.windll.kernel32.GlobalMemoryStatusEx(ctypes.byref(status)):
+            return status.ullAvailPhys
+    return None
+
+
+def build_report(buffer, components):
+    """
+    Summarize the components of a replay buffer.
+
+    Returns:
+        dict: `kind`, `size`, `capacity`, the `components`, total `bytes` and `projected_bytes`,
+        `bytes_per_transition` at capacity, and per device `bytes`, `projected_bytes` and `available`.
+    """
+    devices = {}
+    for entry in components:
+        totals = devices.setdefault(entry['device'], {'bytes': 0, 'projected_bytes': 0})
+        totals['bytes'] += entry['bytes']
+        totals['projected_bytes'] += entry['projected_bytes']
+    for name, totals in devices.items():
+        try:
+            totals['available'] = available_memory(name)
+        except Exception as e:
+            logger.debug(f"Cannot query available memory on {name}: {e}")
+            totals['available'] = None
+    projected = sum(entry['projected_bytes'] for entry in components)
+    return {
+        'kind': type(buffer).__name__,
+        'size': len(buffer),
+        'capacity': buffer.capacity,
+        'components': components,
+        'bytes': sum(entry['bytes'] for entry in components),
+        'projected_bytes': projected,
+        'bytes_per_transition': projected / buffer.capacity,
+        'devices': devices,
+    }
+
+
+def footprint_warnings(report, fraction=MEMORY_WARNING_FRACTION):
+    """Messages for each device where filling the buffer to capacity would not fit in available memory."""
+    warnings = []
+    for name, totals in report['devices'].items():
+        needed = totals['projected_bytes'] - totals['bytes']
+        if totals['available'] is not None and needed > fraction * totals['available']:
+            warnings.append(f"Replay buffer needs {format_bytes(needed)} more on {name} to reach its capacity of "
+                            f"{report['capacity']} transitions, but only {format_bytes(totals['available'])} "
+                            f"is available")
+    return warnings
+
+
+def format_bytes(nbytes):
+    for unit in ('B', 'KiB', 'MiB', 'GiB'):
+        if abs(nbytes) < 1024 or unit == 'GiB':
+            return f"{nbytes:.0f} {unit}" if unit == 'B' else f"{nbytes:.1f} {unit}"
+        nbytes /= 1024
+
+
+def format_report(report):
+    """Human-readable table of a replay memory report."""
+    lines = [f"Replay memory ({report['kind']}, {report['size']}/{report['capacity']} transitions): "
+             f"{format_bytes(report['bytes'])} now, {format_bytes(report['projected_bytes'])} at capacity, "
+             f"{format_bytes(report['bytes_per_transition'])} per transition"]
+    for entry in report['components']:
+        lines.append(f"  {entry['name']:<14} {entry['device']:<8} "
+                     f"{format_bytes(entry['projected_bytes'] / report['capacity']):>12} per transition "
+                     f"{format_bytes(entry['bytes']):>12} now {format_bytes(entry['projected_bytes']):>12} at capacity")
+    for name, totals in report['devices'].items():
+        available = format_bytes(totals['available']) if totals['available'] is not None else 'unknown'
+        lines.append(f"  {name}: {format_bytes(totals['bytes'])} now, {format_bytes(totals['projected_bytes'])} "
+                     f"at capacity, {available} available")
+    return '\n'.join(lines)
@@ -2,6 +2,7 @@
 
 import logging
 from dqn.dueling_dqn import DQNAgent, BIG_BATCH_SIZE
+from dqn.actor_learner import ActorAgent
 
 
 logging.basicConfig(level=logging.INFO)
@@ -9,8 +10,12 @@ logging.basicConfig(level=logging.INFO)
 
 class GameAgent:
     def __init__(self, input_channels=3, action_space=3, model_file="./models",
-                 model_folder="./models"):
-        self.dqn_agent = DQNAgent(input_channels, action_space, model_file, model_folder)
+                 model_folder="./models", learner_process=False):
+        if learner_process:
+            # Train in a separate process; this process only acts and writes shared replay storage
+            self.dqn_agent = ActorAgent(input_channels, action_space, model_file, model_folder)
+        else:
+            self.dqn_agent = DQNAgent(input_channels, action_space, model_file, model_folder)
         self.TRAIN_BATCH_SIZE = BIG_BATCH_SIZE
 
     @property
@@ -33,12 +38,15 @@ class GameAgent:
         """Update the target network."""
         self.dqn_agent.update_target_network()
 
-    def log_episode_reward(self, episode, total_reward, moving_average):
-        """Log the total reward and moving average reward to SummaryWriter."""
-        self.dqn_agent.writer.add_scalar('Episode/TotalReward', total_reward, episode)
-        self.dqn_agent.writer.add_scalar('Episode/MovingAverageReward', moving_average, episode)
+    def log_episode_stats(self, episode_stats):
+        """Queue the episodes recorded since the last call, with their rolling means, for the SummaryWriter."""
+        episode_stats.export(self.dqn_agent.metrics)
+
+    def report_episode_reward(self, reward_mean):
+        """Report the rolling mean episode reward; the learner saves the best model on it."""
+        self.dqn_agent.report_episode_reward(reward_mean)
 
     def close_writer(self):
         """Close the SummaryWriter."""
-        self.dqn_agent.writer.close()
+        self.dqn_agent.close_metrics()
         logging.info("SummaryWriter closed.")
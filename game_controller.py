@@ -3,52 +3,65 @@
 import cv2
 import logging
 import time
-import numpy as np
 from game_environment import GameEnvironment
 from game_agent import GameAgent
 from game_state import GameState
+from reward_rules import RewardRules
+from recording.trajectory_recorder import TrajectoryRecorder, new_session_folder
 from control.tool_manager import ToolManager
 from keys.input_keys import attack
-from control.dueling_dqn_manual import keyboard_result, mouse_result, start_listeners
+from control.dueling_dqn_manual import ManualInput
 from control.game_control import take_action, pause_game, restart
-from logging.handlers import RotatingFileHandler
-from collections import deque
+from control.hotkeys import HotkeyService
+from monitoring.tracing import tracer
+from monitoring.profiling import ProfileTriggers, actor_profiler, learner_profiler
+from monitoring.async_logging import setup_logging
+from monitoring.episode_stats import EpisodeStats
 
-# Configure logging with rotating file handler
 logger = logging.getLogger()
-logger.setLevel(logging.INFO)
-handler = RotatingFileHandler('./logs/game_controller.log', maxBytes=10 * 1024 * 1024, backupCount=5)
-formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
-handler.setFormatter(formatter)
-logger.addHandler(handler)
+# Rotating log file of the control process; the learner process writes its own
+LOG_FILE = './logs/game_controller.log'
+
+# Per-episode statistics beyond the reward components; the rolling means cover the last
+# EPISODE_STATS_WINDOW episodes and EPISODE_STATS_CAPACITY episodes are kept in memory
+EPISODE_METRICS = ('total_reward', 'length', 'boss_phases', 'steps_per_sec')
+EPISODE_STATS_CAPACITY = 1000
+EPISODE_STATS_WINDOW = 100
+# Episodes between TensorBoard exports and saves of the episode statistics file
+EPISODE_STATS_EXPORT_INTERVAL = 10
+EPISODE_STATS_FILE = './logs/episode_stats.npz'
+# Episodes recorded before the rolling mean reward is used to pick the best model
+BEST_MODEL_MIN_EPISODES = 10
 
 
 class GameController:
     def __init__(self):
+        self.startup_time = time.perf_counter()
+        # Route logging through a background listener writing a rotating log file. This is set up here,
+        # not at import, so spawned processes that re-import this module do not open the same file.
+        self.log_pipeline = setup_logging(LOG_FILE)
+        self.first_action_time = None
         self.last_feature_log_time = 0
-        self.last_time_penalty_update = time.time()
-        self.time_penalty_increment = -0.001
-
-        self.last_actions = deque(maxlen=8)
 
         self.defeated = 0
 
-        self.missing_boss_hp_steps = 0
-        self.boss_lives = 1
-
-        self.steps_since_last_attack = 0
-        self.idle_threshold = 6
-
-        self.defeat_window_start = None
         self.env = GameEnvironment()
         self.tool_manager = ToolManager()
         self.env.set_tool_manager(self.tool_manager)
-        self.agent = GameAgent()
-        self.intermediate_rewards_given = {
-            '75%': False,
-            '50%': False,
-            '25%': False
-        }
+        self.hotkeys = HotkeyService()
+        self.hotkeys.bind('p', self.env.pause_switch.toggle)
+        self.agent = GameAgent(action_space=self.env.action_space_size, learner_process=self.env.learner_process)
+        # Manual play is always recorded, as demonstrations for `python -m dqn.pretrain`
+        self.manual_input = ManualInput(self.env.action_space_size) if self.env.manual else None
+        # Steps recorded with action repeat hold the summed reward of their ticks
+        session_metadata = {'action_repeat': self.env.action_repeat}
+        if self.env.manual:
+            self.recorder = TrajectoryRecorder(new_session_folder(self.env.demonstration_folder),
+                                               metadata=session_metadata)
+        elif self.env.record:
+            self.recorder = TrajectoryRecorder(new_session_folder(self.env.record_folder), metadata=session_metadata)
+        else:
+            self.recorder = None
         self.reward_weights = {
             'self_hp_loss': -0.5,
             'boss_hp_loss': 10.0,
@@ -58,254 +71,175 @@ class GameController:
             "intermediate_defeat": 0,
             'idle_penalty': -3
         }
+        self.reward_rules = RewardRules(self.reward_weights, manual=self.env.manual)
 
-        self.reward_type_distribution = {
-            'self_hp_loss': [],
-            'boss_hp_loss': [],
-            'defeat_bonus': [],
-            'self_death': [],
-            'idle_penalty': [],
-            'time_penalty': [],
-        }
-        self.flags = {
-            'self_hp_loss': False,
-            'boss_hp_loss': False,
-        }
         self.current_reward_types = {key: 0 for key in self.reward_weights}
-        self.episode_rewards = deque(maxlen=100)
-        self.moving_average_rewards = deque(maxlen=100)
-
-    def action_judge(self, state_obj):
-        """Judge the action and calculate the reward."""
-        reward, defeated = 0, 0
-        self.defeat_window_start = None
-
-        # 1. Check for Boss Defeat
-        if state_obj.next_features['boss_hp'] <= 0:
-            defeat_reward, defeated = self.handle_boss_low_health(state_obj)
-            reward += defeat_reward
-        else:
-            # 2. Calculate Deltas and Corresponding Rewards
-            delta_reward = self.calculate_deltas(state_obj)
-            reward += delta_reward
-
-        if not self.env.manual:
-            current_time = time.time()
-            if current_time - self.last_time_penalty_update >= 1:
-                # 3. Apply Time Penalty
-                time_penalty = self.reward_weights['time_penalty'] + (self.env.target_step * self.time_penalty_increment)
-                reward += time_penalty
-                self.current_reward_types['time_penalty'] += time_penalty
-                self.last_time_penalty_update = current_time
-
-        # 4. Apply Idle Penalty
-        if not self.env.manual:
-            if self.steps_since_last_attack >= self.idle_threshold:
-                idle_penalty = self.reward_weights['idle_penalty']
-                reward += idle_penalty
-                self.current_reward_types['idle_penalty'] += idle_penalty
-                logger.info("Idle penalty applied due to prolonged inactivity.")
-                self.steps_since_last_attack = 0
-
-        # 5. Check for Death
-        if state_obj.next_features['self_hp'] <= 1:
-            death_penalty = self.reward_weights['self_death']
-            reward += death_penalty
-            self.current_reward_types['self_death'] += death_penalty
-            defeated = 1
+        self.episode_start_time = time.perf_counter()
+        self.phases_cleared = 0
+        self.episode_stats = EpisodeStats(tuple(self.reward_weights) + EPISODE_METRICS, EPISODE_STATS_CAPACITY,
+                                          EPISODE_STATS_WINDOW)
+        if tracer.enabled:
+            tracer.start_exporter(self.agent.dqn_agent.writer)
+        # A learner process polls its own sentinel file
+        self.profile_triggers = ProfileTriggers(
+            (actor_profiler,) if self.env.learner_process else (actor_profiler, learner_profiler))
+        self.profile_triggers.start()
+        logger.info("Controller ready %.2fs after startup.", time.perf_counter() - self.startup_time)
+
+    def report_first_action(self):
+        """Log and record the time from startup to the first action, once per run."""
+        self.first_action_time = time.perf_counter() - self.startup_time
+        logger.info("First action %.2fs after startup (including time spent paused).", self.first_action_time)
+        self.agent.dqn_agent.metrics.add_scalars({'Startup/FirstActionSeconds': self.first_action_time}, 0)
+
+    def action_judge(self, prev_features, features, action, now, update_idle=True):
+        """Judge the action and calculate the reward; `update_idle` is False on skipped action-repeat ticks."""
+        reward, defeated, components = self.reward_rules.step(prev_features, features, action, self.env.target_step,
+                                                              now, update_idle)
+        for key, value in components.items():
+            self.current_reward_types[key] += value
+        if components['defeat_bonus']:
+            self.phases_cleared += 1
+
+        if features['boss_hp'] <= 0:
+            # Keep attacking while the boss HP bar is gone to make sure the phase ends
+            attack()
+            if components['defeat_bonus']:
+                if defeated == 2:
+                    logger.info("Boss defeated directly; defeat bonus awarded.")
+                else:
+                    logger.info("Boss defeated in this phase, remaining lives: %d", self.reward_rules.boss_lives)
+        if components['self_hp_loss']:
+            logger.info("Self HP reduced; penalty applied: %.2f", components['self_hp_loss'])
+        if components['boss_hp_loss']:
+            logger.info("Boss HP reduced; reward applied: %.2f", components['boss_hp_loss'])
+        if components['intermediate_defeat']:
+            logger.info("Intermediate reward granted at boss HP %.2f%%.", features['boss_hp'])
+        if components['idle_penalty']:
+            logger.info("Idle penalty applied due to prolonged same activity.")
+        if components['self_death']:
             logger.info("Agent has died. Death penalty applied.")
-            return reward, defeated
 
         return reward, defeated
 
-    def handle_boss_low_health(self, state_obj):
-        boss_hp = state_obj.next_features.get('boss_hp', 0)
-        defeat_bonus = self.reward_weights.get('defeat_bonus', 40)
-
-        if self.boss_lives <= 1:
-            logger.info("Boss is in the final phase and try to defeat directly!")
-            reward = self.attack_directly()
-            self.defeated = 2
-            return reward, self.defeated
-        else:
-            if not self.defeat_window_start:
-                self.defeat_window_start = time.time()
-                logger.info(f"Boss HP ≤ 1, starting phase: {self.boss_lives}")
-
-            if boss_hp <= 0:
-                self.missing_boss_hp_steps += 1
-            else:
-                self.missing_boss_hp_steps = 0
-
-            if self.missing_boss_hp_steps > 50:
-                reward = defeat_bonus
-                self.boss_lives -= 1
-                self.defeated = 0
-                logger.info("Boss defeated in this phase.")
-                self.missing_boss_hp_steps = 0
-                return reward, self.defeated
-            else:
-                reward, defeated = self.attack_in_low_health_phase(state_obj)
-                self.defeated = defeated
-                return reward, self.defeated
-
-    def attack_directly(self):
-        """Attack the boss directly to defeat it."""
-        attack()
-        defeat_bonus = self.reward_weights.get('defeat_bonus')
-        reward = defeat_bonus
-        self.current_reward_types['defeat_bonus'] += defeat_bonus
-        logger.info("Boss defeated directly; defeat bonus awarded.")
-        return reward
-
-    def attack_in_low_health_phase(self, state_obj):
-        """Attack during the boss's low health phase and send rewards when Boss enters the next phase."""
-        boss_hp = state_obj.next_features.get('boss_hp', 0)
-        defeat_bonus = self.reward_weights.get('defeat_bonus', 20)
-        reward = 0
-        time_elapsed = time.time() - self.defeat_window_start if self.defeat_window_start else 0
-
-        if time_elapsed > 6:
-            self.defeat_window_start = None
-            logger.info("Defeat window expired, stopping attack.")
-            return reward, self.defeated
-
-        attack()
-        logger.info("Continuing to attack Boss to ensure defeat...")
-
-        if boss_hp > 50:
-            logger.info(f"Boss entered the next phase, remaining lives: {self.boss_lives - 1}")
-            reward = defeat_bonus
-            self.boss_lives -= 1
-            self.defeated = 0
-            self.defeat_window_start = None
-            self.intermediate_rewards_given = {
-                '75%': False,
-                '50%': False,
-                '25%': False
-            }
-            self.missing_boss_hp_steps = 0
-            return reward, self.defeated
-
-        return reward, self.defeated
-
-    def calculate_deltas(self, state_obj):
-        """Calculate the reward based on the changes in features."""
-        keys = ['self_hp', 'boss_hp']
-        deltas = {key: state_obj.next_features[key] - state_obj.current_features[key] for key in keys}
-        reward = 0
-
-        # 1. Self HP loss penalty
-        if -50 < deltas['self_hp'] < -10:
-            if not self.flags['self_hp_loss']:
-                self_hp_loss = self.reward_weights['self_hp_loss'] * abs(deltas['self_hp'])
-                reward += self_hp_loss
-                self.current_reward_types['self_hp_loss'] += self_hp_loss
-                self.flags['self_hp_loss'] = True
-                logger.info(f"Self HP reduced: {abs(deltas['self_hp']):.2f} ; penalty applied: {self_hp_loss:.2f}")
-        else:
-            self.flags['self_hp_loss'] = False
-
-        # 2. Boss HP loss reward
-        if -12 < deltas['boss_hp'] < -1:
-            if not self.flags['boss_hp_loss']:
-                boss_hp_reward = self.reward_weights['boss_hp_loss'] * abs(deltas['boss_hp'])
-                reward += boss_hp_reward
-                self.current_reward_types['boss_hp_loss'] += boss_hp_reward
-                self.steps_since_last_attack = 0
-                self.flags['boss_hp_loss'] = True
-                logger.info(f"Boss HP reduced: {abs(deltas['boss_hp']):.2f} ; reward applied: {boss_hp_reward:.2f}")
-        else:
-            self.flags['boss_hp_loss'] = False
-
-        # 3. Intermediate rewards based on boss HP thresholds
-        boss_hp_percentage = state_obj.next_features['boss_hp']
-        if 75 > boss_hp_percentage >= 50 and not self.intermediate_rewards_given['75%']:
-            reward += 15
-            self.current_reward_types['intermediate_defeat'] += 10
-            self.intermediate_rewards_given['75%'] = True
-            logger.info("Intermediate reward granted for boss HP between 50% and 75%.")
-        elif 50 > boss_hp_percentage >= 25 and not self.intermediate_rewards_given['50%']:
-            reward += 25
-            self.current_reward_types['intermediate_defeat'] += 20
-            self.intermediate_rewards_given['50%'] = True
-            logger.info("Intermediate reward granted for boss HP between 25% and 50%.")
-        elif boss_hp_percentage < 25 and not self.intermediate_rewards_given['25%']:
-            reward += 35
-            self.current_reward_types['intermediate_defeat'] += 30
-            self.intermediate_rewards_given['25%'] = True
-            logger.info("Intermediate reward granted for boss HP below 25%.")
-
-        return reward
+    def repeat_action(self, prev_features, action):
+        """
+        Run the `action_repeat - 1` skipped ticks of a decision: judge each tick from the bars and
+        press the action again, without building states or querying the agent.
+
+        Returns:
+            tuple: (summed reward of the skipped ticks, defeated flag if the episode ended on one,
+            features of the last tick)
+        """
+        repeat_reward = 0.0
+        for _ in range(self.env.action_repeat - 1):
+            screens = self.env.grab_bars()
+            if screens is None:
+                break
+            features = self.env.extract_features(screens)
+            reward, defeated = self.action_judge(prev_features, features, action, time.time(), update_idle=False)
+            repeat_reward += reward
+            prev_features = features
+            if defeated:
+                return repeat_reward, defeated, prev_features
+            if not self.env.manual and action is not None:
+                take_action(action, self.env.debugged, self.tool_manager)
+        return repeat_reward, 0, prev_features
 
     def post_episode_updates(self, episode):
         """Update statistics and save models after each episode."""
-        for key in self.reward_type_distribution:
-            self.reward_type_distribution[key].append(self.current_reward_types.get(key, 0))
-
+        elapsed = time.perf_counter() - self.episode_start_time
         total_reward = sum(self.current_reward_types.values())
-        self.episode_rewards.append(total_reward)
+        values = dict(self.current_reward_types, total_reward=total_reward, length=self.env.target_step,
+                      boss_phases=self.phases_cleared + 1,
+                      steps_per_sec=self.env.target_step / elapsed if elapsed > 0 else 0.0)
+        self.episode_stats.record(episode + 1, values)
 
-        moving_average = np.mean(self.episode_rewards) if self.episode_rewards else 0
-        self.moving_average_rewards.append(moving_average)
+        logger.info("Episode %d Summary: Total Reward: %.2f | Moving Average Reward (Last %d): %.2f | Steps: %d",
+                    episode + 1, total_reward, min(len(self.episode_stats), EPISODE_STATS_WINDOW),
+                    self.episode_stats.rolling_mean('total_reward'), self.env.target_step)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Episode %d reward components: %s", episode + 1,
+                         " | ".join(f"{key}: {value:.2f}" for key, value in self.current_reward_types.items()))
 
-        reward_details = " | ".join([f"{key}: {value:.2f}" for key, value in self.current_reward_types.items()])
-        reward_summary = (f"Episode {episode + 1} Summary: Total Reward: {total_reward:.2f} | "
-                          f"Moving Average Reward (Last {len(self.episode_rewards)}): {moving_average:.2f} | "
-                          f"{reward_details}")
+        if len(self.episode_stats) >= BEST_MODEL_MIN_EPISODES:
+            self.agent.report_episode_reward(float(self.episode_stats.rolling_mean('total_reward')))
 
-        logger.info(reward_summary)
-
-        self.agent.log_episode_reward(episode + 1, total_reward, moving_average)
+        if (episode + 1) % EPISODE_STATS_EXPORT_INTERVAL == 0:
+            self.export_episode_stats()
 
         self.current_reward_types = {key: 0 for key in self.reward_weights}
+        self.phases_cleared = 0
 
-        self.steps_since_last_attack = 0
+    def export_episode_stats(self):
+        """Write the episodes recorded since the last export to TensorBoard and the statistics file."""
+        self.agent.log_episode_stats(self.episode_stats)
+        try:
+            self.episode_stats.save(EPISODE_STATS_FILE)
+        except OSError as e:
+            logger.error("Failed to save episode statistics: %s", e)
 
     def run(self):
         """Run the main game loop."""
-        if self.env.manual:
-            start_listeners()
+        if self.manual_input is not None:
+            self.manual_input.start()
+        self.hotkeys.start()
         logger.info("Press 'P' to start the screen capture")
 
         while self.agent.global_episode < self.env.episodes:
             episode = self.agent.global_episode
             logger.info(f"Starting Episode {episode + 1}")
             self.env.target_step = 0
-            self.env.paused = pause_game(self.env.paused)
+            tracer.reset_lap('controller.step')
+            pause_game(self.env.pause_switch)
             game_window_img, screens = self.env.grab_screens()
 
             if game_window_img is None:
                 logger.warning("Failed to capture screen, skipping iteration.")
                 continue
 
+            obs_time = time.time()
             features = self.env.extract_features(screens)
             resized_img = self.env.resize_screen(game_window_img)
             state = self.env.prepare_state(resized_img)
             state_obj = GameState(features, state)
+            obs_window_img, obs_screens = game_window_img, screens
+            self.episode_start_time = time.perf_counter()
+            # Reward of skipped ticks whose decision could not be stored because the next capture failed
+            carried_reward = 0.0
 
             while True:
-                self.env.paused = pause_game(self.env.paused)
+                tracer.lap('controller.step')
+                pause_game(self.env.pause_switch)
 
                 action_mask = self.env.get_action_mask()
 
-                if self.env.manual:
-                    action = self.get_manual_action()
-                    if action is None:
-                        continue
+                if self.manual_input is not None:
+                    # Latest player input since the previous step, stamped with when it was pressed
+                    action, action_time = self.manual_input.take_action()
                 else:
                     action = self.agent.choose_action(state_obj.current_state, action_mask)
-
+                    action_time = time.time()
+                if self.first_action_time is None and action is not None:
+                    self.report_first_action()
                 if not self.env.manual and action is not None:
                     take_action(action, self.env.debugged, self.tool_manager)
 
-                self.last_actions.append(action)
+                # Action repeat: judge the skipped ticks on the bars alone and add up their rewards
+                repeat_reward, self.defeated, tick_features = self.repeat_action(state_obj.next_features, action)
 
                 game_window_img, screens = self.env.grab_screens()
                 if game_window_img is None:
-                    logger.warning("Failed to capture screen, skipping action.")
-                    continue
+                    if not self.defeated:
+                        logger.warning("Failed to capture screen, skipping action.")
+                        carried_reward += repeat_reward
+                        continue
+                    # The episode ended on a skipped tick, which was already judged: store the terminal
+                    # transition with the last captured frame as next state
+                    logger.warning("Failed to capture screen after the episode ended; using the last frame.")
+                    game_window_img, screens = obs_window_img, obs_screens
 
+                capture_time = time.time()
                 features = self.env.extract_features(screens)
                 resized_img = self.env.resize_screen(game_window_img)
                 next_state = self.env.prepare_state(resized_img)
@@ -316,25 +250,40 @@ class GameController:
 
                 current_time = time.time()
                 if current_time - self.last_feature_log_time >= 1:
-                    logger.info(f'Player Health: {self_hp:.2f}%, Boss Health: {boss_hp:.2f}%')
+                    logger.info('Player Health: %.2f%%, Boss Health: %.2f%%', self_hp, boss_hp)
                     self.last_feature_log_time = current_time
 
-                reward, self.defeated = self.action_judge(state_obj)
-
-                if not self.env.manual:
-                    if all(a == action for a in self.last_actions) and len(self.last_actions) == 8:
-                        reward += self.reward_weights['idle_penalty']
-                        self.current_reward_types['idle_penalty'] += self.reward_weights['idle_penalty']
-                        logger.info("Idle penalty applied due to prolonged same activity.")
+                if self.defeated:
+                    # The episode ended on a skipped tick, which was already judged
+                    reward = repeat_reward
+                else:
+                    reward, self.defeated = self.action_judge(tick_features, state_obj.next_features, action,
+                                                              capture_time)
+                    reward += repeat_reward
+                reward += carried_reward
+                carried_reward = 0.0
 
                 if action is not None:
                     self.agent.store_transition(state_obj.current_state, action, reward, state_obj.next_state,
                                                 self.defeated)
+                    if self.recorder is not None:
+                        self.recorder.record_step(episode, self.env.target_step, obs_window_img, obs_screens,
+                                                  state_obj.current_features, action, reward, self.defeated,
+                                                  obs_time, action_time)
+                elif self.recorder is not None:
+                    # Keep demonstration steps without player input, so frames and inputs stay aligned
+                    self.recorder.record_step(episode, self.env.target_step, obs_window_img, obs_screens,
+                                              state_obj.current_features, -1, reward, self.defeated, obs_time,
+                                              obs_time)
+                obs_window_img, obs_screens, obs_time = game_window_img, screens, capture_time
 
                 self.env.target_step += 1
                 if self.defeated:
                     break
 
+            if self.recorder is not None:
+                self.recorder.end_episode(episode, self.env.target_step, obs_window_img, obs_screens,
+                                          state_obj.next_features, obs_time)
             self.post_episode_updates(episode)
             self.agent.global_episode += 1
 
@@ -342,13 +291,14 @@ class GameController:
             logger.info(f"Ending Episode {episode + 1}")
 
         cv2.destroyAllWindows()
+        self.hotkeys.stop()
+        if self.manual_input is not None:
+            self.manual_input.stop()
+        self.export_episode_stats()
+        tracer.stop_exporter()
+        self.profile_triggers.stop()
+        logger.info("Logging pipeline: %(dropped)d records dropped, %(suppressed)d suppressed by rate limiting",
+                    self.log_pipeline.stats())
+        if self.recorder is not None:
+            self.recorder.close()
         self.agent.close_writer()
-
-    @staticmethod
-    def get_manual_action():
-        """Retrieve manual action from keyboard or mouse input."""
-        if keyboard_result is not None:
-            return keyboard_result
-        elif mouse_result is not None:
-            return mouse_result
-        return None
@@ -8,9 +8,16 @@ import time
 from cv.health_posture import extract_health, extract_posture, update_health, update_posture
 from cv.ocr_utils import get_remaining_uses
 from cv.screen_capture import grab_full_screen, grab_region
+from monitoring.tracing import traced
+from dqn.action_mask import ActionMask
+from control.hotkeys import PauseSwitch
 
 logging.basicConfig(level=logging.INFO)
 
+# Perception ticks per agent decision. The chosen action is repeated on every tick, but only the last
+# one grabs the game window and builds a state; the others only analyse the health and posture bars.
+ACTION_REPEAT = 1
+
 
 class GameEnvironment:
     def __init__(self, width=128, height=128, episodes=3000):
@@ -25,16 +32,25 @@ class GameEnvironment:
             'boss_posture': (315, 73, 710, 88),
             # 'remaining_uses': (955, 570, 971, 588)
         }
-        self.paused = True
+        self.pause_switch = PauseSwitch(paused=True)
         self.manual = False
         self.debugged = False
+        self.record = False
+        self.record_folder = './recordings'
+        self.demonstration_folder = './demonstrations'
+        self.learner_process = False
         self.tool_manager = None
         self.target_step = 0
         self.train_mark = 0
         self.action_space_size = 3
+        self.action_repeat = ACTION_REPEAT
+        self.action_mask = None
         self.current_remaining_uses = 19
         self.screen_lock = threading.Lock()
+        self.frame_ready = threading.Condition(self.screen_lock)
         self.full_screen_img = None
+        self.frame_count = 0
+        self.bars_frame = 0
         self.capture_thread = threading.Thread(target=self.capture_screen, daemon=True)
         self.capture_thread.start()
 
@@ -44,8 +60,11 @@ class GameEnvironment:
             img = grab_full_screen()
             with self.screen_lock:
                 self.full_screen_img = img
+                self.frame_count += 1
+                self.frame_ready.notify_all()
                 time.sleep(0.003)
 
+    @traced('env.grab_screens')
     def grab_screens(self):
         """Extract necessary regions from the captured full screen image."""
         with self.screen_lock:
@@ -57,7 +76,23 @@ class GameEnvironment:
         game_window_img = screens.pop('game_window')
         return game_window_img, screens
 
+    @traced('env.grab_bars')
+    def grab_bars(self, timeout=0.1):
+        """
+        Copy only the bar regions of the next full screen capture, for a perception tick without a state.
+
+        Waits (up to `timeout` seconds) for a capture newer than the one of the previous tick.
+        """
+        with self.frame_ready:
+            self.frame_ready.wait_for(lambda: self.frame_count != self.bars_frame, timeout)
+            self.bars_frame = self.frame_count
+            if self.full_screen_img is None:
+                return None
+            return {key: grab_region(self.full_screen_img, region).copy() for key, region in self.regions.items()
+                    if key != 'game_window'}
+
     @staticmethod
+    @traced('env.extract_features')
     def extract_features(screens):
         """Extract health and posture features from the captured screens."""
         new_player_health, new_boss_health = extract_health(
@@ -75,6 +110,7 @@ class GameEnvironment:
             'boss_posture': stable_boss_posture
         }
 
+    @traced('env.resize_screen')
     def resize_screen(self, img):
         """Resize the game_settings window image using PyTorch's interpolate for efficiency."""
         img_tensor = torch.from_numpy(img).permute(2, 0, 1).unsqueeze(0).float().to('cuda')  # Move directly to GPU
@@ -84,6 +120,7 @@ class GameEnvironment:
         return resized_img
 
     @staticmethod
+    @traced('env.prepare_state')
     def prepare_state(img):
         """Prepare the state tensor for the DQN agent."""
         img_tensor = torch.from_numpy(img).float() / 255.0  # [C, H, W]
@@ -98,13 +135,17 @@ class GameEnvironment:
         return img_tensor
 
     def get_action_mask(self):
-        """Generate a mask for valid actions based on tool cooldowns."""
-        action_mask = [1] * self.action_space_size
-        return action_mask
+        """Return the cached ActionMask of valid actions based on tool cooldowns."""
+        if self.tool_manager is None:
+            if self.action_mask is None:
+                self.action_mask = ActionMask([1] * self.action_space_size)
+            return self.action_mask
+        return self.tool_manager.action_mask()
 
     def set_tool_manager(self, tool_manager):
-        """Set the tool manager."""
+        """Set the tool manager; its tool actions, if enabled, extend the action space."""
         self.tool_manager = tool_manager
+        self.action_space_size = tool_manager.action_space_size
 
     def update_remaining_uses(self, remaining_uses_img):
         """Update the remaining uses by performing OCR."""
@@ -1,18 +1,77 @@
 # game_state.py
 
-import copy
+from collections.abc import Mapping
+
+
+class FeatureView(Mapping):
+    """Read-only mapping over one preallocated feature record."""
+
+    __slots__ = ('_key_index', '_record')
+
+    def __init__(self, key_index, record):
+        self._key_index = key_index
+        self._record = record
+
+    def __getitem__(self, key):
+        return self._record[self._key_index[key]]
+
+    def __iter__(self):
+        return iter(self._key_index)
+
+    def __len__(self):
+        return len(self._key_index)
+
+    def __repr__(self):
+        return f"FeatureView({dict(self)})"
 
 
 class GameState:
-    def __init__(self, features, state):
-        self.current_features = features
-        self.next_features = copy.deepcopy(features)
-        self.current_state = state
-        self.next_state = state.clone()
+    """
+    Transition builder holding the current and next observation without copying them.
+
+    Feature records live in a small ring of preallocated slots and advancing a step only moves the
+    ring index. State tensors are kept by reference: `prepare_state` returns a fresh tensor every
+    step and nothing modifies states in place, so `current_state`/`next_state` can be handed to
+    `store_transition` as is, and consecutive transitions share the same tensor.
+
+    `current_features`/`next_features` are read-only views. A view stays valid for `slots - 1`
+    further updates before its slot is reused, so copy it if it has to outlive that.
+    """
+
+    def __init__(self, features, state, slots=3):
+        self._key_index = {key: i for i, key in enumerate(features)}
+        self._records = [[0.0] * len(self._key_index) for _ in range(slots)]
+        self._views = [FeatureView(self._key_index, record) for record in self._records]
+        self._states = [None] * slots
+        self._slots = slots
+        self._next = 0
+        self._write(0, features, state)
+        self._current = 0
+
+    def _write(self, slot, features, state):
+        record = self._records[slot]
+        for key, value in features.items():
+            record[self._key_index[key]] = value
+        self._states[slot] = state
+
+    @property
+    def current_features(self):
+        return self._views[self._current]
+
+    @property
+    def next_features(self):
+        return self._views[self._next]
+
+    @property
+    def current_state(self):
+        return self._states[self._current]
+
+    @property
+    def next_state(self):
+        return self._states[self._next]
 
     def update(self, features, state):
         """Update the state with new features and state."""
-        self.current_features = copy.deepcopy(self.next_features)
-        self.next_features = copy.deepcopy(features)
-        self.current_state = self.next_state.clone()
-        self.next_state = state.clone()
+        slot = (self._next + 1) % self._slots
+        self._write(slot, features, state)
+        self._current, self._next = self._next, slot
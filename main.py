@@ -1,5 +1,9 @@
-from game_controller import GameController
-
-if __name__ == '__main__':
+def main():
+    # Imported here, not at module level: spawned learner processes re-import __main__ and must not
+    # load the capture and control stack
+    from game_controller import GameController
     GameController().run()
 
+
+if __name__ == '__main__':
+    main()
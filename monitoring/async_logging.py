@@ -0,0 +1,146 @@
+# async_logging.py
+
+import atexit
+import logging
+import os
+import queue
+import sys
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+LOG_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+
+
+class DroppingQueueHandler(QueueHandler):
+    """
+    Queue handler that never blocks the caller.
+
+    Records are enqueued unformatted; formatting happens on the listener thread. When the queue is
+    full the record is dropped and counted.
+    """
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # Keep the record as is: the listener formats it. Only freeze mutable args into the message
+        # when they are not plain values, so later mutation by the caller cannot change the log line.
+        if record.args and not all(isinstance(arg, (str, int, float, bool, type(None))) for arg in record.args):
+            record.msg = record.getMessage()
+            record.args = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Per call-site rate limiting for records below `max_level`.
+
+    Each call site (file and line) may emit `burst` records, refilled at `rate` records per second.
+    Suppressed records are counted and reported on the next record that passes from the same site.
+    """
+
+    def __init__(self, rate=1.0, burst=5, max_level=logging.WARNING):
+        super().__init__()
+        self.rate = rate
+        self.burst = burst
+        self.max_level = max_level
+        self.sites = {}
+        self.suppressed = 0
+        self.lock = threading.Lock()
+
+    def filter(self, record):
+        if record.levelno > self.max_level:
+            return True
+        key = (record.pathname, record.lineno)
+        now = time.monotonic()
+        with self.lock:
+            tokens, last, skipped = self.sites.get(key, (self.burst, now, 0))
+            tokens = min(self.burst, tokens + (now - last) * self.rate)
+            if tokens < 1:
+                self.sites[key] = (tokens, now, skipped + 1)
+                self.suppressed += 1
+                return False
+            self.sites[key] = (tokens - 1, now, 0)
+        if skipped:
+            record.msg = f"{record.msg} [{skipped} similar messages suppressed]"
+        return True
+
+
+class LoggingPipeline:
+    """Handles of the running queue-based logging setup, for stats and shutdown."""
+
+    def __init__(self, queue_handler, rate_filter, listener):
+        self.queue_handler = queue_handler
+        self.rate_filter = rate_filter
+        self.listener = listener
+        self.stopped = False
+
+    def stats(self):
+        """Return counts of records dropped on a full queue and suppressed by rate limiting."""
+        return {
+            'dropped': self.queue_handler.dropped,
+            'suppressed': self.rate_filter.suppressed,
+            'queued': self.queue_handler.queue.qsize(),
+        }
+
+    def stop(self):
+        """Flush the queue and stop the listener thread."""
+        if not self.stopped:
+            self.stopped = True
+            self.listener.stop()
+
+
+def setup_logging(log_file='./logs/game_controller.log', level=logging.INFO, queue_size=10000, rate=1.0,
+                  burst=5, console=True):
+    """
+    Route all logging through a bounded queue to a background listener thread.
+
+    Existing root handlers (e.g. from `logging.basicConfig`) are replaced. Records are rate limited
+    per call site before they are enqueued, so hot-path messages cost at most a filter check, and a
+    full queue drops records instead of stalling the caller.
+
+    Args:
+        log_file (str): Rotating log file written by the listener.
+        level (int): Root logger level.
+        queue_size (int): Maximum number of records waiting for the listener.
+        rate (float): Records per second allowed per call site once its burst is spent.
+        burst (int): Records a call site may emit back to back.
+        console (bool): Also write records to stderr.
+
+    Returns:
+        LoggingPipeline: The running pipeline.
+    """
+    directory = os.path.dirname(log_file)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+    formatter = logging.Formatter(LOG_FORMAT)
+    handlers = [RotatingFileHandler(log_file, maxBytes=10 * 1024 * 1024, backupCount=5)]
+    if console:
+        handlers.append(logging.StreamHandler(sys.stderr))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    queue_handler = DroppingQueueHandler(queue.Queue(maxsize=queue_size))
+    rate_filter = RateLimitFilter(rate=rate, burst=burst)
+    queue_handler.addFilter(rate_filter)
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+
+    listener = QueueListener(queue_handler.queue, *handlers, respect_handler_level=True)
+    listener.start()
+    pipeline = LoggingPipeline(queue_handler, rate_filter, listener)
+    atexit.register(pipeline.stop)
+    return pipeline
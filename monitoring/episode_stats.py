@@ -0,0 +1,113 @@
+# episode_stats.py
+
+import os
+import numpy as np
+
+
+class EpisodeStats:
+    """
+    Per-episode metrics in fixed-size NumPy ring arrays, one column per metric.
+
+    The last `capacity` episodes are kept; memory does not grow with the number of episodes. The
+    mean over the last `window` episodes and the lifetime count, sum, min and max of every metric
+    are updated incrementally on `record`, and the rolling means at each episode are stored next to
+    its values. Rows recorded since the last `export` are written to TensorBoard in one batch.
+    """
+
+    def __init__(self, metrics, capacity=1000, window=100):
+        if window > capacity:
+            raise ValueError("window must not exceed capacity")
+        self.metrics = tuple(metrics)
+        self.columns = {name: i for i, name in enumerate(self.metrics)}
+        self.capacity = capacity
+        self.window = window
+        self.values = np.zeros((len(self.metrics), capacity))
+        self.rolling_means = np.zeros((len(self.metrics), capacity))
+        self.episodes = np.zeros(capacity, dtype=np.int64)
+        self.count = 0
+        self.exported = 0
+        self.window_sum = np.zeros(len(self.metrics))
+        self.total = np.zeros(len(self.metrics))
+        self.minimum = np.full(len(self.metrics), np.inf)
+        self.maximum = np.full(len(self.metrics), -np.inf)
+
+    def __len__(self):
+        return min(self.count, self.capacity)
+
+    def _order(self, last=None):
+        """Ring slots of the last `last` (default: all kept) episodes, oldest first."""
+        n = len(self) if last is None else min(last, len(self))
+        return np.arange(self.count - n, self.count) % self.capacity
+
+    def record(self, episode, values):
+        """
+        Add one episode.
+
+        Args:
+            episode (int): Episode number, used as the TensorBoard step.
+            values (Mapping): Metric name -> value; missing metrics are recorded as 0.
+        """
+        row = np.array([float(values.get(name, 0.0)) for name in self.metrics])
+        slot = self.count % self.capacity
+        if (self.count + 1) % self.capacity == 0:
+            # Once per lap, re-add the window from the stored values so rounding errors do not accumulate
+            self.window_sum = self.values[:, self._order(self.window - 1)].sum(axis=1) + row
+        else:
+            if self.count >= self.window:
+                self.window_sum -= self.values[:, (self.count - self.window) % self.capacity]
+            self.window_sum += row
+        self.count += 1
+        self.values[:, slot] = row
+        self.episodes[slot] = episode
+        self.rolling_means[:, slot] = self.window_sum / min(self.count, self.window)
+        self.total += row
+        np.minimum(self.minimum, row, out=self.minimum)
+        np.maximum(self.maximum, row, out=self.maximum)
+
+    def rolling_mean(self, name):
+        """Mean of a metric over the last `window` episodes."""
+        return self.window_sum[self.columns[name]] / min(self.count, self.window) if self.count else 0.0
+
+    def column(self, name, last=None):
+        """Values of a metric for the last `last` (default: all kept) episodes, oldest first."""
+        return self.values[self.columns[name], self._order(last)]
+
+    def summary(self):
+        """Lifetime and rolling aggregates of every metric."""
+        if not self.count:
+            return {}
+        means = self.window_sum / min(self.count, self.window)
+        return {name: {'mean': float(self.total[i] / self.count), 'rolling_mean': float(means[i]),
+                       'min': float(self.minimum[i]), 'max': float(self.maximum[i])}
+                for i, name in enumerate(self.metrics)}
+
+    def export(self, metrics_writer, prefix='Episode'):
+        """
+        Queue the episodes recorded since the last export to a MetricsWriter.
+
+        Each episode logs `<prefix>/<metric>` and `<prefix>/<metric>_mean` (the rolling mean at that
+        episode). Episodes that already left the ring are skipped.
+        """
+        pending = min(self.count - self.exported, len(self))
+        for slot in self._order(pending):
+            scalars = {f"{prefix}/{name}": value for name, value in zip(self.metrics, self.values[:, slot].tolist())}
+            scalars.update({f"{prefix}/{name}_mean": value
+                            for name, value in zip(self.metrics, self.rolling_means[:, slot].tolist())})
+            metrics_writer.add_scalars(scalars, int(self.episodes[slot]))
+        self.exported = self.count
+
+    def save(self, path):
+        """Write the kept episodes (oldest first) and the lifetime aggregates to a compressed .npz file."""
+        order = self._order()
+        temp_path = f"{path}.tmp.npz"
+        np.savez_compressed(temp_path, metrics=np.array(self.metrics), episodes=self.episodes[order],
+                            values=self.values[:, order].astype(np.float32),
+                            rolling_means=self.rolling_means[:, order].astype(np.float32),
+                            count=self.count, total=self.total, minimum=self.minimum, maximum=self.maximum)
+        os.replace(temp_path, path)
+
+    @staticmethod
+    def load(path):
+        """Read a file written by `save` into a dict of arrays."""
+        with np.load(path) as data:
+            return {key: data[key] for key in data.files}
@@ -0,0 +1,76 @@
+# metrics_writer.py
+
+import logging
+import queue
+import threading
+import time
+
+
+class MetricsWriter:
+    """
+    Buffer TensorBoard scalars and histograms and write them from a background thread.
+
+    The learner only enqueues host values; the SummaryWriter calls happen on the writer thread,
+    batched every `flush_interval` seconds. If the queue is full, entries are dropped and counted.
+    """
+
+    def __init__(self, writer, flush_interval=5.0, max_pending=10000):
+        self.writer = writer
+        self.flush_interval = flush_interval
+        self.queue = queue.Queue(maxsize=max_pending)
+        self.dropped = 0
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _put(self, item):
+        try:
+            self.queue.put_nowait(item)
+        except queue.Full:
+            self.dropped += 1
+
+    def add_scalars(self, scalars, step):
+        """Queue a dict of tag -> float, all logged at `step`."""
+        self._put(('scalars', scalars, step))
+
+    def add_histogram(self, tag, values, step):
+        """Queue a histogram of a host array (e.g. NumPy) at `step`."""
+        self._put(('histogram', (tag, values), step))
+
+    def _write(self, item):
+        kind, payload, step = item
+        if kind == 'scalars':
+            for tag, value in payload.items():
+                self.writer.add_scalar(tag, value, step)
+        else:
+            tag, values = payload
+            self.writer.add_histogram(tag, values, step)
+
+    def _run(self):
+        pending = []
+        next_flush = time.monotonic() + self.flush_interval
+        closing = False
+        while not closing:
+            try:
+                item = self.queue.get(timeout=max(0.0, next_flush - time.monotonic()))
+                if item is None:
+                    closing = True
+                else:
+                    pending.append(item)
+            except queue.Empty:
+                pass
+            if closing or time.monotonic() >= next_flush:
+                try:
+                    for item in pending:
+                        self._write(item)
+                    self.writer.flush()
+                except Exception as e:
+                    logging.warning(f"Failed to write metrics: {e}")
+                pending = []
+                next_flush = time.monotonic() + self.flush_interval
+
+    def close(self):
+        """Write everything still queued and stop the writer thread."""
+        self.queue.put(None)
+        self.thread.join()
+        if self.dropped:
+            logging.warning(f"Metrics writer dropped {self.dropped} entries.")
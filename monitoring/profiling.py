@@ -0,0 +1,223 @@
+# profiling.py
+
+import functools
+import logging
+import os
+import signal
+import threading
+import time
+import torch
+
+logger = logging.getLogger(__name__)
+
+# Steps captured per request when the trigger does not say otherwise
+PROFILE_STEPS = 20
+# Folder for Chrome traces and operator tables
+PROFILE_DIR = './logs/profiles'
+# Touching `<PROFILE_SENTINEL_PREFIX><name>` (e.g. ./logs/profile.learner) profiles that loop; the
+# file may contain the number of steps. It is deleted once seen.
+PROFILE_SENTINEL_PREFIX = './logs/profile.'
+PROFILE_POLL_INTERVAL = 1.0
+# Signal that arms every profiler of the process (SIGBREAK, i.e. Ctrl+Break, on Windows)
+PROFILE_SIGNAL = getattr(signal, 'SIGUSR1', None) or getattr(signal, 'SIGBREAK', None)
+# Rows of the operator summary table
+PROFILE_TABLE_ROWS = 40
+
+# torch.profiler can only run one capture per process at a time
+_capture_lock = threading.Lock()
+
+
+def parse_step_range(value):
+    """Parse a 'start:stop' step range (e.g. from SEKIRO_PROFILE_LEARNER) into a tuple, or None."""
+    if not value:
+        return None
+    start, stop = value.split(':')
+    return int(start), int(stop)
+
+
+class OnDemandProfiler:
+    """
+    Capture a few steps of a loop (learner updates, actor decisions) with `torch.profiler`.
+
+    A capture is requested at runtime with `request` (from a signal handler or the sentinel file
+    poller) or configured as a step range [start, stop). The next steps run inside one profiler
+    session; after the last one, a Chrome trace and an operator summary table are written to
+    `log_dir`. While idle, the `profiled` wrapper only checks a flag, so the hooks can stay in the
+    hot path.
+    """
+
+    def __init__(self, name, steps=PROFILE_STEPS, step_range=None, log_dir=PROFILE_DIR):
+        self.name = name
+        self.steps = steps
+        self.step_range = step_range
+        self.log_dir = log_dir
+        self.requested = 0
+        self.remaining = 0
+        self.calls = 0
+        self.session = None
+        self.first_step = None
+        self.idle = step_range is None
+
+    def request(self, steps=None):
+        """Profile the next `steps` steps (default `self.steps`); safe to call from any thread."""
+        self.requested = steps or self.steps
+        self.idle = False
+
+    def _due(self, step):
+        if self.requested:
+            return True
+        if self.step_range is None:
+            return False
+        if step >= self.step_range[1]:
+            # The range is behind us (e.g. after restoring a later checkpoint); stop checking it
+            self.step_range = None
+            self.idle = True
+            return False
+        return self.step_range[0] <= step
+
+    def _start(self, step):
+        if not _capture_lock.acquire(blocking=False):
+            return False
+        activities = [torch.profiler.ProfilerActivity.CPU]
+        if torch.cuda.is_available():
+            activities.append(torch.profiler.ProfilerActivity.CUDA)
+        try:
+            self.session = torch.profiler.profile(activities=activities, record_shapes=True, profile_memory=True)
+            self.session.__enter__()
+        except Exception as e:
+            _capture_lock.release()
+            self.session = None
+            self.requested = 0
+            logger.error(f"Failed to start the {self.name} profiler: {e}")
+            return False
+        if self.requested:
+            self.remaining, self.requested = self.requested, 0
+        else:
+            self.remaining = self.step_range[1] - step
+        self.first_step = step
+        logger.info(f"Profiling {self.remaining} {self.name} steps from step {step}")
+        return True
+
+    def _finish(self, step):
+        session, self.session = self.session, None
+        try:
+            session.__exit__(None, None, None)
+            self.export(session, step)
+        except Exception as e:
+            logger.error(f"Failed to write the {self.name} profile: {e}")
+        finally:
+            _capture_lock.release()
+        if self.step_range is not None and step + 1 >= self.step_range[1]:
+            self.step_range = None
+        self.idle = not self.requested and self.step_range is None
+
+    def export(self, session, last_step):
+        """Write the Chrome trace and the operator summary table of a finished capture."""
+        os.makedirs(self.log_dir, exist_ok=True)
+        base = os.path.join(self.log_dir, f"{self.name}_{self.first_step}-{last_step}_{time.strftime('%Y%m%d_%H%M%S')}")
+        session.export_chrome_trace(f"{base}.trace.json")
+        sort_by = 'self_cuda_time_total' if torch.cuda.is_available() else 'self_cpu_time_total'
+        with open(f"{base}.txt", 'w') as f:
+            f.write(session.key_averages().table(sort_by=sort_by, row_limit=PROFILE_TABLE_ROWS))
+            f.write('\n\nGrouped by input shape:\n')
+            f.write(session.key_averages(group_by_input_shape=True).table(sort_by=sort_by,
+                                                                         row_limit=PROFILE_TABLE_ROWS))
+        logger.info(f"Wrote {self.name} profile of steps {self.first_step}-{last_step} to {base}.trace.json "
+                    f"and {base}.txt")
+
+    def run(self, func, step, *args, **kwargs):
+        """Call `func` as one profiled step, starting or finishing a capture when due."""
+        step = self.calls if step is None else step
+        self.calls += 1
+        if self.session is None and not (self._due(step) and self._start(step)):
+            return func(*args, **kwargs)
+        try:
+            with torch.profiler.record_function(f"{self.name}.step"):
+                return func(*args, **kwargs)
+        finally:
+            self.session.step()
+            self.remaining -= 1
+            if self.remaining <= 0:
+                self._finish(step)
+
+
+def profiled(profiler, step_attr=None):
+    """
+    Decorator running each call of a method as one step of `profiler`; a flag check while idle.
+
+    Args:
+        profiler (OnDemandProfiler): Profiler of the loop.
+        step_attr (str): Attribute of the instance holding the step number (e.g. 'global_step'),
+            matched against the step range. By default calls are counted; idle calls skip the counter,
+            so only a configured range (which keeps the profiler armed from the start) counts them all.
+    """
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(self, *args, **kwargs):
+            if profiler.idle:
+                return func(self, *args, **kwargs)
+            step = getattr(self, step_attr) if step_attr else None
+            return profiler.run(func, step, self, *args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+class ProfileTriggers:
+    """
+    Arm profilers from outside the process: a signal (PROFILE_SIGNAL) arms all of them, and a
+    daemon thread polls one sentinel file per profiler.
+    """
+
+    def __init__(self, profilers, sentinel_prefix=PROFILE_SENTINEL_PREFIX, poll_interval=PROFILE_POLL_INTERVAL):
+        self.profilers = list(profilers)
+        self.sentinel_prefix = sentinel_prefix
+        self.poll_interval = poll_interval
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def _on_signal(self, signum, frame):
+        for profiler in self.profilers:
+            profiler.request()
+
+    def poll(self):
+        """Arm the profilers whose sentinel file exists, and delete it."""
+        for profiler in self.profilers:
+            path = self.sentinel_prefix + profiler.name
+            if not os.path.exists(path):
+                continue
+            try:
+                with open(path) as f:
+                    content = f.read().strip()
+                os.remove(path)
+            except OSError:
+                continue
+            steps = int(content) if content.isdigit() else None
+            profiler.request(steps)
+            logger.info(f"Profile requested by {path}")
+
+    def start(self):
+        if PROFILE_SIGNAL is not None and threading.current_thread() is threading.main_thread():
+            signal.signal(PROFILE_SIGNAL, self._on_signal)
+        directory = os.path.dirname(self.sentinel_prefix)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        def poll_loop():
+            while not self.stop_event.wait(self.poll_interval):
+                self.poll()
+
+        self.thread = threading.Thread(target=poll_loop, name='profile-triggers', daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+
+learner_profiler = OnDemandProfiler('learner', step_range=parse_step_range(os.environ.get('SEKIRO_PROFILE_LEARNER')))
+actor_profiler = OnDemandProfiler('actor', step_range=parse_step_range(os.environ.get('SEKIRO_PROFILE_ACTOR')))
@@ -0,0 +1,227 @@
+# tracing.py
+
+import functools
+import json
+import logging
+import os
+import threading
+import time
+
+# Histogram buckets are powers of two in microseconds: bucket i holds durations in [2^(i-1), 2^i) us
+NUM_BUCKETS = 28
+
+
+class Histogram:
+    """Log2-bucketed duration histogram with count, sum, min and max."""
+
+    __slots__ = ('buckets', 'count', 'total_ns', 'min_ns', 'max_ns')
+
+    def __init__(self):
+        self.buckets = [0] * NUM_BUCKETS
+        self.count = 0
+        self.total_ns = 0
+        self.min_ns = None
+        self.max_ns = 0
+
+    def record(self, duration_ns):
+        self.buckets[min((duration_ns // 1000).bit_length(), NUM_BUCKETS - 1)] += 1
+        self.count += 1
+        self.total_ns += duration_ns
+        if self.min_ns is None or duration_ns < self.min_ns:
+            self.min_ns = duration_ns
+        if duration_ns > self.max_ns:
+            self.max_ns = duration_ns
+
+    def percentile(self, q):
+        """Approximate the q-th percentile in milliseconds, interpolating inside the bucket."""
+        if not self.count:
+            return 0.0
+        target = q / 100 * self.count
+        seen = 0
+        for i, n in enumerate(self.buckets):
+            if n and seen + n >= target:
+                lower_us = (1 << i) >> 1
+                upper_us = 1 << i
+                value_ns = (lower_us + (target - seen) / n * (upper_us - lower_us)) * 1000
+                return min(max(value_ns, self.min_ns), self.max_ns) / 1e6
+            seen += n
+        return self.max_ns / 1e6
+
+    def summary(self):
+        return {
+            'count': self.count,
+            'mean_ms': self.total_ns / self.count / 1e6 if self.count else 0.0,
+            'min_ms': (self.min_ns or 0) / 1e6,
+            'p50_ms': self.percentile(50),
+            'p95_ms': self.percentile(95),
+            'p99_ms': self.percentile(99),
+            'max_ms': self.max_ns / 1e6,
+            'buckets': list(self.buckets),
+        }
+
+
+class _NullSpan:
+    """Span returned while tracing is disabled; entering and leaving it does nothing."""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    __slots__ = ('tracer', 'name', 'start')
+
+    def __init__(self, tracer, name):
+        self.tracer = tracer
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        self.tracer.record(self.name, time.perf_counter_ns() - self.start)
+        return False
+
+
+class Tracer:
+    """
+    Collect per-span duration histograms in process and export them periodically.
+
+    While disabled, `span` returns a shared no-op object and `traced` functions only pay a flag
+    check, so the instrumentation can stay in the hot path.
+    """
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.histograms = {}
+        self.laps = {}
+        self.lock = threading.Lock()
+        self.window_start = time.time()
+        self.exporter_thread = None
+        self.exporter_stop = threading.Event()
+
+    def span(self, name):
+        """Return a context manager timing its body under `name`."""
+        if not self.enabled:
+            return NULL_SPAN
+        return _Span(self, name)
+
+    def record(self, name, duration_ns):
+        with self.lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram()
+            histogram.record(duration_ns)
+
+    def lap(self, name):
+        """Record the time since the previous `lap` with the same name, e.g. once per control step."""
+        if not self.enabled:
+            return
+        now = time.perf_counter_ns()
+        previous = self.laps.get(name)
+        self.laps[name] = now
+        if previous is not None:
+            self.record(name, now - previous)
+
+    def reset_lap(self, name):
+        """Forget the previous lap so a pause (e.g. between episodes) is not recorded."""
+        self.laps.pop(name, None)
+
+    def snapshot(self, reset=True):
+        """
+        Summarize all spans recorded since the last reset.
+
+        Returns:
+            dict: Window start/end times and span name -> summary statistics.
+        """
+        with self.lock:
+            histograms, window_start = self.histograms, self.window_start
+            if reset:
+                self.histograms = {}
+                self.window_start = time.time()
+        window_end = time.time()
+        spans = {}
+        for name, histogram in histograms.items():
+            spans[name] = histogram.summary()
+            spans[name]['per_sec'] = histogram.count / max(window_end - window_start, 1e-9)
+        return {'window_start': window_start, 'window_end': window_end, 'spans': spans}
+
+    def export(self, writer=None, path=None, step=None):
+        """Write the current window to TensorBoard and/or append it as one JSON line to `path`."""
+        snapshot = self.snapshot(reset=True)
+        if not snapshot['spans']:
+            return snapshot
+        if writer is not None:
+            for name, stats in snapshot['spans'].items():
+                for key in ('mean_ms', 'p50_ms', 'p95_ms', 'p99_ms', 'max_ms', 'per_sec'):
+                    writer.add_scalar(f'Timing/{name}/{key}', stats[key], step)
+        if path is not None:
+            with open(path, 'a') as f:
+                f.write(json.dumps(snapshot) + '\n')
+        return snapshot
+
+    def start_exporter(self, writer=None, path='./logs/timings.jsonl', interval=30.0):
+        """Export every `interval` seconds from a daemon thread, off the control loop."""
+        if self.exporter_thread is not None:
+            return
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        def export_loop():
+            step = 0
+            while not self.exporter_stop.wait(interval):
+                try:
+                    self.export(writer, path, step)
+                except Exception as e:
+                    logging.warning(f"Failed to export timings: {e}")
+                step += 1
+
+        self.exporter_thread = threading.Thread(target=export_loop, daemon=True)
+        self.exporter_thread.start()
+
+    def stop_exporter(self):
+        self.exporter_stop.set()
+        if self.exporter_thread is not None:
+            self.exporter_thread.join()
+            self.exporter_thread = None
+
+
+tracer = Tracer(enabled=os.environ.get('SEKIRO_TRACE', '0') == '1')
+
+
+def span(name):
+    """Time a block under `name` with the process-wide tracer."""
+    return tracer.span(name)
+
+
+def traced(name):
+    """Decorator timing every call of the function under `name`; a flag check when tracing is disabled."""
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not tracer.enabled:
+                return func(*args, **kwargs)
+            start = time.perf_counter_ns()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                tracer.record(name, time.perf_counter_ns() - start)
+
+        return wrapper
+
+    return decorator
+
+
+def enable(enabled=True):
+    """Turn tracing on or off at runtime."""
+    tracer.enabled = enabled
@@ -0,0 +1,61 @@
+# offline_train.py
+
+import argparse
+import logging
+import os
+from dqn.dueling_dqn import DQNAgent, BIG_BATCH_SIZE
+from dqn.offline import load_trajectories, run_offline_training
+from recording.trajectory_reader import TrajectoryReader
+from monitoring.async_logging import setup_logging
+from monitoring.profiling import ProfileTriggers, learner_profiler
+
+logger = logging.getLogger(__name__)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Train the Dueling DQN agent from recorded trajectories.")
+    parser.add_argument('sessions', nargs='+', help="Session folders written by TrajectoryRecorder.")
+    parser.add_argument('--model-folder', default='./models', help="Folder for checkpoints.")
+    parser.add_argument('--steps', type=int, default=10000, help="Number of gradient steps.")
+    parser.add_argument('--batch-size', type=int, default=None,
+                        help="Fixed minibatch size; by default the batch size adapts to the measured step time.")
+    parser.add_argument('--replay-size', type=int, default=20000,
+                        help="Replay buffer capacity (at most this many transitions are loaded).")
+    parser.add_argument('--prefetch', type=int, default=4, help="Number of batches prefetched.")
+    parser.add_argument('--accumulate', type=int, default=1,
+                        help="Minibatches whose gradients are accumulated into each optimizer step.")
+    parser.add_argument('--checkpoint-interval', type=int, default=1000)
+    parser.add_argument('--log-interval', type=int, default=100)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    setup_logging('./logs/offline_train.log')
+    os.makedirs(args.model_folder, exist_ok=True)
+
+    # Training resumes from the latest checkpoint of the model folder, or starts from random weights
+    agent = DQNAgent(3, 3, None, args.model_folder, replay_size=args.replay_size, restore_replay=False,
+                     start_training=False)
+    agent.checkpoint_interval = args.checkpoint_interval
+    agent.replay_save_interval = 0
+    agent.gradient_accumulation_steps = args.accumulate
+    if args.batch_size:
+        agent.batch_sizer = None
+
+    stored = load_trajectories(agent, [TrajectoryReader(folder) for folder in args.sessions], args.replay_size)
+    if stored < (args.batch_size or BIG_BATCH_SIZE):
+        logger.error(f"Only {stored} transitions loaded; at least {args.batch_size or BIG_BATCH_SIZE} are needed "
+                     f"to train.")
+        return
+
+    profile_triggers = ProfileTriggers((learner_profiler,))
+    profile_triggers.start()
+    run_offline_training(agent, args.steps, args.batch_size, args.prefetch, args.log_interval)
+    profile_triggers.stop()
+    agent.save_checkpoint()
+    agent.close_metrics()
+
+
+if __name__ == '__main__':
+    main()
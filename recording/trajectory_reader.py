@@ -0,0 +1,82 @@
+# trajectory_reader.py
+
+import json
+import os
+import numpy as np
+from recording.trajectory_recorder import INDEX_FILE
+
+
+class TrajectoryReader:
+    """
+    Random access to a session written by `TrajectoryRecorder`.
+
+    Only the chunks of the requested episode are opened, and only the requested columns are
+    decompressed, so reading features and actions does not pay for the frames.
+    """
+
+    def __init__(self, folder):
+        self.folder = folder
+        with open(os.path.join(folder, INDEX_FILE)) as f:
+            self.index = json.load(f)
+        self.chunks = self.index['chunks']
+        # Session settings given to the recorder, e.g. {'action_repeat': 1}; empty for older sessions
+        self.metadata = self.index.get('metadata', {})
+        self.episode_chunks = {int(episode): sorted(chunk_ids, key=lambda c: self.chunks[c]['first_step'])
+                               for episode, chunk_ids in self.index['episodes'].items()}
+
+    def episodes(self):
+        """Return the recorded episode indices in ascending order."""
+        return sorted(self.episode_chunks)
+
+    def num_steps(self, episode):
+        """Return the number of recorded steps (including the final observation) of an episode."""
+        return sum(self.chunks[c]['num_steps'] for c in self.episode_chunks[episode])
+
+    def total_steps(self):
+        """Return the number of recorded steps in the whole session."""
+        return sum(chunk['num_steps'] for chunk in self.chunks)
+
+    def _load_chunk(self, chunk_id, fields=None):
+        path = os.path.join(self.folder, self.chunks[chunk_id]['file'])
+        with np.load(path) as data:
+            keys = data.files if fields is None else [key for key in fields if key in data.files]
+            return {key: data[key] for key in keys}
+
+    def iter_episode_chunks(self, episode, fields=None):
+        """Yield the columns of an episode one chunk at a time, in step order, to bound memory."""
+        for chunk_id in self.episode_chunks[episode]:
+            yield self._load_chunk(chunk_id, fields)
+
+    def load_episode(self, episode, fields=None):
+        """
+        Load the columns of one episode.
+
+        Args:
+            episode (int): Episode index.
+            fields (list): Column names to load (e.g. ['feat_boss_hp', 'action']); None loads all.
+
+        Returns:
+            dict: Column name -> array concatenated over the episode's chunks.
+        """
+        parts = list(self.iter_episode_chunks(episode, fields))
+        return {key: np.concatenate([part[key] for part in parts]) for key in parts[0]}
+
+    def get_step(self, episode, step, fields=None):
+        """
+        Load a single step of an episode, opening only the chunk that contains it.
+
+        Returns:
+            dict: Column name -> value for that step.
+        """
+        for chunk_id in self.episode_chunks[episode]:
+            chunk = self.chunks[chunk_id]
+            offset = step - chunk['first_step']
+            if 0 <= offset < chunk['num_steps']:
+                data = self._load_chunk(chunk_id, fields)
+                return {key: column[offset] for key, column in data.items()}
+        raise IndexError(f"Step {step} not recorded for episode {episode}")
+
+    def iter_episodes(self, fields=None):
+        """Yield (episode, columns) for every recorded episode in order."""
+        for episode in self.episodes():
+            yield episode, self.load_episode(episode, fields)
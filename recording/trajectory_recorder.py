@@ -0,0 +1,208 @@
+# trajectory_recorder.py
+
+import json
+import logging
+import os
+import queue
+import threading
+import time
+import numpy as np
+
+INDEX_FILE = 'index.json'
+CHUNK_PATTERN = 'chunk_{:06d}.npz'
+FORMAT_VERSION = 1
+
+
+def new_session_folder(root='./recordings'):
+    """
+    Create a fresh, timestamped session folder below the recordings root.
+
+    Args:
+        root (str): Folder holding all recorded sessions.
+
+    Returns:
+        str: Path of the created session folder.
+    """
+    folder = os.path.join(root, time.strftime('session_%Y%m%d_%H%M%S'))
+    os.makedirs(folder, exist_ok=True)
+    return folder
+
+
+class _Chunk:
+    """Preallocated column arrays for up to `capacity` consecutive steps of one episode."""
+
+    def __init__(self, capacity, window_shape, bar_shapes, feature_keys):
+        self.capacity = capacity
+        self.columns = {
+            'step': np.zeros(capacity, dtype=np.int32),
+            'game_window': np.zeros((capacity,) + window_shape, dtype=np.uint8),
+            'action': np.zeros(capacity, dtype=np.int16),
+            'reward': np.zeros(capacity, dtype=np.float32),
+            'done': np.zeros(capacity, dtype=np.int8),
+            't_capture': np.zeros(capacity, dtype=np.float64),
+            't_action': np.zeros(capacity, dtype=np.float64),
+        }
+        for key, shape in bar_shapes.items():
+            self.columns[f'bar_{key}'] = np.zeros((capacity,) + shape, dtype=np.uint8)
+        for key in feature_keys:
+            self.columns[f'feat_{key}'] = np.zeros(capacity, dtype=np.float32)
+        self.episode = -1
+        self.length = 0
+
+    def reset(self, episode):
+        self.episode = episode
+        self.length = 0
+
+    def full(self):
+        return self.length >= self.capacity
+
+
+class TrajectoryRecorder:
+    """
+    Stream control steps into compressed, chunked trajectory files.
+
+    Each step (game window crop, bar crops, features, action, reward and timestamps) is copied into
+    a preallocated chunk. Full chunks are compressed and written by a background thread, so the
+    control loop only pays for the copy. A fixed pool of chunks bounds memory: if the writer falls
+    behind and no chunk is free, steps are dropped and counted instead of blocking the caller.
+
+    A chunk never spans two episodes, and `index.json` maps every episode to its chunks, so any
+    (episode, step) can be loaded without reading the rest of the session.
+    """
+
+    def __init__(self, folder, chunk_size=64, max_pending_chunks=3, metadata=None):
+        self.folder = folder
+        os.makedirs(folder, exist_ok=True)
+        self.chunk_size = chunk_size
+        self.pool_size = max_pending_chunks + 1
+        self.free_chunks = queue.Queue()
+        self.write_queue = queue.Queue()
+        self.current_chunk = None
+        self.chunks_allocated = 0
+        self.next_chunk_id = 0
+        self.dropped_steps = 0
+        self.recorded_steps = 0
+        self.index = {'version': FORMAT_VERSION, 'chunks': [], 'episodes': {}, 'metadata': dict(metadata or {})}
+        self.index_lock = threading.Lock()
+        self.writer_thread = threading.Thread(target=self._writer_loop, daemon=True)
+        self.writer_thread.start()
+
+    def _acquire_chunk(self, episode, game_window_img, screens, features):
+        """Take a free chunk from the pool, allocating lazily until the pool is full."""
+        try:
+            chunk = self.free_chunks.get_nowait()
+        except queue.Empty:
+            if self.chunks_allocated >= self.pool_size:
+                return None
+            bar_shapes = {key: img.shape for key, img in screens.items()}
+            chunk = _Chunk(self.chunk_size, game_window_img.shape, bar_shapes, list(features))
+            self.chunks_allocated += 1
+        chunk.reset(episode)
+        return chunk
+
+    def record_step(self, episode, step, game_window_img, screens, features, action, reward, done,
+                    t_capture, t_action):
+        """
+        Record one control step. Never blocks; the step is dropped if every chunk is still pending.
+
+        Args:
+            episode (int): Episode index.
+            step (int): Step index within the episode.
+            game_window_img (np.ndarray): uint8 game window crop the action was chosen on.
+            screens (dict): uint8 bar crops keyed by region name.
+            features (Mapping): Extracted features for the same frame.
+            action (int): Action taken, or -1 for an observation without an action.
+            reward (float): Reward received for the transition.
+            done (int): Episode termination flag (0, 1 dead, 2 boss defeated).
+            t_capture (float): Time the frame was captured.
+            t_action (float): Time the action was issued.
+        """
+        chunk = self.current_chunk
+        if chunk is not None and (chunk.episode != episode or chunk.full()):
+            self._submit_current()
+            chunk = None
+        if chunk is None:
+            chunk = self._acquire_chunk(episode, game_window_img, screens, features)
+            if chunk is None:
+                self.dropped_steps += 1
+                return
+            self.current_chunk = chunk
+
+        i = chunk.length
+        columns = chunk.columns
+        columns['step'][i] = step
+        columns['game_window'][i] = game_window_img
+        for key, img in screens.items():
+            columns[f'bar_{key}'][i] = img
+        for key, value in features.items():
+            columns[f'feat_{key}'][i] = value
+        columns['action'][i] = action
+        columns['reward'][i] = reward
+        columns['done'][i] = done
+        columns['t_capture'][i] = t_capture
+        columns['t_action'][i] = t_action
+        chunk.length += 1
+        self.recorded_steps += 1
+
+    def end_episode(self, episode, step, game_window_img, screens, features, t_capture):
+        """Record the final observation of an episode (action -1) and flush its last chunk."""
+        self.record_step(episode, step, game_window_img, screens, features, -1, 0.0, 0, t_capture, t_capture)
+        self._submit_current()
+
+    def _submit_current(self):
+        if self.current_chunk is not None and self.current_chunk.length > 0:
+            self.write_queue.put((self.next_chunk_id, self.current_chunk))
+            self.next_chunk_id += 1
+        elif self.current_chunk is not None:
+            self.free_chunks.put(self.current_chunk)
+        self.current_chunk = None
+
+    def _writer_loop(self):
+        """Compress and write submitted chunks, then hand their buffers back to the pool."""
+        while True:
+            item = self.write_queue.get()
+            if item is None:
+                break
+            chunk_id, chunk = item
+            try:
+                self._write_chunk(chunk_id, chunk)
+            except Exception as e:
+                logging.error(f"Failed to write trajectory chunk {chunk_id}: {e}")
+            finally:
+                self.free_chunks.put(chunk)
+
+    def _write_chunk(self, chunk_id, chunk):
+        filename = CHUNK_PATTERN.format(chunk_id)
+        path = os.path.join(self.folder, filename)
+        temp_path = f"{path}.tmp"
+        n = chunk.length
+        with open(temp_path, 'wb') as f:
+            np.savez_compressed(f, **{key: column[:n] for key, column in chunk.columns.items()})
+        os.replace(temp_path, path)
+
+        entry = {
+            'file': filename,
+            'episode': int(chunk.episode),
+            'first_step': int(chunk.columns['step'][0]),
+            'num_steps': int(n),
+        }
+        with self.index_lock:
+            self.index['chunks'].append(entry)
+            self.index['episodes'].setdefault(str(chunk.episode), []).append(len(self.index['chunks']) - 1)
+            self._write_index()
+
+    def _write_index(self):
+        path = os.path.join(self.folder, INDEX_FILE)
+        temp_path = f"{path}.tmp"
+        with open(temp_path, 'w') as f:
+            json.dump(self.index, f)
+        os.replace(temp_path, path)
+
+    def close(self):
+        """Flush the pending chunk, stop the writer thread and wait for outstanding writes."""
+        self._submit_current()
+        self.write_queue.put(None)
+        self.writer_thread.join()
+        if self.dropped_steps:
+            logging.warning(f"Trajectory recorder dropped {self.dropped_steps} steps because the writer fell behind.")
+        logging.info(f"Trajectory recorder closed: {self.recorded_steps} steps written to {self.folder}")
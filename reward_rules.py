@@ -0,0 +1,314 @@
+# reward_rules.py
+
+import time
+import numpy as np
+
+# Reward components, in the order they are summed into the step reward
+COMPONENTS = ('defeat_bonus', 'self_hp_loss', 'boss_hp_loss', 'intermediate_defeat', 'time_penalty',
+              'self_death', 'idle_penalty')
+
+# One-off rewards for the boss HP dropping into a band: (flag, lower bound, upper bound, reward)
+INTERMEDIATE_REWARDS = (
+    ('75%', 50, 75, 15),
+    ('50%', 25, 50, 25),
+    ('25%', -np.inf, 25, 35),
+)
+
+SELF_HP_LOSS_RANGE = (-50, -10)
+BOSS_HP_LOSS_RANGE = (-12, -1)
+MISSING_BOSS_HP_STEPS = 50
+IDLE_WINDOW = 8
+
+
+class RewardRules:
+    """
+    Reward rules evaluated online, one step at a time, or offline over whole trajectories.
+
+    `step` is what the control loop calls. `relabel_episode` computes the same rewards with NumPy
+    passes over an episode's feature, action and timestamp arrays, carrying the same state across
+    episodes, so stored trajectories can be relabelled after changing `weights`.
+    """
+
+    def __init__(self, weights, manual=False, boss_lives=1, time_penalty_increment=-0.001):
+        self.weights = weights
+        self.manual = manual
+        self.time_penalty_increment = time_penalty_increment
+        self.boss_lives = boss_lives
+        self.missing_boss_hp_steps = 0
+        self.flags = {'self_hp_loss': False, 'boss_hp_loss': False}
+        self.intermediate_rewards_given = {flag: False for flag, _, _, _ in INTERMEDIATE_REWARDS}
+        self.last_time_penalty_update = -np.inf
+        # Trailing run of identical actions, equivalent to a deque of the last IDLE_WINDOW actions
+        self.run_action = None
+        self.run_length = 0
+
+    @staticmethod
+    def _in_range(value, bounds):
+        return bounds[0] < value < bounds[1]
+
+    def step(self, prev_features, features, action, step_index, now=None, update_idle=True):
+        """
+        Evaluate the rules for one transition.
+
+        Args:
+            prev_features (Mapping): Features before the action.
+            features (Mapping): Features after the action.
+            action (int): Action taken.
+            step_index (int): Step index within the episode.
+            now (float): Time of the observation; defaults to the current time.
+            update_idle (bool): Count the action towards the idle run. False for the repeated ticks of an
+                action-repeat decision, so IDLE_WINDOW counts agent decisions, not ticks.
+
+        Returns:
+            tuple: (reward, defeated, components) where defeated is 0, 1 (agent died) or
+            2 (boss defeated) and components maps each entry of COMPONENTS to its reward.
+        """
+        now = time.time() if now is None else now
+        components = dict.fromkeys(COMPONENTS, 0.0)
+        defeated = 0
+        boss_hp = features['boss_hp']
+
+        # 1. Boss defeat, or feature deltas while the boss is alive
+        if boss_hp <= 0:
+            if self.boss_lives <= 1:
+                components['defeat_bonus'] = self.weights['defeat_bonus']
+                defeated = 2
+            else:
+                self.missing_boss_hp_steps += 1
+                if self.missing_boss_hp_steps > MISSING_BOSS_HP_STEPS:
+                    components['defeat_bonus'] = self.weights['defeat_bonus']
+                    self.boss_lives -= 1
+                    self.missing_boss_hp_steps = 0
+        else:
+            self_delta = features['self_hp'] - prev_features['self_hp']
+            boss_delta = boss_hp - prev_features['boss_hp']
+
+            if self._in_range(self_delta, SELF_HP_LOSS_RANGE):
+                if not self.flags['self_hp_loss']:
+                    components['self_hp_loss'] = self.weights['self_hp_loss'] * abs(self_delta)
+                    self.flags['self_hp_loss'] = True
+            else:
+                self.flags['self_hp_loss'] = False
+
+            if self._in_range(boss_delta, BOSS_HP_LOSS_RANGE):
+                if not self.flags['boss_hp_loss']:
+                    components['boss_hp_loss'] = self.weights['boss_hp_loss'] * abs(boss_delta)
+                    self.flags['boss_hp_loss'] = True
+            else:
+                self.flags['boss_hp_loss'] = False
+
+            for flag, lower, upper, value in INTERMEDIATE_REWARDS:
+                if lower <= boss_hp < upper and not self.intermediate_rewards_given[flag]:
+                    components['intermediate_defeat'] = value
+                    self.intermediate_rewards_given[flag] = True
+                    break
+
+        # 2. Time penalty, at most once per second and growing with the episode length
+        if not self.manual and now >= self.last_time_penalty_update + 1:
+            components['time_penalty'] = self.weights['time_penalty'] + step_index * self.time_penalty_increment
+            self.last_time_penalty_update = now
+
+        # 3. Death
+        if features['self_hp'] <= 1:
+            components['self_death'] = self.weights['self_death']
+            defeated = 1
+
+        # 4. Idle penalty for repeating the same action IDLE_WINDOW times in a row
+        if update_idle:
+            if action == self.run_action:
+                self.run_length = min(self.run_length + 1, IDLE_WINDOW)
+            else:
+                self.run_action, self.run_length = action, 1
+            if not self.manual and self.run_length >= IDLE_WINDOW:
+                components['idle_penalty'] = self.weights['idle_penalty']
+
+        reward = 0.0
+        for key in COMPONENTS:
+            reward += components[key]
+        return reward, defeated, components
+
+    @staticmethod
+    def _first_triggers(in_range, carried_flag):
+        """Vectorized edge trigger: True where `in_range` starts, given the flag left by the previous step."""
+        previous = np.empty_like(in_range)
+        previous[:1] = carried_flag
+        previous[1:] = in_range[:-1]
+        return in_range & ~previous
+
+    def relabel_episode(self, self_hp, boss_hp, actions, timestamps, steps=None):
+        """
+        Evaluate the rules over a whole episode with vectorized NumPy passes.
+
+        Args:
+            self_hp (np.ndarray): Player HP of the N + 1 observations.
+            boss_hp (np.ndarray): Boss HP of the N + 1 observations.
+            actions (np.ndarray): The N actions.
+            timestamps (np.ndarray): Observation time after each action (N values, non-decreasing).
+            steps (np.ndarray): Step index of each action within the episode; defaults to 0..N-1.
+
+        Returns:
+            tuple: (rewards, defeated, components) with one value per action, components being a
+            dict of per-component reward arrays.
+        """
+        self_hp = np.asarray(self_hp, dtype=np.float64)
+        boss_hp = np.asarray(boss_hp, dtype=np.float64)
+        actions = np.asarray(actions)
+        timestamps = np.asarray(timestamps, dtype=np.float64)
+        n = len(actions)
+        steps = np.arange(n) if steps is None else np.asarray(steps)
+        components = {key: np.zeros(n) for key in COMPONENTS}
+        defeated = np.zeros(n, dtype=np.int8)
+        self_next, boss_next = self_hp[1:], boss_hp[1:]
+
+        # 1a. Boss defeat: phases fall after MISSING_BOSS_HP_STEPS + 1 zero-HP steps, the last one at once
+        zero_steps = np.flatnonzero(boss_next <= 0)
+        pos = 0
+        while pos < len(zero_steps):
+            if self.boss_lives <= 1:
+                components['defeat_bonus'][zero_steps[pos:]] = self.weights['defeat_bonus']
+                defeated[zero_steps[pos:]] = 2
+                break
+            needed = MISSING_BOSS_HP_STEPS + 1 - self.missing_boss_hp_steps
+            if pos + needed <= len(zero_steps):
+                components['defeat_bonus'][zero_steps[pos + needed - 1]] = self.weights['defeat_bonus']
+                self.boss_lives -= 1
+                self.missing_boss_hp_steps = 0
+                pos += needed
+            else:
+                self.missing_boss_hp_steps += len(zero_steps) - pos
+                pos = len(zero_steps)
+
+        # 1b. Feature deltas, only evaluated on steps where the boss is alive
+        alive = np.flatnonzero(boss_next > 0)
+        self_delta = (self_next - self_hp[:-1])[alive]
+        boss_delta = (boss_next - boss_hp[:-1])[alive]
+        for key, delta, bounds in (('self_hp_loss', self_delta, SELF_HP_LOSS_RANGE),
+                                   ('boss_hp_loss', boss_delta, BOSS_HP_LOSS_RANGE)):
+            in_range = (delta > bounds[0]) & (delta < bounds[1])
+            triggers = self._first_triggers(in_range, self.flags[key])
+            components[key][alive[triggers]] = self.weights[key] * np.abs(delta[triggers])
+            if len(in_range):
+                self.flags[key] = bool(in_range[-1])
+
+        alive_boss_hp = boss_next[alive]
+        for flag, lower, upper, value in INTERMEDIATE_REWARDS:
+            if self.intermediate_rewards_given[flag]:
+                continue
+            hits = np.flatnonzero((alive_boss_hp >= lower) & (alive_boss_hp < upper))
+            if len(hits):
+                components['intermediate_defeat'][alive[hits[0]]] = value
+                self.intermediate_rewards_given[flag] = True
+
+        # 2. Time penalty: jump from one application to the first observation at least a second later
+        if not self.manual:
+            i = np.searchsorted(timestamps, self.last_time_penalty_update + 1, side='left')
+            applied = []
+            while i < n:
+                applied.append(i)
+                self.last_time_penalty_update = timestamps[i]
+                i = np.searchsorted(timestamps, timestamps[i] + 1, side='left')
+            applied = np.asarray(applied, dtype=np.int64)
+            components['time_penalty'][applied] = (self.weights['time_penalty']
+                                                   + steps[applied] * self.time_penalty_increment)
+
+        # 3. Death
+        dead = self_next <= 1
+        components['self_death'][dead] = self.weights['self_death']
+        defeated[dead] = 1
+
+        # 4. Idle penalty from run lengths of identical actions, continuing the carried run
+        if n:
+            starts = np.ones(n, dtype=bool)
+            starts[1:] = actions[1:] != actions[:-1]
+            run_start = np.maximum.accumulate(np.where(starts, np.arange(n), 0))
+            run_length = np.arange(n) - run_start + 1
+            if actions[0] == self.run_action:
+                run_length[run_start == 0] += self.run_length
+            run_length = np.minimum(run_length, IDLE_WINDOW)
+            if not self.manual:
+                components['idle_penalty'][run_length >= IDLE_WINDOW] = self.weights['idle_penalty']
+            self.run_action, self.run_length = actions[-1].item(), int(run_length[-1])
+
+        rewards = np.zeros(n)
+        for key in COMPONENTS:
+            rewards += components[key]
+        return rewards, defeated, components
+
+
+def relabel_session(rules, reader):
+    """
+    Recompute the rewards of every episode in a recorded session.
+
+    The recorder drops steps when its queue is full, so each run of consecutive steps is relabelled on
+    its own and the transitions across a gap are skipped, as in `dqn.offline.load_trajectories`. The
+    rule state (flags, idle run, time penalty clock) carries over the gap.
+
+    Args:
+        rules (RewardRules): Rules to evaluate, in the state the session started from.
+        reader (TrajectoryReader): Session to relabel.
+
+    Returns:
+        dict: Episode index -> (steps, rewards, defeated, components) for the episode's transitions,
+        `steps` holding the step index of each relabelled transition.
+
+    Raises:
+        ValueError: If the session was recorded with action repeat; its steps hold the rewards of
+            ticks that were never recorded, so they cannot be recomputed.
+    """
+    action_repeat = reader.metadata.get('action_repeat', 1)
+    if action_repeat > 1:
+        raise ValueError(f"Session {reader.folder} was recorded with action_repeat={action_repeat}; "
+                         f"its rewards cannot be relabelled")
+    fields = ['step', 'feat_self_hp', 'feat_boss_hp', 'action', 't_capture']
+    results = {}
+    for episode, columns in reader.iter_episodes(fields):
+        steps = np.asarray(columns['step'])
+        breaks = np.flatnonzero(np.diff(steps) != 1) + 1
+        parts = []
+        for lo, hi in zip(np.r_[0, breaks], np.r_[breaks, len(steps)]):
+            if hi - lo < 2:
+                continue
+            parts.append((steps[lo:hi - 1],) + rules.relabel_episode(
+                columns['feat_self_hp'][lo:hi], columns['feat_boss_hp'][lo:hi], columns['action'][lo:hi - 1],
+                columns['t_capture'][lo + 1:hi], steps[lo:hi - 1]))
+        if not parts:
+            parts.append((steps[:0],) + rules.relabel_episode([], [], np.zeros(0, dtype=np.int64), []))
+        results[episode] = (np.concatenate([p[0] for p in parts]),
+                            np.concatenate([p[1] for p in parts]),
+                            np.concatenate([p[2] for p in parts]),
+                            {key: np.concatenate([p[3][key] for p in parts]) for key in COMPONENTS})
+    return results
+
+
+def synthetic_episode(rng, length):
+    """Random-walk HP bars, bursty action runs and jittered timestamps for parity checks and benchmarks."""
+    self_hp = 50 - np.cumsum(rng.choice([0] * 40 + [1, 15, 30], size=length + 1))
+    self_hp = np.clip(np.where(self_hp < 2, rng.choice([0, 2, 3, 4, 5, 6], size=length + 1), self_hp), 0, 50)
+    boss_hp = np.clip(100 - np.cumsum(rng.choice([0] * 6 + [2, 5, 11], size=length + 1)), 0, 100)
+    boss_hp = np.where(rng.random(length + 1) < 0.002, 100, boss_hp).astype(np.float64)
+    self_hp = self_hp.astype(np.float64)
+    actions = np.repeat(rng.integers(0, 3, size=length), rng.integers(1, 12, size=length))[:length]
+    timestamps = np.cumsum(rng.uniform(0.05, 0.4, size=length))
+    return self_hp, boss_hp, actions, timestamps
+
+
+if __name__ == '__main__':
+    # Relabelling throughput; tests/test_reward_rules.py checks it against `step`
+    default_weights = {
+        'self_hp_loss': -0.5,
+        'boss_hp_loss': 10.0,
+        'self_death': -12,
+        'defeat_bonus': 35,
+        'time_penalty': -0.001,
+        'intermediate_defeat': 0,
+        'idle_penalty': -3
+    }
+    rng = np.random.default_rng(1)
+    episodes = [synthetic_episode(rng, 2000) for _ in range(500)]
+    rules = RewardRules(default_weights, boss_lives=10 ** 9)
+    start = time.perf_counter()
+    for episode in episodes:
+        rules.relabel_episode(*episode)
+    elapsed = time.perf_counter() - start
+    print(f"Relabelled {2000 * len(episodes)} steps in {elapsed:.2f}s "
+          f"({2000 * len(episodes) / elapsed / 1e6:.2f}M steps/s)")
@@ -0,0 +1,83 @@
+# test_checkpoints.py
+
+import os
+import torch
+from dqn.checkpoints import CheckpointStore, WEIGHTS_SUFFIX, TRAINING_STATE_SUFFIX, BEST_NAME
+
+
+def weights(value):
+    return {'layer.weight': torch.full((2, 2), float(value)), 'layer.bias': torch.zeros(2)}
+
+
+def save_step(store, step, best=False):
+    name = BEST_NAME if best else f"step_{step:08d}"
+    store.save(name, weights(step), {'optimizer_state_dict': {'step': step}}, {'global_step': step}, best=best)
+    return name
+
+
+def test_manifest_round_trip_and_retention(tmp_path):
+    store = CheckpointStore(str(tmp_path), max_checkpoints=2)
+    names = [save_step(store, step) for step in (1, 2, 3)]
+    save_step(store, 2, best=True)
+
+    reopened = CheckpointStore(str(tmp_path), max_checkpoints=2)
+    assert reopened.latest()['name'] == names[-1] and reopened.latest()['global_step'] == 3
+    assert reopened.best()['name'] == BEST_NAME and reopened.best()['global_step'] == 2
+    assert reopened.manifest['checkpoints'] == names[1:]
+    # The evicted checkpoint's files are gone, the retained and best ones are not
+    assert not os.path.exists(store.path(names[0], WEIGHTS_SUFFIX))
+    assert not os.path.exists(store.path(names[0], TRAINING_STATE_SUFFIX))
+    for name in names[1:] + [BEST_NAME]:
+        assert os.path.exists(store.path(name, WEIGHTS_SUFFIX))
+    assert torch.equal(reopened.load_weights(reopened.best())['layer.weight'], weights(2)['layer.weight'])
+    assert reopened.load_training_state(reopened.latest())['optimizer_state_dict'] == {'step': 3}
+
+
+def test_weights_load_without_training_state(tmp_path):
+    store = CheckpointStore(str(tmp_path))
+    name = save_step(store, 4)
+    os.remove(store.path(name, TRAINING_STATE_SUFFIX))
+    loaded = CheckpointStore(str(tmp_path)).load_weights(store.latest(), map_location='cpu')
+    assert torch.equal(loaded['layer.weight'], weights(4)['layer.weight'])
+
+
+def test_agent_falls_back_to_legacy_checkpoint(tmp_path, monkeypatch):
+    from dqn.dueling_dqn import DQNAgent
+    monkeypatch.chdir(tmp_path)
+    source = DQNAgent(3, 3, None, str(tmp_path / 'source'), replay_size=8, restore_replay=False,
+                      start_training=False)
+    legacy_folder = tmp_path / 'legacy'
+    legacy_folder.mkdir()
+    torch.save({'model_state_dict': source.eval_net.state_dict(),
+                'optimizer_state_dict': source.optimizer.state_dict(),
+                'global_step': 5, 'global_episode': 2, 'epsilon': 0.3}, legacy_folder / 'checkpoint_step_5.pth')
+    source.close_metrics()
+
+    agent = DQNAgent(3, 3, None, str(legacy_folder), replay_size=8, restore_replay=False, start_training=False)
+    try:
+        assert agent.checkpoints.latest() is None
+        assert (agent.global_step, agent.global_episode, agent.epsilon) == (5, 2, 0.3)
+        for name, tensor in source.eval_net.state_dict().items():
+            assert torch.equal(agent.eval_net.state_dict()[name], tensor), name
+    finally:
+        agent.close_metrics()
+
+
+def test_prune_legacy_files_deletes_only_superseded_files(tmp_path):
+    for filename in ('checkpoint_step_5.pth', 'checkpoint_step_50.pth', 'replay_buffer_size_10.pkl.gz',
+                     'replay_buffer_size_20.pkl.gz', 'notes.txt'):
+        (tmp_path / filename).write_bytes(b'x' * 16)
+    store = CheckpointStore(str(tmp_path))
+    # Without a manifest the legacy files are still the only checkpoints
+    assert store.prune_legacy_files() == 0
+
+    save_step(store, 10)
+    # No replay buffer is recorded yet, so the legacy ones are still the ones loaded
+    store.prune_legacy_files()
+    assert sorted(p.name for p in tmp_path.glob('checkpoint_step_*')) == ['checkpoint_step_50.pth']
+    assert (tmp_path / 'replay_buffer_size_10.pkl.gz').exists()
+
+    store.add_replay_buffer('replay_buffer_size_20.pkl.gz', 20)
+    assert store.prune_legacy_files() == 16
+    assert sorted(p.name for p in tmp_path.iterdir() if not p.name.startswith('step_')) == [
+        'checkpoint_step_50.pth', 'manifest.json', 'notes.txt', 'replay_buffer_size_20.pkl.gz']
@@ -0,0 +1,52 @@
+# test_onnx_actor.py
+
+import numpy as np
+import pytest
+import torch
+
+pytest.importorskip('onnx')
+pytest.importorskip('onnxruntime')
+
+from dqn.dueling_dqn import DuelingDQN  # noqa: E402
+from dqn.onnx_actor import OnnxActor  # noqa: E402
+from dqn.onnx_export import export_onnx, compare_backends  # noqa: E402
+from dqn.quantize import recorded_states  # noqa: E402
+from recording.trajectory_recorder import TrajectoryRecorder  # noqa: E402
+
+FRAMES = 24
+
+
+def record_session(folder, seed=0):
+    """Record one episode of random game window crops through TrajectoryRecorder."""
+    rng = np.random.default_rng(seed)
+    recorder = TrajectoryRecorder(folder, chunk_size=8)
+    screens = {'self_hp': np.zeros((4, 40, 3), np.uint8), 'boss_hp': np.zeros((4, 40, 3), np.uint8)}
+    features = {'self_hp': 50.0, 'boss_hp': 100.0}
+    for step in range(FRAMES - 1):
+        frame = rng.integers(0, 256, (96, 160, 3), dtype=np.uint8)
+        recorder.record_step(0, step, frame, screens, features, step % 3, 0.0, 0, float(step), float(step))
+    recorder.end_episode(0, FRAMES - 1, rng.integers(0, 256, (96, 160, 3), dtype=np.uint8), screens, features,
+                         float(FRAMES))
+    recorder.close()
+
+
+def test_onnx_actor_matches_torch_argmax(tmp_path):
+    torch.manual_seed(0)
+    net = DuelingDQN(3, 3).eval()
+    record_session(str(tmp_path / 'session'))
+    states = recorded_states([str(tmp_path / 'session')], FRAMES)
+    assert len(states) == FRAMES
+
+    path = str(tmp_path / 'actor.onnx')
+    export_onnx(net, path, global_step=7)
+    actor = OnnxActor(path)
+    assert actor.global_step == 7
+
+    with torch.no_grad():
+        torch_q = net(states)
+    onnx_q = actor(states)
+    np.testing.assert_array_equal(onnx_q.argmax(1).numpy(), torch_q.argmax(1).numpy())
+    np.testing.assert_allclose(onnx_q.numpy(), torch_q.numpy(), rtol=1e-3, atol=1e-4)
+    assert compare_backends(net, actor, states, repeats=1)['agreement'] == 1.0
+    # Batch-1 acting takes the same greedy action
+    assert actor.act(states[0].numpy()) == int(torch_q[0].argmax())
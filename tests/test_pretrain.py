@@ -0,0 +1,36 @@
+# test_pretrain.py
+
+import numpy as np
+from dqn.pretrain import Demonstrations
+from recording.trajectory_reader import TrajectoryReader
+from recording.trajectory_recorder import TrajectoryRecorder
+
+SCREENS = {'self_hp': np.zeros((4, 40, 3), np.uint8), 'boss_hp': np.zeros((4, 40, 3), np.uint8)}
+FEATURES = {'self_hp': 50.0, 'boss_hp': 100.0}
+
+
+def record_episode(recorder, episode, actions, done, final_frame=True):
+    """Record one episode whose last step ends it with `done`; steps get reward 10 * step."""
+    frame = np.zeros((96, 160, 3), np.uint8)
+    for step, action in enumerate(actions):
+        last = step == len(actions) - 1
+        recorder.record_step(episode, step, frame, SCREENS, FEATURES, action, 10.0 * step, done if last else 0,
+                             float(step), float(step))
+    if final_frame:
+        recorder.end_episode(episode, len(actions), frame, SCREENS, FEATURES, float(len(actions)))
+
+
+def test_terminal_steps_are_kept_with_or_without_the_final_frame(tmp_path):
+    recorder = TrajectoryRecorder(str(tmp_path), chunk_size=2)
+    record_episode(recorder, 0, [0, -1, 1, 2], done=1)
+    # The final frame of this episode was dropped; its last step defeated the boss
+    record_episode(recorder, 1, [2, 0], done=2, final_frame=False)
+    recorder.close()
+
+    demos = Demonstrations.from_sessions([TrajectoryReader(str(tmp_path))], action_space=3)
+    # Episode 0: frames 0-4 (4 is the final observation), episode 1: frames 5-6
+    assert demos.state_idxs.tolist() == [0, 2, 3, 5, 6]
+    assert demos.next_state_idxs.tolist() == [1, 3, 3, 6, 6]
+    assert demos.actions.tolist() == [0, 1, 2, 2, 0]
+    assert demos.rewards.tolist() == [0.0, 20.0, 30.0, 0.0, 10.0]
+    assert demos.dones.tolist() == [0.0, 0.0, 1.0, 0.0, 1.0]
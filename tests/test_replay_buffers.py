@@ -0,0 +1,175 @@
+# test_replay_buffers.py
+
+import numpy as np
+import pytest
+import torch
+from dqn.dueling_dqn import (PrioritizedReplayBuffer, DevicePrioritizedReplayBuffer, CompressedPrioritizedReplayBuffer,
+                             ALPHA)
+from dqn.frame_store import FrameStore, decode_states
+
+SHAPE = (3, 8, 8)
+
+BUFFERS = {
+    'device': lambda capacity: DevicePrioritizedReplayBuffer(capacity, storage_device='cpu'),
+    'compressed': lambda capacity: CompressedPrioritizedReplayBuffer(capacity, codec='zlib', keyframe_interval=3),
+}
+
+
+def frame(value, shape=SHAPE):
+    """Normalized state whose pixels all equal `value`, so it survives uint8 frame storage exactly."""
+    return decode_states(np.full((1,) + shape, value, dtype=np.uint8), 'cpu')[0]
+
+
+def filled_buffer(buffer, count, start=0):
+    """
+    Add `count` transitions chained as in the control loop: transition i goes from frame(i) to
+    frame(i + 1) with reward i, and its state is the previous transition's next state object.
+    """
+    state = frame(start)
+    for i in range(start, start + count):
+        next_state = frame(i + 1)
+        buffer.add(buffer.max_priority, (state, i % 3, float(i), next_state, 0))
+        state = next_state
+    return buffer
+
+
+def rewards_of(buffer):
+    return [sample[2] for _, sample in buffer.transitions()]
+
+
+def test_frame_store_round_trip_across_wrap_around():
+    rng = np.random.default_rng(0)
+    store = FrameStore(10, (3, 4, 4), codec='zlib', keyframe_interval=4)
+    pixels = [rng.integers(0, 256, (3, 4, 4), dtype=np.uint8) for _ in range(25)]
+    ids = [store.add(p) for p in pixels]
+    assert ids == list(range(25))
+
+    # Ids 15-24 occupy the ring; 16 and 20 are keyframes, the others deltas against them
+    readable = list(range(16, 25))
+    np.testing.assert_array_equal(store.get(readable), np.stack([pixels[i] for i in readable]))
+    # Frame 15 is still in its slot, but its keyframe 12 was overwritten by frame 22
+    with pytest.raises(KeyError):
+        store.get([15])
+    with pytest.raises(KeyError):
+        store.get([3])
+
+
+@pytest.mark.parametrize('kind', BUFFERS)
+def test_transitions_round_trip_across_wrap_around(kind):
+    buffer = filled_buffer(BUFFERS[kind](4), 11)
+    assert len(buffer) == 4 and buffer.write == 3
+    for i, (_, (state, action, reward, next_state, done)) in zip(range(7, 11), buffer.transitions()):
+        assert (action, reward, done) == (i % 3, float(i), 0.0)
+        torch.testing.assert_close(state, frame(i))
+        torch.testing.assert_close(next_state, frame(i + 1))
+
+
+def test_compressed_buffer_without_shared_frames_keeps_keyframes_of_live_transitions():
+    # Unchained states take two frames per transition, the most the frame ring is sized for
+    buffer = CompressedPrioritizedReplayBuffer(4, codec='zlib', keyframe_interval=3)
+    for i in range(13):
+        buffer.add(1.0, (frame(2 * i), 0, float(i), frame(2 * i + 1), 0))
+    for i, (_, sample) in zip(range(9, 13), buffer.transitions()):
+        torch.testing.assert_close(sample[0], frame(2 * i))
+        torch.testing.assert_close(sample[3], frame(2 * i + 1))
+
+
+def test_compressed_buffer_reuses_the_previous_next_state_frame():
+    buffer = filled_buffer(BUFFERS['compressed'](8), 5)
+    # One frame for the first state, then one per transition
+    assert buffer.frames.next_id == 6
+    np.testing.assert_array_equal(buffer.state_ids[1:5], buffer.next_state_ids[:4])
+
+    # An equal state that is a different tensor is stored again
+    buffer.add(1.0, (frame(5), 0, 5.0, frame(6), 0))
+    assert buffer.frames.next_id == 8
+    assert buffer.state_ids[5] != buffer.next_state_ids[4]
+
+
+@pytest.mark.parametrize('kind', BUFFERS)
+def test_sample_tensors_shapes_and_is_weights(kind):
+    torch.manual_seed(0)
+    buffer = filled_buffer(BUFFERS[kind](16), 12)
+    buffer.priorities[:12] = torch.arange(1, 13, dtype=torch.float64)
+    beta = 0.4
+
+    state, action, reward, next_state, done, is_weights, idxs, sequences = buffer.sample_tensors(6, beta)
+    assert state.shape == next_state.shape == (6,) + SHAPE and state.dtype == torch.float32
+    assert action.shape == (6, 1) and reward.shape == done.shape == is_weights.shape == idxs.shape == (6,)
+    assert (idxs < 12).all()
+    assert torch.equal(sequences, buffer.slot_sequence[idxs])
+    # Rows stay aligned: transition i goes from frame(i) to frame(i + 1)
+    for row, r in enumerate(reward.tolist()):
+        torch.testing.assert_close(state[row], frame(int(r)))
+        torch.testing.assert_close(next_state[row], frame(int(r) + 1))
+        assert action[row, 0] == int(r) % 3
+
+    expected = (12 * buffer.priorities[idxs] / buffer.priorities[:12].sum()) ** -beta
+    torch.testing.assert_close(is_weights, (expected / expected.max()).float())
+    assert is_weights.max() == 1.0
+    torch.testing.assert_close(buffer.importance_weights(idxs, beta), is_weights)
+
+
+@pytest.mark.parametrize('kind', BUFFERS)
+def test_update_skips_slots_rewritten_since_sampling(kind):
+    buffer = filled_buffer(BUFFERS[kind](4), 4)
+    idxs = torch.tensor([0, 1, 2, 3])
+    sequences = buffer.slot_sequence[idxs].clone()
+    sequences[3] = 0
+    # Two newer transitions overwrite slots 0 and 1 after the batch was sampled
+    filled_buffer(buffer, 2, start=4)
+    before = buffer.priorities.clone()
+
+    errors = torch.tensor([1.0, 2.0, 3.0, 4.0])
+    buffer.update(idxs, errors, sequences)
+    # Slot 3 was a torn row (sequence 0) and keeps its priority as well
+    assert torch.equal(buffer.priorities[[0, 1, 3]], before[[0, 1, 3]])
+    assert buffer.priorities[2].item() == pytest.approx((3.0 + 1e-5) ** ALPHA)
+
+    buffer.update(idxs, errors)
+    torch.testing.assert_close(buffer.priorities, (errors.double() + 1e-5) ** ALPHA)
+
+
+@pytest.mark.parametrize('kind', BUFFERS)
+def test_merge_restored_puts_live_transitions_after_restored_ones(kind):
+    restored = filled_buffer(BUFFERS[kind](6), 5)
+    restored.priorities[:5] = torch.arange(1, 6, dtype=torch.float64)
+    live = filled_buffer(BUFFERS[kind](6), 3, start=10)
+    live.priorities[:3] = torch.tensor([10.0, 11.0, 12.0], dtype=torch.float64)
+
+    merged = live.merge_restored(restored)
+    assert merged is restored and len(merged) == 6
+    assert rewards_of(merged) == [2.0, 3.0, 4.0, 10.0, 11.0, 12.0]
+    assert [p for p, _ in merged.transitions()] == [3.0, 4.0, 5.0, 10.0, 11.0, 12.0]
+    for _, (state, _, reward, next_state, _) in merged.transitions():
+        torch.testing.assert_close(state, frame(int(reward)))
+        torch.testing.assert_close(next_state, frame(int(reward) + 1))
+
+
+def test_merge_restored_converts_a_legacy_buffer():
+    legacy = PrioritizedReplayBuffer(4)
+    for i in range(3):
+        legacy.add(float(i), (frame(i), 0, float(i), frame(i + 1), 0))
+    live = filled_buffer(BUFFERS['device'](5), 2, start=10)
+
+    merged = live.merge_restored(legacy)
+    assert isinstance(merged, DevicePrioritizedReplayBuffer) and merged.capacity == 5
+    assert rewards_of(merged) == [0.0, 1.0, 2.0, 10.0, 11.0]
+
+
+def test_importance_weights_keep_sampled_weights_of_zeroed_slots():
+    buffer = filled_buffer(BUFFERS['device'](8), 8)
+    buffer.priorities[:4] = torch.tensor([1.0, 2.0, 3.0, 4.0], dtype=torch.float64)
+    idxs = torch.tensor([0, 1, 2, 3])
+    sampled = torch.tensor([0.1, 0.2, 0.3, 0.4])
+    # An actor started rewriting slot 2 after the batch was sampled
+    buffer.priorities[2] = 0.0
+
+    weights = buffer.importance_weights(idxs, 0.4, sampled)
+    assert torch.isfinite(weights).all()
+    assert weights[2] == sampled[2]
+    # The other slots are normalized among themselves: the lowest priority gets weight 1
+    assert weights[0] == 1.0 and (weights[[1, 3]] < 1.0).all()
+
+    without_fallback = buffer.importance_weights(idxs, 0.4)
+    assert torch.isfinite(without_fallback).all() and without_fallback[2] == 0.0
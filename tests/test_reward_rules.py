@@ -0,0 +1,103 @@
+# test_reward_rules.py
+
+import numpy as np
+import pytest
+from reward_rules import RewardRules, relabel_session, synthetic_episode, IDLE_WINDOW
+
+WEIGHTS = {
+    'self_hp_loss': -0.5,
+    'boss_hp_loss': 10.0,
+    'self_death': -12,
+    'defeat_bonus': 35,
+    'time_penalty': -0.001,
+    'intermediate_defeat': 0,
+    'idle_penalty': -3
+}
+
+
+class FakeReader:
+    """Stands in for TrajectoryReader with in-memory episode columns."""
+
+    def __init__(self, episodes, metadata=None):
+        self.folder = 'fake'
+        self.episodes = episodes
+        self.metadata = metadata or {}
+
+    def iter_episodes(self, fields=None):
+        for episode, columns in self.episodes.items():
+            yield episode, {field: np.asarray(columns[field]) for field in fields}
+
+
+def online_rewards(rules, self_hp, boss_hp, actions, timestamps, steps):
+    """Rewards and terminal flags of `RewardRules.step`, cut at the first terminal step as in the control loop."""
+    rewards, terminals = [], []
+    for i, action in enumerate(actions):
+        reward, defeated, _ = rules.step({'self_hp': self_hp[i], 'boss_hp': boss_hp[i]},
+                                         {'self_hp': self_hp[i + 1], 'boss_hp': boss_hp[i + 1]},
+                                         int(action), steps[i], timestamps[i])
+        rewards.append(reward)
+        terminals.append(defeated)
+        if defeated:
+            break
+    return rewards, terminals
+
+
+@pytest.mark.parametrize('boss_lives', [1, 3])
+def test_relabel_episode_matches_step(boss_lives):
+    rng = np.random.default_rng(0)
+    online = RewardRules(WEIGHTS, boss_lives=boss_lives)
+    offline = RewardRules(WEIGHTS, boss_lives=boss_lives)
+    for _ in range(200):
+        self_hp, boss_hp, actions, timestamps = synthetic_episode(rng, int(rng.integers(1, 400)))
+        rewards, terminals = online_rewards(online, self_hp, boss_hp, actions, timestamps, range(len(actions)))
+        n = len(rewards)
+        offline_rewards, offline_terminals, _ = offline.relabel_episode(self_hp[:n + 1], boss_hp[:n + 1],
+                                                                        actions[:n], timestamps[:n])
+        np.testing.assert_array_equal(offline_rewards, rewards)
+        np.testing.assert_array_equal(offline_terminals, terminals)
+
+
+def test_idle_run_counts_decisions_only():
+    rules = RewardRules(WEIGHTS)
+    features = {'self_hp': 50, 'boss_hp': 100}
+    penalties = []
+    for decision in range(IDLE_WINDOW):
+        # Repeated ticks of a decision do not advance the idle run
+        for tick in range(3):
+            _, _, components = rules.step(features, features, 0, decision, now=0.0, update_idle=tick == 0)
+            penalties.append(components['idle_penalty'])
+    # The penalty falls on the first tick of the IDLE_WINDOW-th identical decision
+    assert penalties[-3] == WEIGHTS['idle_penalty']
+    assert not any(penalties[:-3]) and not any(penalties[-2:])
+
+
+def test_relabel_session_skips_transitions_across_gaps():
+    rng = np.random.default_rng(1)
+    self_hp, boss_hp, actions, timestamps = synthetic_episode(rng, 30)
+    self_hp, boss_hp = np.maximum(self_hp, 20), np.maximum(boss_hp, 1)
+    # Row i holds the observation of step i, the action taken from it and the capture time of the
+    # observation; steps 10 to 12 were dropped by the recorder
+    kept = np.r_[0:10, 13:31]
+    columns = {
+        'step': kept,
+        'feat_self_hp': self_hp[kept],
+        'feat_boss_hp': boss_hp[kept],
+        'action': np.r_[actions, 0][kept],
+        't_capture': np.r_[0.0, timestamps][kept],
+    }
+    steps, rewards, defeated, components = relabel_session(RewardRules(WEIGHTS), FakeReader({0: columns}))[0]
+
+    np.testing.assert_array_equal(steps, np.r_[0:9, 13:30])
+    online = RewardRules(WEIGHTS)
+    expected = []
+    for lo, hi in ((0, 9), (13, 30)):
+        expected += online_rewards(online, self_hp[lo:hi + 1], boss_hp[lo:hi + 1], actions[lo:hi],
+                                   timestamps[lo:hi], range(lo, hi))[0]
+    np.testing.assert_array_equal(rewards, expected)
+    assert len(defeated) == len(steps) and all(len(c) == len(steps) for c in components.values())
+
+
+def test_relabel_session_refuses_action_repeat():
+    reader = FakeReader({}, metadata={'action_repeat': 4})
+    with pytest.raises(ValueError):
+        relabel_session(RewardRules(WEIGHTS), reader)